@@ -869,7 +869,7 @@ const execLines = (
         let content: IRunningCommandContent | null = getRunningCommandContent(view, lineRange);
         if (content != null && inViewID != null) {
             console.log("CodeEditor execLines: ", content, lineRange);
-            sendMessage(socket, WebAppEndpoint.CodeEditor, createMessage(content), (response) => {
+            sendMessage(socket, WebAppEndpoint.CodeEditor, createMessage(content, inViewID), (response) => {
                 if (response.success === false) {
                     if (content) {
                         setLineStatus(
@@ -887,8 +887,25 @@ const execLines = (
 };
 /** */
 
+/**
+ * Get the group id of the line range if all its lines are in the same group
+ * @returns the group id, undefined if the lines are not a single group
+ */
+const getGroupIDOfLineRange = (codeLines: ICodeLine[] | undefined, lineRange: ILineRange) => {
+    let groupID = codeLines?.[lineRange.fromLine]?.groupID;
+    for (let ln = lineRange.fromLine; groupID != null && ln < lineRange.toLine; ln++) {
+        if (codeLines?.[ln]?.groupID !== groupID) {
+            groupID = undefined;
+        }
+    }
+    return groupID;
+};
+
 /** message */
-const createMessage = (content: IRunningCommandContent) => {
+const createMessage = (content: IRunningCommandContent, inViewID: string) => {
+    const codeLines = store.getState().codeEditor.codeLines[inViewID];
+    // the server tracks the executions of a file by group id, the line range of a group changes when lines
+    // are inserted above it
     let message: IMessage = {
         webapp_endpoint: WebAppEndpoint.CodeEditor,
         command_name: CommandName.exec_line,
@@ -896,7 +913,11 @@ const createMessage = (content: IRunningCommandContent) => {
         content: content.content,
         type: ContentType.STRING,
         error: false,
-        metadata: { line_range: content.lineRange },
+        metadata: {
+            line_range: content.lineRange,
+            path: inViewID,
+            group_id: getGroupIDOfLineRange(codeLines, content.lineRange),
+        },
     };
 
     return message;
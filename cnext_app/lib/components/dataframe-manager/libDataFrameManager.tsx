@@ -1,5 +1,6 @@
 import { Socket } from "socket.io-client";
 import {
+    removeDFStatus,
     setActiveDF,
     setDFUpdates,
     setMetadata,
@@ -92,6 +93,20 @@ export const handleActiveDFStatus = (
     console.log("DataFrameManager got active df status message: ", message.content);
     const allDFStatus = message.content as IAllDataFrameStatus;
 
+    // update_df_status only has the statuses which changed and the names of the removed dataframes,
+    // reload_df_status has all the dataframes
+    let removed: string[] = [];
+    if (reload) {
+        const dfUpdates = store.getState().dataFrames.dfUpdates;
+        removed = Object.keys(dfUpdates).filter((df_id) => !(allDFStatus && df_id in allDFStatus));
+    } else {
+        const metadata = message.metadata as { removed?: string[] } | null | undefined;
+        removed = metadata?.removed ?? [];
+    }
+    if (removed.length > 0) {
+        store.dispatch(removeDFStatus(removed));
+    }
+
     // console.log(dfStatusContent);
     // the UI is currently designed to handle only 1 reviewable update at a time
     // but will still scan through everything here for now
@@ -220,6 +220,23 @@ export const dataFrameSlice = createSlice({
                 // state.dfUpdateCount++;
             }
         },
+        /** delete the state of the dataframes which are no longer in the namespace */
+        removeDFStatus: (state, action) => {
+            const removed = action.payload as string[];
+            for (const df_id of removed) {
+                delete state.dfUpdates[df_id];
+                delete state.dfUpdatesReview[df_id];
+                delete state.tableData[df_id];
+                delete state.metadata[df_id];
+                delete state.dfFilter[df_id];
+                delete state.columnSelector[df_id];
+                delete state.udfsSelector[df_id];
+                delete state.tableMetadataUpdateSignal[df_id];
+                if (state.activeDataFrame === df_id) {
+                    state.activeDataFrame = null;
+                }
+            }
+        },
         /** set the showed state of the active dataframe status */
         setDFStatusShowed: (state, action) => {
             let is_showed = action.payload;
@@ -421,6 +438,7 @@ export const {
     setTableData,
     setMetadata,
     setDFUpdates,
+    removeDFStatus,
     setReview,
     setActiveDF,
     setDFFilter,
@@ -0,0 +1,91 @@
+"""
+Compression ratio and CPU cost of the payloads sent to node server, used to tune the
+`p2n_comm.compression` settings in server.yaml. The payloads are synthetic but have the shape of
+the table pages (`_create_table_data`), plotly figures (`_process_rich_ouput`) and experiment metric
+plots (`_get_metric_plots`). Run from `cnext_server/server/python`:
+
+    python -m benchmarks.compression_benchmark
+"""
+import argparse
+import random
+import time
+import zlib
+
+from libs.message import _message_encoder
+from libs.compression import PayloadCompressor, CompressionCodec, zstandard
+
+
+def _table_page(rows=1000, cols=20):
+    rand = random.Random(0)
+    return {'df_id': 'df', 'column_names': ['col_%d' % c for c in range(cols)],
+            'rows': [[str(round(rand.gauss(100, 20), 3)) if c % 2 else 'category_%d' % rand.randint(0, 50)
+                      for c in range(cols)] for _ in range(rows)],
+            'index': {'name': None, 'data': list(range(rows))}, 'size': 50000}
+
+
+def _plotly_figure(points=200000):
+    rand = random.Random(1)
+    return {'application/vnd.plotly.v1+json': {
+        'data': [{'type': 'scattergl', 'mode': 'markers', 'name': 'trace',
+                  'x': [rand.random() for _ in range(points)],
+                  'y': [rand.gauss(0, 1) for _ in range(points)]}],
+        'layout': {'title': {'text': 'scatter'}, 'template': {'layout': {'font': {'color': '#2a3f5f'}}}}}}
+
+
+def _metric_plots(runs=10, steps=5000):
+    rand = random.Random(2)
+    return {'data': [{'type': 'scatter', 'mode': 'lines', 'name': 'run_%d' % run,
+                      'x': list(range(steps)),
+                      'y': [1 / (step + 1) + rand.random() * 0.01 for step in range(steps)]}
+                     for run in range(runs)],
+            'layout': {'xaxis': {'title': 'step'}, 'yaxis': {'title': 'loss'}}}
+
+
+PAYLOADS = {'table_page': _table_page,
+            'plotly_figure': _plotly_figure,
+            'metric_plots': _metric_plots}
+
+
+def _decompress(codec, data):
+    if codec == CompressionCodec.ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _time(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 3, 6])
+    args = parser.parse_args()
+
+    codecs = [CompressionCodec.ZLIB]
+    if zstandard is not None:
+        codecs.append(CompressionCodec.ZSTD)
+
+    print('%-14s %-5s %5s %10s %10s %7s %11s %11s %13s' % ('payload', 'codec', 'level', 'json(KB)', 'comp(KB)',
+                                                             'ratio', 'encode(ms)', 'comp(ms)', 'decomp(ms)'))
+    for name, create_payload in PAYLOADS.items():
+        payload = create_payload()
+        encode_time, data = _time(lambda: _message_encoder.encode(
+            payload).encode('utf-8'), args.repeat)
+        for codec in codecs:
+            for level in args.levels:
+                compressor = PayloadCompressor(codec, 0, level)
+                compress_time, compressed = _time(
+                    lambda: compressor.compress(data), args.repeat)
+                decompress_time, _ = _time(
+                    lambda: _decompress(codec, compressed), args.repeat)
+                print('%-14s %-5s %5d %10.0f %10.0f %6.1fx %11.2f %11.2f %13.2f' %
+                      (name, codec, level, len(data) / 1024, len(compressed) / 1024, len(data) / len(compressed),
+                       encode_time * 1000, compress_time * 1000, decompress_time * 1000))
+
+
+if __name__ == '__main__':
+    main()
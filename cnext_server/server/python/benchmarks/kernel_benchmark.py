@@ -0,0 +1,93 @@
+"""
+Round-trip latency of the ipython kernel: the time from `execute` of a trivial cell to the `idle`
+status of the kernel, and the time to stop the channel threads which is paid on every kernel restart.
+The throughput of `--pipeline` requests sent back to back without waiting for each other is reported
+in the last column.
+
+`LegacyPollingKernel` is the kernel with one thread per channel polling with a 1 second timeout which
+the channel pump replaced. Run from `cnext_server/server/python`:
+
+    python -m benchmarks.kernel_benchmark
+"""
+import argparse
+import queue
+import threading
+import time
+
+from user_space.ipython.constants import IPythonConstants
+from user_space.ipython.kernel import IPythonKernel
+
+MESSSAGE_TIMEOUT = 1  # unit: second
+
+
+class LegacyPollingKernel(IPythonKernel):
+    def start_msg_thead(self):
+        self.stop_msg_thread_signal = False
+        self.msg_threads = [threading.Thread(target=self.handle_ipython_stream, args=(stream_type,), daemon=True)
+                            for stream_type in [IPythonConstants.StreamType.SHELL, IPythonConstants.StreamType.IOBUF,
+                                                IPythonConstants.StreamType.STDIN]]
+        for msg_thread in self.msg_threads:
+            msg_thread.start()
+
+    def stop_msg_thread(self):
+        self.stop_msg_thread_signal = True
+        while self.is_msg_thead_alive():
+            time.sleep(1)
+        self.stop_msg_thread_signal = False
+
+    def handle_ipython_stream(self, stream_type):
+        get_msg = {IPythonConstants.StreamType.SHELL: self.kc.get_shell_msg,
+                   IPythonConstants.StreamType.IOBUF: self.kc.get_iopub_msg,
+                   IPythonConstants.StreamType.STDIN: self.kc.get_stdin_msg}[stream_type]
+        while not self.stop_msg_thread_signal:
+            try:
+                self.handle_ipython_message(
+                    stream_type, get_msg(timeout=MESSSAGE_TIMEOUT))
+            except queue.Empty:
+                pass
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def run_case(name, kernel, args):
+    kernel.start_kernel(args.kernel_name)
+    try:
+        latencies = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            ## the request is complete once both the shell reply and the idle status are handled #
+            kernel.execute('pass').wait()
+            latencies.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        requests = [kernel.execute('pass') for _ in range(args.pipeline)]
+        for request in requests:
+            request.wait()
+        pipeline_rate = args.pipeline / (time.perf_counter() - start)
+        start = time.perf_counter()
+        kernel.stop_msg_thread()
+        stop_time = time.perf_counter() - start
+    finally:
+        kernel.shutdown_kernel()
+    print('%-10s %8d %10.2f %10.2f %10.2f %12.0f' % (name, args.repeat, _percentile(latencies, 50) * 1000,
+                                                     _percentile(latencies, 99) * 1000, stop_time * 1000,
+                                                     pipeline_rate))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--kernel-name', default='python3')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--pipeline', type=int, default=200)
+    args = parser.parse_args()
+
+    print('%-10s %8s %10s %10s %10s %12s' %
+          ('kernel', 'repeat', 'p50(ms)', 'p99(ms)', 'stop(ms)', 'pipeline/s'))
+    run_case('legacy', LegacyPollingKernel(), args)
+    run_case('pump', IPythonKernel(), args)
+
+
+if __name__ == '__main__':
+    main()
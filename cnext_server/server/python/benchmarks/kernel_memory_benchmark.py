@@ -0,0 +1,65 @@
+"""
+Growth of the kernel memory over a long session of internal requests: each request returns a table page
+of `--rows` rows like `_df_manager._ipython_get_table_data` does. `user` sends them as the code of the user
+was sent before, their results are kept in the output caches of ipython (`Out`, `_`) and every request is
+in the history. `internal` sends them as the silent evaluations of `ExecutionMode.EVAL`.
+The iopub messages received per request are reported as well. Run from `cnext_server/server/python`:
+
+    python -m benchmarks.kernel_memory_benchmark
+"""
+import argparse
+import psutil
+
+from user_space.ipython.constants import IPythonConstants, ExecutionMode
+from user_space.ipython.kernel import IPythonKernel
+
+SETUP_CODE = """
+from libs.json_serializable import JsonSerializable
+def _table_page(seed, rows, cols=20):
+    return JsonSerializable({'df_id': 'df', 'column_names': [str(col) for col in range(cols)],
+                             'rows': [[str(seed * row + col) for col in range(cols)] for row in range(rows)],
+                             'index': {'name': None, 'data': list(range(rows))}, 'size': rows})
+"""
+
+
+def _get_rss(kernel) -> float:
+    return psutil.Process(kernel.km.provisioner.pid).memory_info().rss / (1024*1024)
+
+
+def run_case(name, exec_mode, args):
+    iopub_count = [0]
+
+    def callback(ipython_message, stream_type, client_message):
+        if stream_type == IPythonConstants.StreamType.IOBUF:
+            iopub_count[0] += 1
+
+    kernel = IPythonKernel()
+    kernel.start_kernel(args.kernel_name)
+    try:
+        kernel.execute(SETUP_CODE, ExecutionMode.EXEC).wait()
+        start_rss = _get_rss(kernel)
+        for seed in range(args.requests):
+            kernel.execute('_table_page(%d, %d)' % (seed, args.rows),
+                           exec_mode, callback).wait()
+        end_rss = _get_rss(kernel)
+    finally:
+        kernel.shutdown_kernel()
+    print('%-10s %8d %12.1f %12.1f %12.1f %10.1f' % (name, args.requests, start_rss, end_rss, end_rss - start_rss,
+                                                     iopub_count[0] / args.requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--kernel-name', default='python3')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=1000)
+    args = parser.parse_args()
+
+    print('%-10s %8s %12s %12s %12s %10s' %
+          ('mode', 'requests', 'start(MB)', 'end(MB)', 'growth(MB)', 'iopub/req'))
+    run_case('user', None, args)
+    run_case('internal', ExecutionMode.EVAL, args)
+
+
+if __name__ == '__main__':
+    main()
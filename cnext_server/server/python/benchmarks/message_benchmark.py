@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of the `Message` envelope: create and encode the messages sent to node server.
+
+`LegacyMessage` is the `__dict__` based envelope encoded through simplejson's generic `default`
+hook which `Message` replaced. Run from `cnext_server/server/python`:
+
+    python -m benchmarks.message_benchmark
+"""
+import argparse
+import time
+import simplejson as json
+
+from libs.message import Message, WebappEndpoint, ContentType, SubContentType, CodeEditorCommand
+
+
+class LegacyMessage:
+    def __init__(self, **entries):
+        self.webapp_endpoint = None
+        self.command_name = None
+        self.seq_number = None
+        self.type = None
+        self.sub_type = None
+        self.content = None
+        self.error = None
+        self.metadata = None
+        self.__dict__.update(entries)
+
+    def toJSON(self):
+        return json.dumps(self, default=lambda o: o.__dict__, ignore_nan=True)
+
+
+STREAM_METADATA = {'path': 'main.py', 'line_range': {'fromLine': 10, 'toLine': 11},
+                   'msg_id': '3c5e1a2b-7d7f4c1e9e0f_1234_5', 'msg_type': 'stream',
+                   'session': '3c5e1a2b-7d7f4c1e9e0f', 'stream_type': 'iobuf'}
+
+RICH_OUTPUT_CONTENT = {'text/plain': '<Figure size 640x480 with 1 Axes>',
+                       'image/png': 'iVBORw0KGgo' * 1000}
+
+
+def _stream_message(message_class):
+    return message_class(**{'webapp_endpoint': WebappEndpoint.CodeEditor,
+                            'command_name': CodeEditorCommand.exec_line,
+                            'type': ContentType.STRING,
+                            'content': 'epoch 1/10 - loss: 0.6931\n',
+                            'error': False,
+                            'metadata': STREAM_METADATA})
+
+
+def _rich_output_message(message_class):
+    return message_class(**{'webapp_endpoint': WebappEndpoint.CodeEditor,
+                            'command_name': CodeEditorCommand.exec_line,
+                            'type': ContentType.RICH_OUTPUT,
+                            'sub_type': SubContentType.NONE,
+                            'content': RICH_OUTPUT_CONTENT,
+                            'error': False,
+                            'metadata': STREAM_METADATA})
+
+
+def _messages_per_second(create_message, message_class, duration):
+    count = 0
+    start = time.perf_counter()
+    end = start + duration
+    while True:
+        for _ in range(1000):
+            create_message(message_class).toJSON()
+        count += 1000
+        now = time.perf_counter()
+        if now >= end:
+            return count / (now - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duration', type=float, default=2.0,
+                        help='seconds to run each case')
+    args = parser.parse_args()
+
+    ## both envelopes must produce the same json #
+    for create_message in (_stream_message, _rich_output_message):
+        assert json.loads(create_message(LegacyMessage).toJSON()) == json.loads(
+            create_message(Message).toJSON())
+
+    print('%-14s %16s %16s %8s' % ('case', 'legacy msg/s', 'slotted msg/s', 'speedup'))
+    for name, create_message in (('stream', _stream_message), ('rich_output', _rich_output_message)):
+        before = _messages_per_second(
+            create_message, LegacyMessage, args.duration)
+        after = _messages_per_second(create_message, Message, args.duration)
+        print('%-14s %16.0f %16.0f %7.2fx' %
+              (name, before, after, after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark of the python side of the transport to node server: the requests are dispatched through
+`EndpointDispatcher` like `server.main` does, answered by a synthetic message handler and the replies
+are sent through `MessageQueuePush` to a local `MessageQueuePull` which stands in for node server.
+The latency of a request is measured from `dispatch` to the reception of its reply. No kernel, node
+server or browser is needed. Run from `cnext_server/server/python`:
+
+    python -m benchmarks.transport_benchmark
+    python -m benchmarks.transport_benchmark --no-framed --compression none
+"""
+import argparse
+import threading
+import time
+import simplejson as json
+
+from libs.message import Message, WebappEndpoint, ContentType, SubContentType, CodeEditorCommand, \
+    DFManagerCommand, FRAMED_PROTOCOL
+from libs.message_handler import BaseMessageHandler
+from libs.dispatcher import EndpointDispatcher, DEFAULT_MAX_QUEUE_SIZE
+from libs.compression import PayloadCompressor, CompressionCodec
+from libs.zmq_message import MessageQueuePush, MessageQueuePull
+from benchmarks.compression_benchmark import _table_page, _plotly_figure
+
+RECEIVE_TIMEOUT = 10000  # unit: millisecond
+
+
+def _stream_reply(request):
+    return Message(**{'webapp_endpoint': request.webapp_endpoint, 'command_name': request.command_name,
+                      'type': ContentType.STRING, 'content': 'epoch 1/10 - loss: 0.6931\n',
+                      'error': False, 'metadata': dict(request.metadata, msg_type='stream')})
+
+
+def _table_reply(request, table_page):
+    return Message(**{'webapp_endpoint': request.webapp_endpoint, 'command_name': request.command_name,
+                      'type': ContentType.PANDAS_DATAFRAME, 'sub_type': SubContentType.NONE,
+                      'content': table_page, 'error': False, 'metadata': request.metadata})
+
+
+def _plotly_reply(request, figure):
+    return Message(**{'webapp_endpoint': request.webapp_endpoint, 'command_name': request.command_name,
+                      'type': ContentType.RICH_OUTPUT, 'sub_type': SubContentType.APPLICATION_PLOTLY,
+                      'content': figure, 'error': False, 'metadata': request.metadata})
+
+
+class SyntheticMessageHandler(BaseMessageHandler):
+    """ Answer each request with a prebuilt payload instead of running it in the kernel """
+
+    def __init__(self, p2n_queue, create_reply):
+        super(SyntheticMessageHandler, self).__init__(p2n_queue)
+        self.create_reply = create_reply
+
+    def handle_message(self, message):
+        self._send_to_node(self.create_reply(message))
+
+
+def _get_bench_id(frames) -> int:
+    ## only the header frame is decoded, the payload frames are left as they are #
+    header = json.loads(frames[0])
+    if header.get('protocol') == FRAMED_PROTOCOL:
+        header = header['message']
+    return header['metadata']['bench_id']
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def run_case(pull, name, endpoint, command_name, create_reply, count, window, args):
+    p2n_queue = MessageQueuePush(args.host, args.port, hwm=args.hwm, framed=args.framed,
+                                 compressor=None if args.compression == 'none' else
+                                 PayloadCompressor(args.compression, args.compression_threshold))
+    dispatcher = EndpointDispatcher(
+        {endpoint: SyntheticMessageHandler(p2n_queue, create_reply)}, p2n_queue, args.max_queue_size)
+    ## the replies must be received while the requests are dispatched #
+    dispatch_times = {}
+    latencies = []
+    in_flight = threading.Semaphore(window)
+
+    def receive():
+        received = 0
+        while received < count:
+            if not pull.pull.poll(RECEIVE_TIMEOUT):
+                break
+            frames = pull.pull.recv_multipart()
+            bench_id = _get_bench_id(frames)
+            latencies.append(time.perf_counter() - dispatch_times[bench_id])
+            received += 1
+            in_flight.release()
+
+    receiver = threading.Thread(target=receive, daemon=True)
+    receiver.start()
+    start = time.perf_counter()
+    for bench_id in range(count):
+        if not in_flight.acquire(timeout=RECEIVE_TIMEOUT/1000):
+            break
+        ## a unique `supersede_key` so queued requests are not superseded by the next ones #
+        message = Message(**{'webapp_endpoint': endpoint, 'command_name': command_name,
+                             'metadata': {'bench_id': bench_id, 'supersede_key': bench_id}})
+        dispatch_times[bench_id] = time.perf_counter()
+        dispatcher.dispatch(message)
+    receiver.join()
+    elapsed = time.perf_counter() - start
+
+    stats = p2n_queue.get_stats()
+    dispatcher.shutdown()
+    p2n_queue.close()
+    if latencies:
+        print('%-14s %8d %8d %8d %10.0f %10.2f %10.2f' % (name, count, len(latencies), stats['dropped'],
+                                                          len(latencies) / elapsed,
+                                                          _percentile(latencies, 50) * 1000,
+                                                          _percentile(latencies, 99) * 1000))
+    else:
+        print('%-14s %8d %8d %8d %10s %10s %10s' % (name, count, 0, stats['dropped'], '-', '-', '-'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='tcp://127.0.0.1')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--hwm', type=int, default=1000)
+    parser.add_argument('--no-framed', dest='framed', action='store_false')
+    parser.add_argument('--compression', default=CompressionCodec.ZLIB,
+                        choices=[CompressionCodec.ZLIB, CompressionCodec.ZSTD, 'none'])
+    parser.add_argument('--compression-threshold', type=int, default=256*1024)
+    parser.add_argument('--max-queue-size', type=int, default=DEFAULT_MAX_QUEUE_SIZE)
+    parser.add_argument('--window', type=int, default=50,
+                        help='maximum number of requests waiting for their reply')
+    parser.add_argument('--stream-count', type=int, default=20000)
+    parser.add_argument('--table-count', type=int, default=200)
+    parser.add_argument('--plotly-count', type=int, default=20)
+    parser.add_argument('--plotly-mb', type=float, default=5)
+    args = parser.parse_args()
+
+    table_page = _table_page(rows=1000)
+    ## a point is about 40 bytes of json #
+    figure = _plotly_figure(points=int(args.plotly_mb * 1024 * 1024 / 40))
+    pull = MessageQueuePull(args.host, args.port)
+    try:
+        print('framed: %s, compression: %s' % (args.framed, args.compression))
+        print('%-14s %8s %8s %8s %10s %10s %10s' %
+              ('payload', 'sent', 'received', 'dropped', 'msg/s', 'p50(ms)', 'p99(ms)'))
+        run_case(pull, 'stream_chunk', WebappEndpoint.CodeEditor, CodeEditorCommand.exec_line,
+                 _stream_reply, args.stream_count, args.window, args)
+        run_case(pull, 'table_page_1k', WebappEndpoint.DataFrameManager, DFManagerCommand.get_table_data,
+                 lambda request: _table_reply(request, table_page), args.table_count, args.window, args)
+        run_case(pull, 'plotly_%gmb' % args.plotly_mb, WebappEndpoint.CodeEditor, CodeEditorCommand.exec_line,
+                 lambda request: _plotly_reply(request, figure), args.plotly_count, min(args.window, 4), args)
+    finally:
+        pull.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import collections
 import threading
 import traceback
 import simplejson as json
@@ -5,16 +6,36 @@ import simplejson as json
 import plotly
 from libs.message_handler import BaseMessageHandler
 from libs.message import ContentType, SubContentType, Message
+from libs.output_coalescer import OutputCoalescer, DEFAULT_COALESCING_WINDOW
 
 from libs import logs
 from libs.message import DFManagerCommand, WebappEndpoint, CodeEditorCommand, ModelManagerCommand
-from user_space.ipython.constants import IPythonConstants, IpythonResultMessage
+from user_space.ipython.constants import IPythonConstants, IpythonResultMessage, PostExecSnapshotSection
+from user_space.ipython.profiler import PROFILE_MIME_TYPE, format_profile_summary
+from code_editor.dataflow import CodeGroup, ExecutionLog, get_group_key
 log = logs.get_logger(__name__)
 
+## the endpoint and the command of the message sent for each section of the post execution snapshot #
+SNAPSHOT_SECTION_MESSAGES = {
+    PostExecSnapshotSection.DFS_STATUS: (WebappEndpoint.DataFrameManager, DFManagerCommand.update_df_status),
+    PostExecSnapshotSection.UDFS: (WebappEndpoint.DataFrameManager, DFManagerCommand.get_registered_udfs),
+    PostExecSnapshotSection.MODELS: (WebappEndpoint.ModelManager, ModelManagerCommand.get_active_models_info),
+}
+## number of executions kept in the resource usage history of each file #
+DEFAULT_STATS_HISTORY_SIZE = 50
+
 
 class MessageHandler(BaseMessageHandler):
-    def __init__(self, p2n_queue, user_space=None):
+    def __init__(self, p2n_queue, user_space=None, coalescing_window=DEFAULT_COALESCING_WINDOW,
+                 stats_history_size=DEFAULT_STATS_HISTORY_SIZE):
         super(MessageHandler, self).__init__(p2n_queue, user_space)
+        self.output_coalescer = OutputCoalescer(
+            self._send_to_node, coalescing_window)
+        ## the resource usage of the last executions by the `path` in the metadata of the execution #
+        self.stats_history_size = stats_history_size
+        self.execution_stats_history = {}
+        ## the last execution of each group of lines, to find the stale groups after an edit #
+        self.execution_log = ExecutionLog()
 
     @staticmethod
     def _result_is_plotly_fig(content) -> bool:
@@ -112,6 +133,25 @@ class MessageHandler(BaseMessageHandler):
 
         return message
 
+    @staticmethod
+    def _get_coalescing_key(ipython_message):
+        """ Return the key used to merge the output with the previous ones or None if the output can't be merged """
+        msg_type = ipython_message['header']['msg_type']
+        if msg_type == IPythonConstants.MessageType.STREAM:
+            return OutputCoalescer.stream_key(ipython_message['parent_header'].get('msg_id'),
+                                              ipython_message['content'].get('name'))
+        elif msg_type == IPythonConstants.MessageType.UPDATE_DISPLAY_DATA:
+            display_id = ipython_message['content'].get(
+                'transient', {}).get('display_id')
+            if display_id is not None:
+                return OutputCoalescer.display_key(display_id)
+        return None
+
+    @staticmethod
+    def _is_execution_idle(ipython_message) -> bool:
+        return ipython_message['header']['msg_type'] == IPythonConstants.MessageType.STATUS and \
+            ipython_message['content']['execution_state'] == IPythonConstants.ExecutionState.IDLE
+
     def message_handler_callback(self, ipython_message, stream_type, client_message):
         try:
             # if self.request_metadata is not None:
@@ -119,22 +159,103 @@ class MessageHandler(BaseMessageHandler):
                 ipython_message=ipython_message, stream_type=stream_type, client_message=client_message)
             # log.info('Reply message: %s' % message)
             if message != None:
-                self._send_to_node(message)
+                self.output_coalescer.put(
+                    message, self._get_coalescing_key(ipython_message))
+            if self._is_execution_idle(ipython_message):
+                self.output_coalescer.flush()
+                log.info('Output coalescing: %s' %
+                         self.output_coalescer.get_stats())
         except:
             trace = traceback.format_exc()
             log.info("Exception %s" % (trace))
             error_message = BaseMessageHandler._create_error_message(
                 client_message.webapp_endpoint, trace, client_message.command_name, {})
-            self._send_to_node(error_message)
+            self.output_coalescer.put(error_message)
+
+    def _record_execution(self, message, request):
+        metadata = message.metadata or {}
+        self.execution_log.record(metadata.get('path'), get_group_key(
+            metadata), message.content, request.status)
+
+    def _execute(self, message):
+        """ Execute the code of the message and send the post execution snapshot, return the completed request """
+        ## the profiler is armed before the code is sent, the kernel executes them in order #
+        if message.metadata and message.metadata.get('profile'):
+            self.user_space.arm_profiler()
+        request = self.user_space.execute(
+            message.content, None, self.message_handler_callback, client_message=message)
+        if request is not None:
+            self._record_execution(message, request)
+        self._send_post_exec_snapshot([message])
+        return request
+
+    @staticmethod
+    def _create_group_messages(message, groups):
+        """ Create an `exec_grouped_lines` message for each group with the metadata of the batch message """
+        group_messages = []
+        for group in groups:
+            metadata = dict(message.metadata or {})
+            metadata.update({'line_range': group.line_range})
+            if not isinstance(group.key, tuple):
+                metadata.update({'group_id': group.key})
+            group_messages.append(Message(**{"webapp_endpoint": WebappEndpoint.CodeEditor,
+                                             "command_name": CodeEditorCommand.exec_grouped_lines,
+                                             "type": ContentType.STRING, "content": group.code,
+                                             "metadata": metadata, "error": False}))
+        return group_messages
+
+    @staticmethod
+    def _get_groups(message):
+        """
+            The groups of a batch message, its content is the list of the groups of a file in order, each with
+            its `code`, `line_range` and optionally `group_id`
+        """
+        return [CodeGroup(get_group_key(group), group['code'], group.get('line_range'))
+                for group in message.content]
+
+    def _execute_batch(self, message, groups):
+        """
+            Execute the groups one after the other, each as its own request so its outputs are sent with its
+            own `line_range`. The groups behind the first failed group are not executed. The post execution
+            snapshot is sent once at the end.
+        """
+        group_messages = self._create_group_messages(message, groups)
+        requests = self.user_space.execute_batch(
+            group_messages, self.message_handler_callback)
+        if requests is None:
+            return
+        executed_messages = []
+        for group_message, request in zip(group_messages, requests):
+            if request is None or request.status is None:
+                continue
+            self._record_execution(group_message, request)
+            executed_messages.append(group_message)
+        log.info('Batch executed %d of %d groups' %
+                 (len(executed_messages), len(group_messages)))
+        self._send_post_exec_snapshot(executed_messages)
+
+    def _execute_stale_groups(self, message):
+        """ Send the line ranges of the stale groups of the file then execute them in one batch """
+        groups = self._get_groups(message)
+        stale = self.execution_log.get_stale(
+            (message.metadata or {}).get('path'), groups)
+        log.info('Stale groups: %s' % [groups[index].key for index in stale])
+        self._send_to_node(Message(**{"webapp_endpoint": WebappEndpoint.CodeEditor,
+                                      "command_name": CodeEditorCommand.exec_stale_groups, "seq_number": 1,
+                                      "type": ContentType.DICT, "error": False, "metadata": message.metadata,
+                                      "content": {'stale': [groups[index].line_range for index in stale]}}))
+        if stale:
+            self._execute_batch(message, [groups[index] for index in stale])
 
     def handle_message(self, message):
         try:
             if self.user_space.is_alive():
-                self.user_space.execute(
-                    message.content, None, self.message_handler_callback, client_message=message)
-                self._get_active_dfs_status()
-                self._get_registered_udf()
-                # self._get_active_model()
+                if message.command_name == CodeEditorCommand.exec_stale_groups:
+                    self._execute_stale_groups(message)
+                elif message.command_name == CodeEditorCommand.exec_batch:
+                    self._execute_batch(message, self._get_groups(message))
+                else:
+                    self._execute(message)
             else:
                 text = "No executor running"
                 log.info(text)
@@ -149,32 +270,72 @@ class MessageHandler(BaseMessageHandler):
                 WebappEndpoint.DataFrameManager, trace, message.command_name, {})
             self._send_to_node(error_message)
 
-    def _self_initiate_execution(func):
-        def _self_initiate_execution_wrapper(*args, **kwargs):
-            result, endpoint, command_name = func(*args, **kwargs)
-            if result:
-                if result["status"] == IPythonConstants.ShellMessageStatus.OK:
-                    message = Message(**{"webapp_endpoint": endpoint, "command_name": command_name,
-                                        "seq_number": 1, "type": "dict", "content": result["content"], "error": False})
-                else:
-                    message = MessageHandler._create_error_message(
-                        endpoint, result["content"], command_name, {})
-            else:
-                message = MessageHandler._create_error_message(
-                    endpoint, None, command_name, {})
-            args[0]._send_to_node(message)
-        return _self_initiate_execution_wrapper
+    def _send_profile(self, profile, client_message):
+        """ Send the profile as an output of the profiled execution, with a text summary """
+        metadata = dict(client_message.metadata or {})
+        metadata.update({'profile': True})
+        message = Message(**{"webapp_endpoint": WebappEndpoint.CodeEditor, "command_name": client_message.command_name,
+                             "seq_number": 1, "type": ContentType.RICH_OUTPUT,
+                             "content": {PROFILE_MIME_TYPE: profile, 'text/plain': format_profile_summary(profile)},
+                             "metadata": metadata, "error": False})
+        self._send_to_node(message)
 
-    @_self_initiate_execution
-    def _get_active_dfs_status(self):
-        return (self.user_space.get_active_dfs_status(), WebappEndpoint.DataFrameManager, DFManagerCommand.update_df_status)
+    def _send_execution_stats(self, stats, client_message):
+        """ Send the resource usage of the execution with the history of the file it belongs to """
+        metadata = dict(client_message.metadata or {})
+        stats['line_range'] = metadata.get('line_range')
+        history = self.execution_stats_history.setdefault(
+            metadata.get('path'), collections.deque(maxlen=self.stats_history_size))
+        history.append(stats)
+        message = Message(**{"webapp_endpoint": WebappEndpoint.CodeEditor,
+                             "command_name": CodeEditorCommand.update_execution_stats,
+                             "seq_number": 1, "type": ContentType.DICT,
+                             "content": {'stats': stats, 'history': list(history)},
+                             "metadata": metadata, "error": False})
+        self._send_to_node(message)
 
-    @_self_initiate_execution    
-    def _get_active_models_info(self):
-        return  (self.user_space.get_active_models_info(), WebappEndpoint.ModelManager, ModelManagerCommand.get_active_models_info)        
+    def _send_memoization_status(self, status, client_message):
+        """ Send whether the execution was replayed from the cache, executed and stored, or not cacheable """
+        message = Message(**{"webapp_endpoint": WebappEndpoint.CodeEditor,
+                             "command_name": CodeEditorCommand.update_memoization_status,
+                             "seq_number": 1, "type": ContentType.DICT, "content": status,
+                             "metadata": dict(client_message.metadata or {}), "error": False})
+        self._send_to_node(message)
 
-    @_self_initiate_execution
-    def _get_registered_udf(self):
-        return (self.user_space.get_registered_udfs(), WebappEndpoint.DataFrameManager, DFManagerCommand.get_registered_udfs)
-        
+    @staticmethod
+    def _pair_with_messages(items, client_messages):
+        """ Pair the per cell items of the snapshot with the messages of the executed cells, from the last one """
+        return list(zip(reversed(items), reversed(client_messages)))[::-1]
 
+    def _send_post_exec_snapshot(self, client_messages):
+        """
+            Send the sections of the post execution snapshot which changed with the execution of the messages.
+            The profile, the resource usage and the cache status are sent with the message of their cell
+        """
+        result = self.user_space.get_post_exec_snapshot()
+        if result and result["status"] == IPythonConstants.ShellMessageStatus.OK:
+            content = result["content"]
+            if PostExecSnapshotSection.PROFILE.value in content and client_messages:
+                self._send_profile(
+                    content[PostExecSnapshotSection.PROFILE.value]["content"], client_messages[-1])
+            if PostExecSnapshotSection.EXECUTION_STATS.value in content:
+                for stats, client_message in self._pair_with_messages(
+                        content[PostExecSnapshotSection.EXECUTION_STATS.value]["content"], client_messages):
+                    self._send_execution_stats(stats, client_message)
+            if PostExecSnapshotSection.MEMOIZATION.value in content:
+                memoization = content[PostExecSnapshotSection.MEMOIZATION.value]["content"]
+                for status, client_message in self._pair_with_messages(memoization['cells'], client_messages):
+                    status['cache'] = memoization['cache']
+                    self._send_memoization_status(status, client_message)
+            for section, (endpoint, command_name) in SNAPSHOT_SECTION_MESSAGES.items():
+                if section.value in result["content"]:
+                    ## the metadata of the dataframe statuses has the names of the removed dataframes #
+                    snapshot = result["content"][section.value]
+                    message = Message(**{"webapp_endpoint": endpoint, "command_name": command_name,
+                                         "seq_number": 1, "type": "dict", "content": snapshot["content"],
+                                         "metadata": snapshot.get("metadata", {}), "error": False})
+                    self._send_to_node(message)
+        else:
+            message = MessageHandler._create_error_message(
+                WebappEndpoint.DataFrameManager, result["content"] if result else None, DFManagerCommand.update_df_status, {})
+            self._send_to_node(message)
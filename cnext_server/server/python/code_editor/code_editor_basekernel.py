@@ -37,20 +37,21 @@ class MessageHandler(BaseMessageHandler):
 
     @staticmethod
     def _assign_exec_mode(message: Message):
-        message.execution_mode = 'eval'
+        execution_mode = 'eval'
         if message.metadata and ('line_range' in message.metadata):
             line_range = message.metadata['line_range']
             # always 'exec' if there are more than 1 line in the code
             if line_range['fromLine'] < line_range['toLine']-1:
-                message.execution_mode = 'exec'
+                execution_mode = 'exec'
 
         try:
             compile(message.content, '<stdin>', 'eval')
         except SyntaxError as error:
             log.error(error)
-            message.execution_mode = 'exec'
+            execution_mode = 'exec'
 
-        log.info("assigned command type: %s" % message.execution_mode)
+        log.info("assigned command type: %s" % execution_mode)
+        return execution_mode
 
     @staticmethod
     def _result_is_matplotlib_fig(result) -> bool:
@@ -79,16 +80,16 @@ class MessageHandler(BaseMessageHandler):
         # log.info('Globals: %s' % client_globals)
         try:
             sub_type = SubContentType.NONE
-            self._assign_exec_mode(message)
+            execution_mode = self._assign_exec_mode(message)
             type = ContentType.NONE
             output = ''
-            if message.execution_mode == 'exec':
+            if execution_mode == 'exec':
                 log.info('exec mode...')
                 # exec(message.content, globals())
                 self.user_space.execute(message.content, ExecutionMode.EXEC)
                 type = ContentType.STRING
                 # output = sys.stdout.getvalue()
-            elif message.execution_mode == 'eval':
+            elif execution_mode == 'eval':
                 log.info('eval mode...')
                 # result = eval(message.content, globals())
                 result = self.user_space.execute(
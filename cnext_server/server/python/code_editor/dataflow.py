@@ -0,0 +1,156 @@
+import collections
+import hashlib
+import itertools
+
+from libs.code_analysis import analyze_code, ANY_NAME
+from user_space.ipython.constants import IPythonConstants
+
+
+def get_group_key(metadata):
+    """
+        A group is identified by its `group_id` if the client sends it, otherwise by its line range. A line
+        range is not stable, see `ExecutionLog`
+    """
+    if metadata.get('group_id') is not None:
+        return metadata['group_id']
+    line_range = metadata.get('line_range') or {}
+    return (line_range.get('fromLine'), line_range.get('toLine'))
+
+
+def _get_code_hash(code):
+    return hashlib.sha1(code.encode()).hexdigest()
+
+
+def _is_line_range_key(key) -> bool:
+    return isinstance(key, tuple)
+
+
+## `position` is the first line of the group when it was executed #
+_Run = collections.namedtuple('_Run', ['code_hash', 'sequence', 'succeeded', 'position'])
+
+
+class CodeGroup:
+    """
+        A group of lines of a file with the names it reads before binding them and the names it binds or
+        changes, see `CodeAnalysis`. The magics and shell commands are left out of the analysis. A group which
+        can not be parsed is opaque: it depends on all the groups before it and all the groups after it
+        depend on it.
+    """
+
+    def __init__(self, key, code, line_range=None):
+        self.key = key
+        self.code = code
+        self.line_range = line_range
+        try:
+            code = '\n'.join(line for line in code.splitlines()
+                             if not line.lstrip().startswith(('%', '!')))
+            self.analysis = analyze_code(code)
+        except SyntaxError:
+            self.analysis = None
+
+    def is_opaque(self) -> bool:
+        return self.analysis is None
+
+
+class DataflowGraph:
+    """
+        Def-use graph of the groups of a file: a group depends on the last group before it which binds or
+        changes each of its inputs. A method call on a name is a change of the name, except on the modules
+        e.g. `np.mean(values)`, otherwise every group using a module would depend on the one before it.
+    """
+
+    def __init__(self, groups: list):
+        self.groups = groups
+        self.dependencies = []
+        last_writers = {}
+        modules = set()
+        barrier = None
+        for index, group in enumerate(groups):
+            analysis = group.analysis
+            if group.is_opaque():
+                dependencies = set(range(index))
+            else:
+                dependencies = {last_writers[name] for name in analysis.inputs if name in last_writers}
+                if barrier is not None:
+                    dependencies.add(barrier)
+            self.dependencies.append(dependencies)
+            if group.is_opaque() or ANY_NAME in analysis.writes:
+                barrier = index
+            else:
+                modules.difference_update(analysis.writes)
+                modules.update(analysis.imports)
+                last_writers.update((name, index) for name in analysis.writes)
+                last_writers.update((name, index) for name in analysis.mutations if name not in modules)
+
+    def get_downstream(self, roots) -> list:
+        """ Return the roots and the groups which depend on them, directly or not, in the order of the file """
+        downstream = []
+        selected = set()
+        for index in range(len(self.groups)):
+            if index in roots or self.dependencies[index] & selected:
+                selected.add(index)
+                downstream.append(index)
+        return downstream
+
+
+class ExecutionLog:
+    """
+        The code and the order of the last execution of each group, by file. A group is stale when its code
+        changed since it was executed, when its execution failed, when a group it depends on was executed after
+        it, or when it was never executed but a group which depends on it was. The stale groups and the groups
+        downstream of them are the minimal set to execute again.
+        The groups with a `group_id` are found by their id. The line range of the other groups moves when lines
+        are inserted or deleted above them, so they are found by their code in the order of the file: a group
+        whose code was edited is a group which was never executed.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.sequence = itertools.count(1)
+
+    def record(self, path, key, code, status):
+        executions = self.files.setdefault(path, {})
+        code_hash = _get_code_hash(code)
+        position = None
+        if _is_line_range_key(key):
+            position = key[0]
+            ## the same code executed at another line range is the same group which moved #
+            for other_key in [other_key for other_key, run in executions.items()
+                              if _is_line_range_key(other_key) and run.code_hash == code_hash]:
+                del executions[other_key]
+        executions[key] = _Run(code_hash, next(self.sequence),
+                               status == IPythonConstants.ShellMessageStatus.OK, position)
+
+    @staticmethod
+    def _get_runs(executions, groups: list) -> list:
+        """ Return the last execution of each group, None if it was never executed """
+        runs = [None if _is_line_range_key(group.key) else executions.get(group.key) for group in groups]
+        ## the executions by line range with the same code are matched in the order of the file #
+        unmatched = collections.defaultdict(collections.deque)
+        for key, run in sorted(executions.items(), key=lambda item: (item[1].position or 0, item[1].sequence)):
+            if _is_line_range_key(key):
+                unmatched[run.code_hash].append(run)
+        for index, group in enumerate(groups):
+            if _is_line_range_key(group.key):
+                candidates = unmatched.get(_get_code_hash(group.code))
+                if candidates:
+                    runs[index] = candidates.popleft()
+        return runs
+
+    def get_stale(self, path, groups: list) -> list:
+        """ Return the indices of the groups to execute again, in the order of the file """
+        graph = DataflowGraph(groups)
+        runs = self._get_runs(self.files.get(path, {}), groups)
+        roots = set()
+        for index, group in enumerate(groups):
+            run = runs[index]
+            if run is None:
+                continue
+            if run.code_hash != _get_code_hash(group.code) or not run.succeeded or \
+                    any(runs[dependency] is not None and runs[dependency].sequence > run.sequence
+                        for dependency in graph.dependencies[index]):
+                roots.add(index)
+        for index, run in enumerate(runs):
+            if run is None and any(runs[downstream] is not None for downstream in graph.get_downstream({index})):
+                roots.add(index)
+        return graph.get_downstream(roots)
@@ -4,6 +4,9 @@ import simplejson as json
 import re
 import time
 
+from libs import logs
+log = logs.get_logger(__name__)
+
 MAX_UNIQUE_LENGTH = 1000
 
 
@@ -29,13 +32,13 @@ class DataFrameAbstract():
         return df
     
     def timeit(func):
+        ## logged instead of printed so the internal executions do not send stream outputs #
         def wrap(*args, **kwargs):
-            print(" Executing %s"%func.__name__)            
             start = time.time()
             result = func(*args, **kwargs)
             end = time.time()
 
-            print(' Elapse %.3f(s)'%(end-start))
+            log.info('%s elapse %.3f(s)' % (func.__name__, end-start))
             return result
         return wrap
     
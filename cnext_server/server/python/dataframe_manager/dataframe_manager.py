@@ -4,6 +4,7 @@ import base64
 import collections
 import itertools
 import sys
+import threading
 import traceback
 import simplejson as json
 import copy
@@ -11,7 +12,7 @@ import time
 
 from libs.message_handler import BaseMessageHandler
 from libs.message import ContentType, DFManagerCommand, SubContentType
-from libs.json_serializable import ipython_internal_output, JsonSerializable
+from libs.json_serializable import ipython_chunked_output, ipython_internal_output, JsonSerializable
 from cnextlib.mime_types import CnextMimeType
 from .dataframe import DataFrame
 
@@ -19,9 +20,17 @@ from libs import logs
 from libs.message import Message, WebappEndpoint
 from user_space.ipython.constants import IPythonInteral, IPythonConstants, IpythonResultMessage
 from user_space.ipython.kernel import IPythonKernel
+from user_space.ipython.introspection import IntrospectionQuery
 from user_space.user_space import ExecutionMode
 log = logs.get_logger(__name__)
 
+## number of rows, columns and udfs per chunk when the client requests a chunked response #
+DEFAULT_TABLE_CHUNK_SIZE = 100
+DEFAULT_METADATA_CHUNK_SIZE = 20
+DEFAULT_UDFS_CHUNK_SIZE = 10
+## interval between two polls of the result of a forked analysis job #
+JOB_POLL_INTERVAL = 0.05  # unit: second
+
 
 def total_size(o, handlers={}, verbose=False):
     """ Returns the approximate memory footprint an object and all of its contents.
@@ -65,9 +74,77 @@ def total_size(o, handlers={}, verbose=False):
     return sizeof(o)
 
 
+## commands which can be answered in chunks when `metadata['chunked']` is set and their default chunk size #
+CHUNKED_COMMANDS = {
+    DFManagerCommand.get_table_data: DEFAULT_TABLE_CHUNK_SIZE,
+    DFManagerCommand.get_df_metadata: DEFAULT_METADATA_CHUNK_SIZE,
+    DFManagerCommand.get_registered_udfs: DEFAULT_UDFS_CHUNK_SIZE,
+}
+
+
+class AnalysisJobPoller:
+    """
+        Poll the results of the forked analysis jobs from a thread of its own so the worker which started a job
+        does not wait for it. `on_result(message, job_result)` is called from that thread with the request of the
+        job and its result as {'status', 'content'}, an error if the job is lost or not done before its deadline.
+    """
+
+    def __init__(self, user_space, on_result):
+        self.user_space = user_space
+        self.on_result = on_result
+        ## job_id -> (message, deadline) #
+        self.jobs = collections.OrderedDict()
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(
+            target=self._run, name='AnalysisJobPoller', daemon=True)
+        self.thread.start()
+
+    def add(self, job_id, message, deadline):
+        with self.cond:
+            self.jobs[job_id] = (message, deadline)
+            self.cond.notify()
+
+    def _poll(self, job_id, deadline):
+        """ Return the result of the job, None if it is still running """
+        ## the introspection client is replaced when the kernel restarts, the jobs of the old kernel are lost #
+        introspection = getattr(self.user_space, 'introspection', None)
+        result = introspection.query(
+            IntrospectionQuery.JOB_RESULT, job_id=job_id) if introspection is not None else None
+        if result is None or result['status'] != IPythonConstants.ShellMessageStatus.OK:
+            return {'status': IPythonConstants.ShellMessageStatus.ERROR,
+                    'content': result['content'] if result else 'Lost the analysis job %s' % job_id}
+        if result['content'] is not None:
+            return result['content']
+        if time.time() > deadline:
+            return {'status': IPythonConstants.ShellMessageStatus.ERROR, 'content': 'Analysis timed out'}
+        return None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.jobs:
+                    self.cond.wait()
+                jobs = list(self.jobs.items())
+            for job_id, (message, deadline) in jobs:
+                try:
+                    job_result = self._poll(job_id, deadline)
+                    if job_result is None:
+                        continue
+                    with self.cond:
+                        self.jobs.pop(job_id, None)
+                    self.on_result(message, job_result)
+                except:
+                    log.error("Failed to poll the analysis job %s %s",
+                              job_id, traceback.format_exc())
+                    with self.cond:
+                        self.jobs.pop(job_id, None)
+            time.sleep(JOB_POLL_INTERVAL)
+
+
 class MessageHandler(BaseMessageHandler):
     def __init__(self, p2n_queue,  user_space=None):
         super(MessageHandler, self).__init__(p2n_queue, user_space)
+        self.job_poller = None
 
     def _get_file_content(self, file_path, mime_type):
         with open(file_path, 'rb') as file:
@@ -156,8 +233,6 @@ class MessageHandler(BaseMessageHandler):
     @ipython_internal_output
     def _ipython_get_table_data(self, df_id, df_type, filter, from_index, to_index):
         output = None
-        self.user_space.execute(
-            "print('Get table data for dataframe %s...')" % df_id, ExecutionMode.EVAL)
         dataframe = DataFrame(self.user_space, df_id, df_type)
         result = dataframe.get_table_data(filter, from_index, to_index)
         # print("get table data %s" % result)
@@ -167,20 +242,54 @@ class MessageHandler(BaseMessageHandler):
             output = self._create_table_data(df_id, result)
         return output
 
-    @ipython_internal_output
-    def _ipython_get_metadata(self, df_id, df_type):
-        self.user_space.execute(
-            "print('Get metadata for dataframe %s...')" % df_id, ExecutionMode.EVAL)
+    def _get_metadata(self, df_id, df_type):
         dataframe = DataFrame(self.user_space, df_id, df_type)
         shape, dtypes, countna, describe, nuniques = dataframe.get_metadata()
         uniques = dataframe.uniques(df_id, dtypes, nuniques)
         columns = dataframe.get_column_summary(
             dtypes, countna, describe, uniques)
-        output = {'df_id': df_id, 'type': str(df_type),
-                  'shape': shape, 'columns': columns, 'timestamp': time.time()}
-        self.user_space.execute(
-            "print('Done!')", ExecutionMode.EVAL)
-        return output
+        return {'df_id': df_id, 'type': str(df_type),
+                'shape': shape, 'columns': columns, 'timestamp': time.time()}
+
+    @ipython_internal_output
+    def _ipython_get_metadata(self, df_id, df_type):
+        return self._get_metadata(df_id, df_type)
+
+    @ipython_chunked_output
+    def _ipython_get_table_data_chunks(self, df_id, df_type, filter, from_index, to_index, chunk_size):
+        """ Same as `_ipython_get_table_data` but the rows are converted and sent in blocks of `chunk_size` """
+        dataframe = DataFrame(self.user_space, df_id, df_type)
+        result = dataframe.get_table_data(filter, from_index, to_index)
+        if result is not None:
+            for start in range(0, result.shape[0], chunk_size):
+                yield self._create_table_data(df_id, result.iloc[start:start+chunk_size].copy())
+
+    @ipython_chunked_output
+    def _ipython_get_metadata_chunks(self, df_id, df_type, chunk_size):
+        """
+            Same as `_ipython_get_metadata` but the column summaries are computed and sent in batches of
+            `chunk_size` columns so a slow column does not hold back the others.
+        """
+        dataframe = DataFrame(self.user_space, df_id, df_type)
+        shape = dataframe.shape()
+        col_names = list(dataframe.dtypes().index)
+        for start in range(0, len(col_names), chunk_size):
+            batch = DataFrame(self.user_space, "%s[%s]" % (
+                df_id, col_names[start:start+chunk_size]), df_type)
+            _, dtypes, countna, describe, nuniques = batch.get_metadata()
+            uniques = batch.uniques(df_id, dtypes, nuniques)
+            columns = batch.get_column_summary(
+                dtypes, countna, describe, uniques)
+            yield {'df_id': df_id, 'type': str(df_type),
+                   'shape': shape, 'columns': columns, 'timestamp': time.time()}
+
+    @ipython_chunked_output
+    def _ipython_get_registered_udfs_chunks(self, chunk_size):
+        registered_udfs = self.user_space.execute("{}.get_registered_udfs()".format(
+            IPythonInteral.UDF_MODULE.value), ExecutionMode.EVAL)
+        udfs = list(registered_udfs.udfs.items())
+        for start in range(0, len(udfs), chunk_size):
+            yield {'timestamp': registered_udfs.timestamp, 'udfs': dict(udfs[start:start+chunk_size])}
 
     # this function is run inside ipython but we don't have to wrap it with ipython_internal_output
     # because the UDF inherits JsonSerializable already #
@@ -216,6 +325,15 @@ class MessageHandler(BaseMessageHandler):
             self.user_space.execute(
                 executing_code, ExecutionMode.EVAL, self.message_handler_callback, return_message)
 
+    @staticmethod
+    def _get_chunk_result(message, chunk):
+        """ Set the `seq_number` and the `final` marker of a chunk published by `ipython_chunked_output` """
+        message.seq_number = chunk['seq_number']
+        message.metadata['final'] = chunk['final']
+        if chunk['content'] is None:
+            return {}
+        return chunk['content']
+
     def _create_return_message(self, ipython_message, stream_type, client_message):
         ipython_message = IpythonResultMessage(**ipython_message)
         message = Message(**{'webapp_endpoint': client_message.webapp_endpoint,
@@ -236,6 +354,9 @@ class MessageHandler(BaseMessageHandler):
             message = self._create_stream_message(message, ipython_message)
         else:
             result = self.get_execute_result(ipython_message)
+            if isinstance(result, dict) and SubContentType.APPLICATION_CNEXT in result:
+                result = self._get_chunk_result(
+                    message, result[SubContentType.APPLICATION_CNEXT])
             if result is not None:
                 if client_message.command_name == DFManagerCommand.get_table_data:
                     log.info('%s: %s' % (client_message, result))
@@ -283,6 +404,91 @@ class MessageHandler(BaseMessageHandler):
                 client_message.webapp_endpoint, trace, client_message.command_name, {})
             self._send_to_node(error_message)
 
+    def _execute_chunked(self, message):
+        """
+            Run the chunked variant of the command. The partial results are sent to node server as they are
+            computed, each with an incrementing `seq_number`, and the last one has `metadata['final']` set to True
+        """
+        chunk_size = message.metadata.get(
+            'chunk_size', CHUNKED_COMMANDS[message.command_name])
+        if message.command_name == DFManagerCommand.get_table_data:
+            code = "{}._ipython_get_table_data_chunks('{}', '{}', '{}', {}, {}, {})".format(
+                IPythonInteral.DF_MANAGER.value, message.metadata['df_id'], message.metadata['df_type'],
+                message.metadata['filter'] if message.metadata['filter'] is not None else "",
+                message.metadata['from_index'], message.metadata['to_index'], chunk_size)
+        elif message.command_name == DFManagerCommand.get_df_metadata:
+            code = "{}._ipython_get_metadata_chunks('{}', '{}', {})".format(
+                IPythonInteral.DF_MANAGER.value, message.metadata['df_id'], message.metadata['df_type'], chunk_size)
+        else:
+            code = "{}._ipython_get_registered_udfs_chunks({})".format(
+                IPythonInteral.DF_MANAGER.value, chunk_size)
+        self.user_space.execute(
+            code, ExecutionMode.EVAL, self.message_handler_callback, message)
+
+    @staticmethod
+    def _get_index(index):
+        try:
+            return int(index)
+        except (TypeError, ValueError):
+            return None
+
+    def handle_read_only(self, message) -> bool:
+        """
+            Answer get_table_data from the introspection server of the kernel when the kernel is busy, so the
+            data viewer does not wait for the running cell. This is called by the read-only worker of the
+            dispatcher, not by the kernel worker. Return False if the request must be executed e.g. the kernel is
+            idle, it has a filter, the dataframe is not a pandas dataframe or the server does not answer.
+        """
+        introspection = getattr(self.user_space, 'introspection', None)
+        if introspection is None or not self.user_space.is_busy() or message.metadata.get('filter') or \
+                message.command_name != DFManagerCommand.get_table_data:
+            return False
+        result = introspection.query(IntrospectionQuery.TABLE_PAGE, df_id=message.metadata['df_id'],
+                                     from_index=self._get_index(message.metadata.get('from_index')),
+                                     to_index=self._get_index(message.metadata.get('to_index')))
+        if result is None or result['status'] != IPythonConstants.ShellMessageStatus.OK:
+            log.info('Introspection of %s failed, execute it instead' %
+                     message.metadata['df_id'])
+            return False
+        self._send_to_node(Message(**{'webapp_endpoint': message.webapp_endpoint, 'command_name': message.command_name,
+                                      'seq_number': 1, 'type': ContentType.PANDAS_DATAFRAME,
+                                      'sub_type': SubContentType.NONE, 'content': result['content'],
+                                      'metadata': dict(message.metadata, introspection=True), 'error': False}))
+        return True
+
+    def _get_metadata_forked(self, message) -> bool:
+        """
+            Compute get_df_metadata in a fork of the kernel, the result is sent by `AnalysisJobPoller` so the
+            kernel worker is available for the other requests during the computation. Return False if it must
+            be executed in the kernel instead e.g. the forked analysis is disabled or the job could not be started.
+        """
+        introspection = getattr(self.user_space, 'introspection', None)
+        if introspection is None or not self.user_space.is_forked_analysis_enabled():
+            return False
+        result = self.user_space.start_metadata_job(
+            message.metadata['df_id'], message.metadata['df_type'])
+        if result is None or result['status'] != IPythonConstants.ShellMessageStatus.OK:
+            log.info('Failed to start the analysis of %s, execute it instead' %
+                     message.metadata['df_id'])
+            return False
+        if self.job_poller is None:
+            self.job_poller = AnalysisJobPoller(
+                self.user_space, self._send_job_result)
+        ## the worker kills the job after its timeout, the margin covers the polling #
+        self.job_poller.add(result['content'], message,
+                            time.time() + self.user_space.get_analysis_timeout() + 1)
+        return True
+
+    def _send_job_result(self, message, job_result):
+        if job_result['status'] == IPythonConstants.ShellMessageStatus.OK:
+            message = Message(**{'webapp_endpoint': message.webapp_endpoint, 'command_name': message.command_name,
+                                 'seq_number': 1, 'type': ContentType.DICT, 'sub_type': SubContentType.NONE,
+                                 'content': job_result['content'], 'metadata': message.metadata, 'error': False})
+        else:
+            message = MessageHandler._create_error_message(
+                message.webapp_endpoint, job_result['content'], message.command_name, message.metadata)
+        self._send_to_node(message)
+
     def handle_message(self, message):
         # send_reply = False
         # message execution_mode will always be `eval` for this sender
@@ -298,18 +504,22 @@ class MessageHandler(BaseMessageHandler):
                 
         try:
             if self.user_space.is_alive():
-                if message.command_name == DFManagerCommand.get_table_data:
+                if message.metadata.get('chunked') and message.command_name in CHUNKED_COMMANDS:
+                    self._execute_chunked(message)
+
+                elif message.command_name == DFManagerCommand.get_table_data:
                     # TODO: turn _df_manager to variable
                     self.user_space.execute("{}._ipython_get_table_data('{}', '{}', '{}', '{}', '{}')".format(
-                        IPythonInteral.DF_MANAGER.value, message.metadata['df_id'], message.metadata['df_type'], 
-                        message.metadata['filter'] if message.metadata['filter'] is not None else "", 
-                        message.metadata['from_index'], message.metadata['to_index']), 
+                        IPythonInteral.DF_MANAGER.value, message.metadata['df_id'], message.metadata['df_type'],
+                        message.metadata['filter'] if message.metadata['filter'] is not None else "",
+                        message.metadata['from_index'], message.metadata['to_index']),
                         ExecutionMode.EVAL, self.message_handler_callback, message)
 
                 elif message.command_name == DFManagerCommand.get_df_metadata:
-                    self.user_space.execute("{}._ipython_get_metadata('{}', '{}')".format(
-                        IPythonInteral.DF_MANAGER.value, message.metadata['df_id'], message.metadata['df_type']),
-                         ExecutionMode.EVAL, self.message_handler_callback, message)
+                    if not self._get_metadata_forked(message):
+                        self.user_space.execute("{}._ipython_get_metadata('{}', '{}')".format(
+                            IPythonInteral.DF_MANAGER.value, message.metadata['df_id'], message.metadata['df_type']),
+                            ExecutionMode.EVAL, self.message_handler_callback, message)
 
                 elif message.command_name == DFManagerCommand.get_registered_udfs:
                     self.user_space.execute("{}._ipython_get_registered_udfs()".format(
@@ -321,7 +531,7 @@ class MessageHandler(BaseMessageHandler):
                 elif message.command_name == DFManagerCommand.set_dataframe_cell_value:
                     ## Note: have to use single quote here because json.dumps will generate the double quote inside #
                     self.user_space.execute("{}.at[{}, \"{}\"] = \'{}\'".format(
-                        message.content['df_id'], message.content['index'], message.content['col_name'], json.dumps(message.content['value'])), ExecutionMode.EVAL, self.message_handler_callback, message)
+                        message.content['df_id'], message.content['index'], message.content['col_name'], json.dumps(message.content['value'])), ExecutionMode.EXEC, self.message_handler_callback, message)
 
                 elif message.command_name == DFManagerCommand.reload_df_status:
                     result = self.user_space.get_active_dfs_status()
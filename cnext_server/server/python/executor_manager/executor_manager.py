@@ -42,15 +42,20 @@ class ResourceStatus:
 
 
 class MessageHandler(BaseMessageHandler):
-    def __init__(self, p2n_queue, user_space=None):
+    def __init__(self, p2n_queue, user_space=None, control_thread=True):
         super(MessageHandler, self).__init__(p2n_queue, user_space)
         self.resource_status = ResourceStatus()
-        
-        event_loop = asyncio.get_event_loop()
-        ## we have to pass event_loop to the thread otherwise it won't have one #
-        executor_manager_thread = threading.Thread(
-            target=self.handle_message, args=(event_loop,), daemon=True)
-        executor_manager_thread.start()
+        self.dispatcher = None
+        self.n2p_queue = None
+
+        ## without the control thread, the control socket is owned by `AsyncServerCore` which calls
+        # `handle_control_message` #
+        if control_thread:
+            event_loop = asyncio.get_event_loop()
+            ## we have to pass event_loop to the thread otherwise it won't have one #
+            executor_manager_thread = threading.Thread(
+                target=self.handle_message, args=(event_loop,), daemon=True)
+            executor_manager_thread.start()
 
         server_app = ServerApp()
         resuseconfig = ResourceUseDisplay(parent=server_app)
@@ -62,6 +67,12 @@ class MessageHandler(BaseMessageHandler):
             target=self._update_resouce_usage, daemon=True)
         executor_status_thread.start()
 
+    def set_dispatcher(self, dispatcher):
+        self.dispatcher = dispatcher
+
+    def _get_dispatcher_stats(self):
+        return self.dispatcher.get_stats() if self.dispatcher else {}
+
     def _check_resource_threshold(self, alive_status, resource_usage):
         if self.resource_status.alive_status != alive_status:
             self.resource_status.alive_status = alive_status
@@ -82,7 +93,9 @@ class MessageHandler(BaseMessageHandler):
             resource_usage = self._get_resource_usage()
             # log.info('Resource: %s' % resource_usage)
             message.content = {'alive_status': alive_status,
-                               'resource_usage': resource_usage}
+                               'resource_usage': resource_usage,
+                               'dispatcher': self._get_dispatcher_stats(),
+                               'outbound_queue': self.p2n_queue.get_stats()}
             if self._check_resource_threshold(alive_status, resource_usage):
                 self._send_to_node(message)
             # end_time = time.time()
@@ -142,56 +155,49 @@ class MessageHandler(BaseMessageHandler):
             metrics.update(cpu_percent=cpu_percent, cpu_count=cpu_count)
         return metrics
 
-    def handle_message(self, event_loop):
-        log.info("Kernel control thread started")
-        asyncio.set_event_loop(event_loop)
-        ## reading config here to get the most updated version #
-        server_config = read_config(SERVER_CONFIG_PATH)
-        self.n2p_queue = MessageQueuePull(
-            server_config.n2p_comm['host'], server_config.n2p_comm['kernel_control_port'])
+    def handle_control_message(self, message):
+        log.info("Received control message: %s" % message)
         try:
-            while True:
-                strMessage = self.n2p_queue.receive_msg()
-                message = Message(**json.loads(strMessage))
-                log.info("Received control message: %s" % message)
-                if self.user_space.is_alive():
-                    if message.command_name == ExecutorManagerCommand.restart_kernel:
-                        result = self.user_space.restart_executor()
-                        if result:
-                            # get the lastest config to make sure that it is updated with the lastest open project
-                            workspace_info = read_config(WORKSPACE_METADATA_PATH)
-                            workspace_metadata = WorkspaceMetadata(
-                                workspace_info.__dict__)
-                            set_executor_working_dir(
-                                self.user_space, workspace_metadata)
-                        message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManagerControl,
-                                            'command_name': message.command_name,
-                                            'content': {'success': result}})
-                    elif message.command_name == ExecutorManagerCommand.interrupt_kernel:
-                        result = self.user_space.interrupt_executor()
-                        message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManagerControl,
-                                            'command_name': message.command_name,
-                                            'content': {'success': result}})
-                    elif message.command_name == ExecutorManagerCommand.get_status:
-                        status = self.user_space.is_alive()
-                        # resource_usage = self._get_resource_usage()
-                        # log.info("Memory usage %s" % resource_usage)
-                        message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManager,
-                                            'command_name': message.command_name,
-                                            'content': {'alive': status}})
-                        #  'content': {'alive': status, 'resource': resource_usage}})
-                    elif message.command_name == ExecutorManagerCommand.send_stdin:
-                        self.user_space.send_stdin(message.content)
-                        message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManager,
-                                            'command_name': message.command_name,
-                                            'content': {'status': 'done'}})
-                    self._send_to_node(message)
-                else:
-                    text = "No executor running"
-                    log.info(text)
-                    error_message = BaseMessageHandler._create_error_message(
-                        message.webapp_endpoint, text, message.command_name, {})
-                    self._send_to_node(error_message)
+            if self.user_space.is_alive():
+                if message.command_name == ExecutorManagerCommand.restart_kernel:
+                    result = self.user_space.restart_executor()
+                    if result:
+                        # get the lastest config to make sure that it is updated with the lastest open project
+                        workspace_info = read_config(WORKSPACE_METADATA_PATH)
+                        workspace_metadata = WorkspaceMetadata(
+                            workspace_info.__dict__)
+                        set_executor_working_dir(
+                            self.user_space, workspace_metadata)
+                    message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManagerControl,
+                                        'command_name': message.command_name,
+                                        'content': {'success': result}})
+                elif message.command_name == ExecutorManagerCommand.interrupt_kernel:
+                    result = self.user_space.interrupt_executor()
+                    message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManagerControl,
+                                        'command_name': message.command_name,
+                                        'content': {'success': result}})
+                elif message.command_name == ExecutorManagerCommand.get_status:
+                    status = self.user_space.is_alive()
+                    # resource_usage = self._get_resource_usage()
+                    # log.info("Memory usage %s" % resource_usage)
+                    message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManager,
+                                        'command_name': message.command_name,
+                                        'content': {'alive': status, 'dispatcher': self._get_dispatcher_stats(),
+                                                     'outbound_queue': self.p2n_queue.get_stats(),
+                                                     'startup': self.user_space.startup_report}})
+                    #  'content': {'alive': status, 'resource': resource_usage}})
+                elif message.command_name == ExecutorManagerCommand.send_stdin:
+                    self.user_space.send_stdin(message.content)
+                    message = Message(**{'webapp_endpoint': WebappEndpoint.ExecutorManager,
+                                        'command_name': message.command_name,
+                                        'content': {'status': 'done'}})
+                self._send_to_node(message)
+            else:
+                text = "No executor running"
+                log.info(text)
+                error_message = BaseMessageHandler._create_error_message(
+                    message.webapp_endpoint, text, message.command_name, {})
+                self._send_to_node(error_message)
         except:
             trace = traceback.format_exc()
             log.info("Exception %s" % (trace))
@@ -199,6 +205,18 @@ class MessageHandler(BaseMessageHandler):
                 message.webapp_endpoint, trace, message.command_name, {})
             self._send_to_node(error_message)
 
+    def handle_message(self, event_loop):
+        log.info("Kernel control thread started")
+        asyncio.set_event_loop(event_loop)
+        ## reading config here to get the most updated version #
+        server_config = read_config(SERVER_CONFIG_PATH)
+        self.n2p_queue = MessageQueuePull(
+            server_config.n2p_comm['host'], server_config.n2p_comm['kernel_control_port'])
+        while True:
+            strMessage = self.n2p_queue.receive_msg()
+            self.handle_control_message(Message(**json.loads(strMessage)))
+
     def shutdown(self):
-        self.n2p_queue.close()
+        if self.n2p_queue is not None:
+            self.n2p_queue.close()
         return super().shutdown()
@@ -0,0 +1,217 @@
+import asyncio
+import sys
+import traceback
+import simplejson as json
+import zmq
+import zmq.asyncio
+
+from libs import logs
+from libs.dispatcher import DEFAULT_MAX_QUEUE_SIZE, KERNEL_WORKER, READ_ONLY_WORKER, RequestFilter, get_worker_name
+from libs.message import Message
+from libs.message_handler import BaseMessageHandler
+
+log = logs.get_logger(__name__)
+
+## a message from node server is one line of stdin, table cell updates and file contents can be large #
+MAX_LINE_SIZE = 64*1024*1024  # unit: byte
+
+
+class SyncHandlerAdapter:
+    """
+        Run the synchronous `handle_message` of a message handler in the executor of the event loop
+        so it does not block the loop. Handlers migrated to asyncio implement
+        `async def handle_message_async(self, message)` instead and are awaited directly.
+    """
+
+    def __init__(self, handle_message):
+        self.handle_message = handle_message
+
+    async def __call__(self, message):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.handle_message, message)
+
+
+def get_async_handle(handler):
+    if asyncio.iscoroutinefunction(getattr(handler, 'handle_message_async', None)):
+        return handler.handle_message_async
+    return SyncHandlerAdapter(handler.handle_message)
+
+
+class AsyncEndpointWorker:
+    """
+        The asyncio version of `EndpointWorker`: a bounded queue served by a task, for one or several endpoints.
+        Messages are handled by the coroutine function `handle` in the order they are received.
+    """
+
+    def __init__(self, name, handle, p2n_queue, max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        self.name = name
+        self.handle = handle
+        self.p2n_queue = p2n_queue
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        ## the queue is only used in the event loop so the filter needs no lock #
+        self.request_filter = RequestFilter()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def put(self, message) -> bool:
+        item = self.request_filter.create_item(message)
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            return False
+        self.request_filter.register(item)
+        return True
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def get_stats(self) -> dict:
+        return self.request_filter.get_stats(self.depth())
+
+    async def _run(self):
+        log.info('Start task for %s' % self.name)
+        while True:
+            item = await self.queue.get()
+            message = item[2]
+            if self.request_filter.should_skip(item):
+                continue
+            try:
+                await self.handle(message)
+            except OSError as error:
+                # since this error might be related to the pipe, we do not send this error to nodejs
+                log.error("OSError: %s" % (error))
+            except:
+                log.error("Failed to execute the command %s",
+                          traceback.format_exc())
+                error_message = BaseMessageHandler._create_error_message(
+                    message.webapp_endpoint, traceback.format_exc(), message.command_name)
+                BaseMessageHandler.send_message(self.p2n_queue, error_message)
+
+    def stop(self):
+        self.task.cancel()
+
+
+class AsyncServerCore:
+    """
+        An asyncio event loop which owns the stdin of the process and the kernel control socket.
+        The messages are handled by a task per worker instead of a thread per worker, the handlers
+        which are not migrated yet run through `SyncHandlerAdapter`.
+        It has the same `get_stats` and `shutdown` as `EndpointDispatcher` so it can be used in its place.
+    """
+
+    def __init__(self, message_handler: dict, p2n_queue, max_queue_size=DEFAULT_MAX_QUEUE_SIZE,
+                 control_addr=None, control_handler=None):
+        self.message_handler = message_handler
+        self.p2n_queue = p2n_queue
+        self.max_queue_size = max_queue_size
+        ## the kernel control messages are served by `control_handler.handle_control_message` #
+        self.control_addr = control_addr
+        self.control_handler = control_handler
+        self.handles = {endpoint: get_async_handle(handler) for endpoint, handler in message_handler.items()}
+        self.workers = {}
+        self.loop = None
+        self.main_task = None
+
+    def _get_worker(self, name) -> AsyncEndpointWorker:
+        if name not in self.workers:
+            handle = self._handle_read_only if name == READ_ONLY_WORKER else self._handle
+            self.workers[name] = AsyncEndpointWorker(
+                name, handle, self.p2n_queue, self.max_queue_size)
+        return self.workers[name]
+
+    async def _handle(self, message):
+        await self.handles[message.webapp_endpoint](message)
+
+    async def _handle_read_only(self, message):
+        """ Same as `EndpointDispatcher._handle_read_only` """
+        kernel_worker = self._get_worker(KERNEL_WORKER)
+        handle_read_only = self.message_handler[message.webapp_endpoint].handle_read_only
+        if kernel_worker.depth() > 0 or not await self.loop.run_in_executor(None, handle_read_only, message):
+            self._put(kernel_worker, message)
+
+    def dispatch(self, message) -> bool:
+        """ Must be called in the event loop """
+        return self._put(self._get_worker(get_worker_name(message)), message)
+
+    def _put(self, worker, message) -> bool:
+        if worker.put(message):
+            log.info('Queued message for %s command: "%s", queue depth: %d' %
+                     (message.webapp_endpoint, message.command_name, worker.depth()))
+            return True
+
+        text = "Request queue of {} is full ({} messages)".format(
+            message.webapp_endpoint, self.max_queue_size)
+        log.error(text)
+        error_message = BaseMessageHandler._create_error_message(
+            message.webapp_endpoint, text, message.command_name, message.metadata)
+        BaseMessageHandler.send_message(self.p2n_queue, error_message)
+        return False
+
+    async def _read_stdin(self):
+        reader = asyncio.StreamReader(limit=MAX_LINE_SIZE)
+        await self.loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        while True:
+            line = await reader.readline()
+            if not line:
+                log.info('stdin is closed')
+                break
+            message = None
+            try:
+                message = Message(**json.loads(line))
+                log.info('Got message from %s command: "%s"' %
+                         (message.webapp_endpoint, message.command_name))
+                self.dispatch(message)
+            except:
+                log.error("Failed to dispatch the command %s",
+                          traceback.format_exc())
+                if message is not None:
+                    error_message = BaseMessageHandler._create_error_message(
+                        message.webapp_endpoint, traceback.format_exc(), message.command_name)
+                    BaseMessageHandler.send_message(
+                        self.p2n_queue, error_message)
+
+    async def _read_control(self):
+        context = zmq.asyncio.Context()
+        pull = context.socket(zmq.PULL)
+        pull.setsockopt(zmq.LINGER, 0)
+        pull.bind(self.control_addr)
+        log.info("Kernel control socket bound to %s" % self.control_addr)
+        handle = SyncHandlerAdapter(self.control_handler.handle_control_message)
+        try:
+            while True:
+                strMessage = await pull.recv_string()
+                try:
+                    ## control messages e.g. interrupt_kernel must not wait behind the other requests #
+                    await handle(Message(**json.loads(strMessage)))
+                except:
+                    log.error("Failed to handle the control message %s",
+                              traceback.format_exc())
+        finally:
+            pull.close()
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        control_task = None
+        if self.control_addr is not None and self.control_handler is not None:
+            control_task = self.loop.create_task(self._read_control())
+        self.main_task = self.loop.create_task(self._read_stdin())
+        try:
+            await self.main_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if control_task is not None:
+                control_task.cancel()
+            for worker in self.workers.values():
+                worker.stop()
+
+    def run(self):
+        """ Run until stdin is closed or `shutdown` is called """
+        asyncio.run(self._main())
+
+    def get_stats(self) -> dict:
+        return {str(name): worker.get_stats() for name, worker in list(self.workers.items())}
+
+    def shutdown(self):
+        ## can be called from a signal handler or another thread #
+        if self.loop is not None and self.main_task is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.main_task.cancel)
@@ -0,0 +1,155 @@
+import ast
+
+## name written by a statement whose bindings are unknown e.g. `from module import *` #
+ANY_NAME = '*'
+
+
+class UnsupportedCode(Exception):
+    pass
+
+
+class _NameAnalyzer(ast.NodeVisitor):
+    """
+        Find the names read by a statement and the names it binds or changes. A name changed through an
+        attribute or an item e.g. `df['a'] = 1` is read and written. A name whose method is called e.g.
+        `df.drop(..., inplace=True)` or `values.append(1)` might be changed in place, it is a mutation.
+        The names bound inside a function or a comprehension are local to them, their reads are the reads
+        of the statement.
+        In `strict` mode the statements which can not be described by their bindings raise `UnsupportedCode`.
+    """
+
+    def __init__(self, strict):
+        self.strict = strict
+        self.reads = []
+        self.writes = []
+        self.mutations = []
+        self.imports = []
+        self.local_depth = 0
+
+    def _write(self, name):
+        if self.local_depth == 0:
+            self.writes.append(name)
+
+    def _unsupported(self, reason):
+        if self.strict:
+            raise UnsupportedCode(reason)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.reads.append(node.id)
+        else:
+            if isinstance(node.ctx, ast.Del):
+                self._unsupported('deletes %s' % node.id)
+            self._write(node.id)
+
+    def _visit_target(self, target):
+        if isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                self._visit_target(element)
+            return
+        base = target
+        while isinstance(base, (ast.Attribute, ast.Subscript, ast.Starred)):
+            base = base.value
+        if base is not target and isinstance(base, ast.Name):
+            self.reads.append(base.id)
+            self._write(base.id)
+        self.visit(target)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self._visit_target(target)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            self.reads.append(node.target.id)
+        self._visit_target(node.target)
+
+    def visit_AnnAssign(self, node):
+        if node.value is not None:
+            self.visit(node.value)
+        self._visit_target(node.target)
+
+    def visit_Delete(self, node):
+        for target in node.targets:
+            self._visit_target(target)
+
+    def visit_Call(self, node):
+        base = node.func
+        if isinstance(base, ast.Attribute):
+            while isinstance(base, (ast.Attribute, ast.Subscript, ast.Call)):
+                base = base.func if isinstance(base, ast.Call) else base.value
+            if isinstance(base, ast.Name) and self.local_depth == 0:
+                self.mutations.append(base.id)
+        self.generic_visit(node)
+
+    def _import(self, name):
+        self._write(name)
+        if self.local_depth == 0:
+            self.imports.append(name)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._import(alias.asname or alias.name.split('.')[0])
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name == '*':
+                self._unsupported('imports *')
+                self._write(ANY_NAME)
+            else:
+                self._import(alias.asname or alias.name)
+
+    def visit_Global(self, node):
+        self._unsupported('declares global names')
+
+    visit_Nonlocal = visit_Global
+
+    def _visit_local_scope(self, node, name=None):
+        if name is not None:
+            self._write(name)
+        self.local_depth += 1
+        try:
+            self.generic_visit(node)
+        finally:
+            self.local_depth -= 1
+
+    def visit_FunctionDef(self, node):
+        self._visit_local_scope(node, node.name)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+    visit_ClassDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        self._visit_local_scope(node)
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = visit_Lambda
+
+
+class CodeAnalysis:
+    """
+        The names the code reads before binding them, its inputs, the names it binds or changes, the names
+        it might change in place through a method and the names it binds with an import
+    """
+    __slots__ = ['inputs', 'writes', 'mutations', 'imports']
+
+    def __init__(self):
+        self.inputs = []
+        self.writes = []
+        self.mutations = []
+        self.imports = []
+
+
+def analyze_code(code: str, strict=False) -> CodeAnalysis:
+    """ The magics are not python, the code of a cell must be transformed by ipython first """
+    analysis = CodeAnalysis()
+    for statement in ast.parse(code).body:
+        analyzer = _NameAnalyzer(strict)
+        analyzer.visit(statement)
+        analysis.inputs.extend(name for name in analyzer.reads
+                               if name not in analysis.writes and name not in analysis.inputs)
+        analysis.writes.extend(name for name in analyzer.writes if name not in analysis.writes)
+        analysis.mutations.extend(name for name in analyzer.mutations if name not in analysis.mutations)
+        analysis.imports.extend(name for name in analyzer.imports if name not in analysis.imports)
+    return analysis
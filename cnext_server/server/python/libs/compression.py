@@ -0,0 +1,55 @@
+import zlib
+
+from libs import logs
+
+log = logs.get_logger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_COMPRESSION_THRESHOLD = 256*1024  # unit: byte
+DEFAULT_COMPRESSION_LEVEL = 1
+
+
+class CompressionCodec:
+    ZLIB = 'zlib'
+    ZSTD = 'zstd'
+
+
+class PayloadCompressor:
+    """
+        Compress the payload frames sent to node server when they are larger than `threshold`.
+        `zstd` requires the optional `zstandard` package, `zlib` is used if it is not installed. node server
+        can only decompress `zstd` from node 22.15, use `zlib` with the older versions.
+    """
+
+    def __init__(self, codec=CompressionCodec.ZLIB, threshold=DEFAULT_COMPRESSION_THRESHOLD, level=DEFAULT_COMPRESSION_LEVEL):
+        if codec == CompressionCodec.ZSTD and zstandard is None:
+            log.error(
+                "zstandard is not installed, use zlib to compress the payloads")
+            codec = CompressionCodec.ZLIB
+        self.codec = codec
+        self.threshold = threshold
+        self.level = level
+        if self.codec == CompressionCodec.ZSTD:
+            self.zstd_compressor = zstandard.ZstdCompressor(level=level)
+
+    def should_compress(self, data) -> bool:
+        return len(data) >= self.threshold
+
+    def compress(self, data) -> bytes:
+        if self.codec == CompressionCodec.ZSTD:
+            return self.zstd_compressor.compress(data)
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def from_config(config):
+        """ Create the compressor from the `compression` section of `p2n_comm`, None if it is not enabled """
+        if not config or not config.get('enabled', False):
+            return None
+        return PayloadCompressor(config.get('codec', CompressionCodec.ZLIB),
+                                 config.get('threshold',
+                                            DEFAULT_COMPRESSION_THRESHOLD),
+                                 config.get('level', DEFAULT_COMPRESSION_LEVEL))
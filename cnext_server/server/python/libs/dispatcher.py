@@ -0,0 +1,249 @@
+import itertools
+import queue
+import threading
+import time
+import traceback
+
+from libs import logs
+from libs.message import DFManagerCommand, WebappEndpoint
+from libs.message_handler import BaseMessageHandler
+
+log = logs.get_logger(__name__)
+
+DEFAULT_MAX_QUEUE_SIZE = 100
+
+
+## commands whose queued requests are superseded by a newer one with the same key even if the client
+# does not set `supersede_key` e.g. the table pages requested while scrolling the data viewer #
+SUPERSEDED_COMMANDS = [DFManagerCommand.get_table_data]
+
+## The ordering guarantees of the workers:
+# - `KERNEL_WORKER` serves the requests which run on the kernel in the order node sent them, across endpoints.
+#   The kernel runs one request at a time anyway so a worker per endpoint would not make them concurrent, it would
+#   only let a read overtake the change it depends on.
+# - `READ_ONLY_WORKER` serves the `READ_ONLY_COMMANDS` while a cell is running and no other kernel request waits.
+#   The answer sees the namespace as the running cell leaves it, otherwise the request goes to `KERNEL_WORKER`.
+# - every other endpoint does not use the kernel and has a worker of its own which keeps the order of the endpoint #
+
+## the endpoints which change the user namespace: the cells of CodeEditor, set_dataframe_cell_value
+# and compute_udf of DataFrameManager #
+KERNEL_MUTATING_ENDPOINTS = [WebappEndpoint.CodeEditor, WebappEndpoint.DataFrameManager]
+## the endpoints which only read the namespace, they must see the changes of the mutating requests received before
+# them e.g. a table page of a dataframe is not read before the cell which creates it #
+KERNEL_READING_ENDPOINTS = [WebappEndpoint.DataViewer, WebappEndpoint.DFExplorer,
+                            WebappEndpoint.ModelManager, WebappEndpoint.MagicCommandGen]
+KERNEL_ENDPOINTS = KERNEL_MUTATING_ENDPOINTS + KERNEL_READING_ENDPOINTS
+KERNEL_WORKER = 'Kernel'
+
+## read-only requests of the kernel endpoints which can be answered by the introspection server of the kernel
+# while a cell is running, they have a worker of their own. The handler of their endpoint answers them with
+# `handle_read_only(message) -> bool`, a request it does not answer is queued on the kernel worker #
+READ_ONLY_COMMANDS = [DFManagerCommand.get_table_data]
+READ_ONLY_WORKER = 'ReadOnly'
+
+
+def get_worker_name(message):
+    """ Return the name of the worker which serves the message """
+    if message.webapp_endpoint in KERNEL_ENDPOINTS:
+        metadata = message.metadata if isinstance(message.metadata, dict) else {}
+        if message.command_name in READ_ONLY_COMMANDS and not metadata.get('chunked'):
+            return READ_ONLY_WORKER
+        return KERNEL_WORKER
+    return message.webapp_endpoint
+
+
+def get_supersession_key(message):
+    """
+        A queued request is discarded if a newer request with the same key is queued after it.
+        The key is `metadata['supersede_key']` or, for the `SUPERSEDED_COMMANDS`, the df_id, the command and
+        the view_id. Return None if the request can't be superseded.
+    """
+    metadata = message.metadata if isinstance(message.metadata, dict) else {}
+    if metadata.get('supersede_key') is not None:
+        return (message.webapp_endpoint, metadata['supersede_key'])
+    if message.command_name in SUPERSEDED_COMMANDS:
+        return (message.webapp_endpoint, metadata.get('df_id'), message.command_name, metadata.get('view_id'))
+    return None
+
+
+def is_past_deadline(message) -> bool:
+    """ `metadata['deadline']` is in milliseconds since epoch i.e. the same as javascript `Date.now()` """
+    metadata = message.metadata if isinstance(message.metadata, dict) else {}
+    deadline = metadata.get('deadline')
+    return deadline is not None and time.time()*1000 > deadline
+
+
+class RequestFilter:
+    """
+        Discard the queued requests which are superseded by a newer one or past their deadline, for the queue
+        of `EndpointWorker` and of `AsyncEndpointWorker`. A request is queued as the item of `create_item`,
+        `register` is called once it is queued and `should_skip` before it is handled. It is not thread safe.
+    """
+
+    def __init__(self):
+        ## the sequence number of the latest queued request of each supersession key #
+        self.latest_requests = {}
+        self.sequence = itertools.count()
+        self.superseded_count = 0
+        self.expired_count = 0
+
+    def create_item(self, message):
+        return (next(self.sequence), get_supersession_key(message), message)
+
+    def register(self, item):
+        sequence, key, _ = item
+        if key is not None:
+            self.latest_requests[key] = sequence
+
+    def should_skip(self, item) -> bool:
+        sequence, key, message = item
+        if key is not None:
+            if self.latest_requests.get(key) != sequence:
+                self.superseded_count += 1
+                log.info('Skip superseded request %s command: "%s"' %
+                         (message.webapp_endpoint, message.command_name))
+                return True
+            self.latest_requests.pop(key)
+        if is_past_deadline(message):
+            self.expired_count += 1
+            log.info('Skip request past its deadline %s command: "%s"' %
+                     (message.webapp_endpoint, message.command_name))
+            return True
+        return False
+
+    def get_stats(self, depth) -> dict:
+        return {'depth': depth, 'superseded': self.superseded_count, 'expired': self.expired_count}
+
+
+class EndpointWorker:
+    """
+        A bounded work queue served by a single worker thread, for one or several endpoints.
+        Messages are handled by `handle` in the order they are received.
+        Requests which are superseded or past their deadline are discarded before being handled.
+    """
+
+    def __init__(self, name, handle, p2n_queue, max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        self.name = name
+        self.handle = handle
+        self.p2n_queue = p2n_queue
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.request_filter = RequestFilter()
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, name='{}Worker'.format(name), daemon=True)
+        self.thread.start()
+
+    def put(self, message) -> bool:
+        with self.lock:
+            item = self.request_filter.create_item(message)
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                return False
+            self.request_filter.register(item)
+            return True
+
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return self.request_filter.get_stats(self.depth())
+
+    def _run(self):
+        log.info('Start worker for %s' % self.name)
+        while self.running:
+            item = self.queue.get()
+            if item is None:
+                break
+            message = item[2]
+            with self.lock:
+                skip = self.request_filter.should_skip(item)
+            if skip:
+                self.queue.task_done()
+                continue
+            try:
+                self.handle(message)
+            except OSError as error:  # TODO check if this has to do with buffer error
+                # since this error might be related to the pipe, we do not send this error to nodejs
+                log.error("OSError: %s" % (error))
+            except:
+                log.error("Failed to execute the command %s",
+                          traceback.format_exc())
+                error_message = BaseMessageHandler._create_error_message(
+                    message.webapp_endpoint, traceback.format_exc(), message.command_name)
+                BaseMessageHandler.send_message(self.p2n_queue, error_message)
+            finally:
+                self.queue.task_done()
+        log.info('Stop worker for %s' % self.name)
+
+    def stop(self):
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+
+class EndpointDispatcher:
+    """
+        Dispatch the messages from node server to the message handlers.
+        Each endpoint which does not use the kernel has its own bounded queue and worker thread so a slow
+        request on one endpoint does not block the others. The `KERNEL_ENDPOINTS` share one worker: their
+        requests run on the kernel one at a time in the order they are received. The `READ_ONLY_COMMANDS`
+        have a worker of their own, see `get_worker_name`.
+    """
+
+    def __init__(self, message_handler: dict, p2n_queue, max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
+        self.message_handler = message_handler
+        self.p2n_queue = p2n_queue
+        self.max_queue_size = max_queue_size
+        self.workers = {}
+        self.workers_lock = threading.Lock()
+
+    def _get_worker(self, name) -> EndpointWorker:
+        ## workers are created on the first message so endpoints which are not served through stdin don't get a thread #
+        with self.workers_lock:
+            if name not in self.workers:
+                handle = self._handle_read_only if name == READ_ONLY_WORKER else self._handle
+                self.workers[name] = EndpointWorker(
+                    name, handle, self.p2n_queue, self.max_queue_size)
+            return self.workers[name]
+
+    def _handle(self, message):
+        self.message_handler[message.webapp_endpoint].handle_message(message)
+
+    def _handle_read_only(self, message):
+        ## only answered while no other kernel request waits, so the answer has the changes of all the requests #
+        ## received before it except the one running #
+        kernel_worker = self._get_worker(KERNEL_WORKER)
+        if kernel_worker.depth() > 0 or not self.message_handler[message.webapp_endpoint].handle_read_only(message):
+            self._put(kernel_worker, message)
+
+    def dispatch(self, message) -> bool:
+        return self._put(self._get_worker(get_worker_name(message)), message)
+
+    def _put(self, worker, message) -> bool:
+        if worker.put(message):
+            log.info('Queued message for %s command: "%s", queue depth: %d' %
+                     (message.webapp_endpoint, message.command_name, worker.depth()))
+            return True
+
+        text = "Request queue of {} is full ({} messages)".format(
+            message.webapp_endpoint, self.max_queue_size)
+        log.error(text)
+        error_message = BaseMessageHandler._create_error_message(
+            message.webapp_endpoint, text, message.command_name, message.metadata)
+        BaseMessageHandler.send_message(self.p2n_queue, error_message)
+        return False
+
+    def get_stats(self) -> dict:
+        """ Return the queue depth and the number of skipped requests of each worker """
+        with self.workers_lock:
+            return {str(name): worker.get_stats() for name, worker in self.workers.items()}
+
+    def shutdown(self):
+        with self.workers_lock:
+            for worker in self.workers.values():
+                worker.stop()
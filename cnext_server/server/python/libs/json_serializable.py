@@ -1,5 +1,60 @@
+import math
 import simplejson as json
 
+## same as `SubContentType.APPLICATION_CNEXT`, this module is also imported inside ipython #
+CHUNKED_OUTPUT_MIME_TYPE = 'application/cnext+json'
+## same as `SubContentType.APPLICATION_JSON` #
+JSON_MIME_TYPE = 'application/json'
+## the text/plain of a result published as application/json, it is only there because ipython requires it #
+JSON_PLAIN_TEXT = '<%s>' % JSON_MIME_TYPE
+
+_PRIMITIVE_TYPES = {str, int, bool, type(None)}
+## the keys which json writes as literals #
+_JSON_KEY_LITERALS = {True: 'true', False: 'false', None: 'null'}
+
+
+def _to_json_key(key):
+    if type(key) is str:
+        return key
+    if key is None or type(key) is bool:
+        return _JSON_KEY_LITERALS[key]
+    if isinstance(key, float):
+        return json.dumps(float(key), ignore_nan=True)
+    return str(to_json_data(key))
+
+
+def to_json_data(obj):
+    """
+        Convert `obj` to the objects which json encodes as is, like `json.dumps(obj, default=lambda o: o.__dict__,
+        ignore_nan=True)` would encode it, so it can be put in a kernel message without being encoded twice.
+        Raise TypeError if an object can not be converted.
+    """
+    obj_type = type(obj)
+    if obj_type in _PRIMITIVE_TYPES:
+        return obj
+    if obj_type is list or obj_type is tuple:
+        ## e.g. the rows of a table page, most of them only have strings #
+        if set(map(type, obj)) <= _PRIMITIVE_TYPES:
+            return obj
+        return [to_json_data(value) for value in obj]
+    if isinstance(obj, dict):
+        return {_to_json_key(key): to_json_data(value) for key, value in obj.items()}
+    if isinstance(obj, float):
+        return float(obj) if math.isfinite(obj) else None
+    if isinstance(obj, (str, int)):
+        return obj
+    if isinstance(obj, (list, tuple)):
+        return [to_json_data(value) for value in obj]
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8')
+    ## numpy scalars #
+    if hasattr(obj, 'item') and hasattr(obj, 'dtype'):
+        return to_json_data(obj.item())
+    if hasattr(obj, '__dict__'):
+        return to_json_data(obj.__dict__)
+    raise TypeError('Object of type %s is not JSON serializable' %
+                    obj_type.__name__)
+
 
 class JsonSerializable:
     def __init__(self, obj):
@@ -8,6 +63,32 @@ class JsonSerializable:
     def toJSON(self):
         return json.dumps(self.obj, ignore_nan=True)
 
+    def _repr_mimebundle_(self, include=None, exclude=None):
+        """ 
+            Publish the object as application/json inside ipython, it is encoded once with the kernel message
+            instead of being encoded into text/plain and then encoded again as a string of the message
+        """
+        try:
+            data = to_json_data(self.obj)
+        except TypeError:
+            return {'text/plain': self.toJSON()}
+        if data is None:
+            return {'text/plain': 'null'}
+        return {JSON_MIME_TYPE: data, 'text/plain': JSON_PLAIN_TEXT}
+
+    def __repr__(self) -> str:
+        return self.toJSON()
+
+
+class JsonSections:
+    """ A dict of sections which are already serialized to JSON, the JSON of the dict is composed from them """
+
+    def __init__(self, sections: dict):
+        self.sections = sections
+
+    def toJSON(self):
+        return '{' + ', '.join('%s: %s' % (json.dumps(name), section) for name, section in self.sections.items()) + '}'
+
     def __repr__(self) -> str:
         return self.toJSON()
 
@@ -20,3 +101,22 @@ def ipython_internal_output(func):
         output = func(*args, **kwargs)
         return JsonSerializable(output)
     return json_serializable_output
+
+
+def ipython_chunked_output(func):
+    '''
+    Wrapper to publish the partial results yielded by `func` one by one inside ipython instead of returning
+    the whole result at once. Each chunk is sent as a display data of `application/cnext+json` with
+    an incrementing `seq_number` starting from 1. The last chunk has `final` set to True and no content.
+    The content of a chunk is converted with `to_json_data` and encoded with the kernel message.
+    '''
+    def chunked_output(*args, **kwargs):
+        from IPython.display import display
+        seq_number = 0
+        for chunk in func(*args, **kwargs):
+            seq_number += 1
+            display({CHUNKED_OUTPUT_MIME_TYPE: {'seq_number': seq_number, 'final': False,
+                                                'content': to_json_data(chunk)}}, raw=True)
+        display({CHUNKED_OUTPUT_MIME_TYPE: {'seq_number': seq_number + 1, 'final': True,
+                                            'content': None}}, raw=True)
+    return chunked_output
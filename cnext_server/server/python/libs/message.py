@@ -117,6 +117,11 @@ class JupyterServerCommand(str, Enum):
 class CodeEditorCommand(str, Enum):
     exec_line = 'exec_line'
     exec_grouped_lines = 'exec_grouped_lines'
+    ## the webapp does not send these two yet, they are only used by the clients of the server #
+    exec_stale_groups = 'exec_stale_groups'
+    exec_batch = 'exec_batch'
+    update_execution_stats = 'update_execution_stats'
+    update_memoization_status = 'update_memoization_status'
 
 
 class ContentType(str, Enum):
@@ -179,20 +184,153 @@ class CommandType(str, Enum):
         return str(self.value)
 
 
+## Messages to node server are sent either as a single json frame or, when the content carries large
+# binary or string payloads, as a header frame followed by one raw frame per payload. The header has the
+# form {'protocol': FRAMED_PROTOCOL, 'buffers': [{'path': [...], 'encoding': ...}], 'message': {...}}
+# where `path` locates the payload in the message. Node puts the payloads back before forwarding the message.
+# A buffer with a `compression` codec has to be decompressed first. #
+FRAMED_PROTOCOL = 'cnext.framed.v1'
+## strings shorter than this are kept inside the json header #
+MIN_FRAMED_STRING_SIZE = 64*1024
+
+
+class BufferEncoding(str, Enum):
+    BASE64 = 'base64'  # raw bytes, node gives them to the browser as a base64 string
+    UTF8 = 'utf-8'  # a large string lifted out of the json document
+    JSON = 'json'  # a json document e.g. the whole content of a large message
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return str(self.value)
+
+
+def _remove_buffers(obj, path, buffers, min_string_size):
+    """
+        Return `obj` with the binary and large string payloads replaced by None. The payloads and
+        their paths are appended to `buffers`. Containers are copied only if they hold a payload.
+    """
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        buffers.append((list(path), BufferEncoding.BASE64, obj))
+        return None
+    if isinstance(obj, str):
+        if len(obj) >= min_string_size:
+            buffers.append((list(path), BufferEncoding.UTF8, obj.encode('utf-8')))
+            return None
+        return obj
+    if isinstance(obj, dict):
+        new_obj = None
+        for key, value in obj.items():
+            path.append(key)
+            new_value = _remove_buffers(value, path, buffers, min_string_size)
+            path.pop()
+            if new_value is not value:
+                if new_obj is None:
+                    new_obj = dict(obj)
+                new_obj[key] = new_value
+        return obj if new_obj is None else new_obj
+    if isinstance(obj, (list, tuple)):
+        new_obj = None
+        for index, value in enumerate(obj):
+            path.append(index)
+            new_value = _remove_buffers(value, path, buffers, min_string_size)
+            path.pop()
+            if new_value is not value:
+                if new_obj is None:
+                    new_obj = list(obj)
+                new_obj[index] = new_value
+        return obj if new_obj is None else new_obj
+    return obj
+
+
+def _encode_default(obj):
+    if isinstance(obj, Message):
+        return obj.toDict()
+    if isinstance(obj, Enum):
+        return obj.value
+    return obj.__dict__
+
+
+## built once so that the encoder does not have to be recreated for every message #
+_message_encoder = json.JSONEncoder(default=_encode_default, ignore_nan=True)
+
+
 class Message:
-    def __init__(self, **entries):
-        self.webapp_endpoint = None
-        self.command_name = None
-        self.seq_number = None
-        self.type = None
-        self.sub_type = None
-        self.content = None
-        self.error = None
-        self.metadata = None
-        self.__dict__.update(entries)
+    """
+        The envelope of the messages exchanged with node server. The fields are fixed so the
+        message uses `__slots__` and is encoded with a precompiled encoder. `webapp_endpoint`,
+        `type` and `sub_type` are `str` enums which the encoder writes as plain strings.
+        Unknown fields are ignored.
+    """
+    __slots__ = ('webapp_endpoint', 'command_name', 'seq_number',
+                 'type', 'sub_type', 'content', 'error', 'metadata')
+
+    def __init__(self, webapp_endpoint=None, command_name=None, seq_number=None, type=None,
+                 sub_type=None, content=None, error=None, metadata=None, **entries):
+        self.webapp_endpoint = webapp_endpoint
+        self.command_name = command_name
+        self.seq_number = seq_number
+        self.type = type
+        self.sub_type = sub_type
+        self.content = content
+        self.error = error
+        self.metadata = metadata
+
+    def toDict(self):
+        return {'webapp_endpoint': self.webapp_endpoint,
+                'command_name': self.command_name,
+                'seq_number': self.seq_number,
+                'type': self.type,
+                'sub_type': self.sub_type,
+                'content': self.content,
+                'error': self.error,
+                'metadata': self.metadata}
 
     def toJSON(self):
-        return json.dumps(self, default=lambda o: o.__dict__, ignore_nan=True)
+        return _message_encoder.encode(self.toDict())
+
+    def toFrames(self, min_string_size=MIN_FRAMED_STRING_SIZE, compressor=None):
+        """
+            Serialize the message to a list of zmq frames. Messages without large payloads are
+            serialized to a single json frame so that they are the same as `toJSON`.
+            If `compressor` is given, a large content is sent as a json frame and the frames larger
+            than the compressor threshold are compressed except the raw bytes.
+        """
+        buffers = []
+        content = _remove_buffers(
+            self.content, ['content'], buffers, min_string_size)
+        if len(buffers) == 0:
+            frame = self.toJSON().encode('utf-8')
+            if compressor is None or not compressor.should_compress(frame):
+                return [frame]
+
+        if compressor is not None:
+            content_frame = _message_encoder.encode(content).encode('utf-8')
+            if compressor.should_compress(content_frame):
+                ## node has to put the content back before the buffers inside it #
+                buffers.insert(
+                    0, (['content'], BufferEncoding.JSON, content_frame))
+                content = None
+            elif len(buffers) == 0:
+                return [frame]
+
+        message = self.toDict()
+        message['content'] = content
+        descriptors = []
+        frames = [None]
+        for path, encoding, data in buffers:
+            descriptor = {'path': path, 'encoding': encoding}
+            if compressor is not None and encoding != BufferEncoding.BASE64 and compressor.should_compress(data):
+                data = compressor.compress(data)
+                descriptor['compression'] = compressor.codec
+            descriptors.append(descriptor)
+            frames.append(data)
+        header = {'protocol': FRAMED_PROTOCOL,
+                  'buffers': descriptors,
+                  'message': message}
+        frames[0] = _message_encoder.encode(header).encode('utf-8')
+        return frames
 
     def __repr__(self) -> str:
         return self.toJSON()
@@ -1,6 +1,7 @@
 import traceback
 import simplejson as json
 from libs.message import ContentType, Message, SubContentType
+from libs.json_serializable import JSON_MIME_TYPE
 from libs import logs
 # from server.python.libs.message import WebappEndpoint
 # from user_space.user_space import BaseKernel, IPythonUserSpace
@@ -65,21 +66,29 @@ class BaseMessageHandler:
     #                 result = message['content']['data'][SubContentType.APPLICATION_PLOTLY]
     #     return result
 
+    @staticmethod
+    def get_json_result(data):
+        """
+            Get the result of an internal execution from the data of its execute_result.
+            `JsonSerializable` is published as 'application/json' which is already decoded with the message,
+            the other results e.g. the JsonSerializable of cnextlib are JSON in 'text/plain'
+        """
+        if JSON_MIME_TYPE in data:
+            return data[JSON_MIME_TYPE]
+        if data['text/plain'] is not None:
+            return json.loads(data['text/plain'])
+        return None
+
     @staticmethod
     def get_execute_result(message):
         """
             Get result from list of messages are responsed by IPython kernel
-            For result type rather than 'application/json' we have to convert the output
-            to the original object before sending to client because we already json.dumps
-            them inside ipython. A better way to handle this is to output 'application/json' 
-            instead. That will be done later.
+            See `get_json_result` for the results of the internal executions
         """
         result = None
         log.info('Message type %s' % message.header['msg_type'])
         if message.header['msg_type'] == IPythonConstants.MessageType.EXECUTE_RESULT:
-            if message.content['data']['text/plain'] is not None:
-                result = message.content['data']['text/plain']
-                result = json.loads(result)
+            result = BaseMessageHandler.get_json_result(message.content['data'])
         # elif message['header']['msg_type'] == IPythonConstants.MessageType.STREAM:
         #     # log.info('Stream result: %s' % result)
         #     if 'text' in message['content']:
@@ -130,7 +139,7 @@ class BaseMessageHandler:
 
     @staticmethod
     def send_message(channel, message: Message):
-        channel.send(message.toJSON())
+        channel.send_message(message)
 
     def handle_message(self, message):
         ''' `ext_globals` is the user namespace where the user executes their command'''
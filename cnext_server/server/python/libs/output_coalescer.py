@@ -0,0 +1,102 @@
+import collections
+import threading
+import time
+
+from libs import logs
+from user_space.ipython.constants import IPythonConstants
+
+log = logs.get_logger(__name__)
+
+DEFAULT_COALESCING_WINDOW = 0.03  # unit: second
+
+
+class OutputCoalescer:
+    """
+        Merge the outputs of an execution before they are sent to node server.
+        Consecutive stream chunks with the same key are concatenated and `update_display_data`
+        messages with the same key are collapsed to the latest one. Pending outputs are sent when the
+        window expires or when a message which can't be coalesced arrives e.g. the `idle` status, so
+        the order of the outputs is preserved.
+        Keys are created with `stream_key` and `display_key`. A window of 0 disables coalescing.
+    """
+
+    def __init__(self, send, window=DEFAULT_COALESCING_WINDOW):
+        self.send = send
+        self.window = window
+        self.pending = collections.OrderedDict()
+        self.last_key = None
+        self.deadline = None
+        self.cond = threading.Condition()
+        self.received_count = 0
+        self.merged_count = 0
+        if self.window > 0:
+            flush_thread = threading.Thread(
+                target=self._flush_expired, daemon=True)
+            flush_thread.start()
+
+    @staticmethod
+    def stream_key(request_msg_id, stream_name):
+        return (IPythonConstants.MessageType.STREAM, request_msg_id, stream_name)
+
+    @staticmethod
+    def display_key(display_id):
+        return (IPythonConstants.MessageType.UPDATE_DISPLAY_DATA, display_id)
+
+    def _merge(self, key, message) -> bool:
+        if key not in self.pending:
+            return False
+        if key[0] == IPythonConstants.MessageType.STREAM:
+            ## only consecutive chunks are merged, otherwise the order of the outputs would change #
+            if key != self.last_key:
+                return False
+            self.pending[key].content += message.content
+        else:
+            self.pending[key] = message
+        return True
+
+    def put(self, message, key=None):
+        with self.cond:
+            self.received_count += 1
+            if key is None or self.window <= 0:
+                self._flush()
+                self.send(message)
+                return
+
+            if self._merge(key, message):
+                self.merged_count += 1
+            else:
+                if key in self.pending:
+                    self._flush()
+                self.pending[key] = message
+            self.last_key = key
+
+            if self.deadline is None:
+                self.deadline = time.monotonic() + self.window
+                self.cond.notify()
+
+    def _flush(self):
+        for message in self.pending.values():
+            self.send(message)
+        self.pending.clear()
+        self.last_key = None
+        self.deadline = None
+
+    def flush(self):
+        with self.cond:
+            self._flush()
+
+    def _flush_expired(self):
+        with self.cond:
+            while True:
+                if self.deadline is None:
+                    self.cond.wait()
+                else:
+                    timeout = self.deadline - time.monotonic()
+                    if timeout > 0:
+                        self.cond.wait(timeout)
+                    else:
+                        self._flush()
+
+    def get_stats(self) -> dict:
+        with self.cond:
+            return {'received': self.received_count, 'merged': self.merged_count}
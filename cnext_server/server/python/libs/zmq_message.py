@@ -33,25 +33,68 @@ import zmq
 #         return self.pull.recv()
 
 
+import copy
+import queue
+import threading
+import traceback
+from libs import logs
 from libs.config import read_config
 from project_manager.interfaces import SERVER_CONFIG_PATH
+from user_space.ipython.constants import IPythonConstants
+log = logs.get_logger(__name__)
 config = read_config(SERVER_CONFIG_PATH, {'code_executor_comm': {
     'host': '127.0.0.1', 'n2p_port': 5001, 'p2n_port': 5002}})
 
+CLOSE_TIMEOUT = 1  # unit: second
+## maximum number of messages waiting to be sent, the callers wait when it is reached #
+DEFAULT_MAX_BACKLOG = 10000
+
 
 class MessageQueuePush:
-    def __init__(self, host, port, hwm=1000):
+    """
+        Send messages to node server. Messages are put in an outbound queue and sent by a sender thread
+        so the callers e.g. the kernel stream threads never block on the socket.
+        When the queue depth reaches `hwm`, stream outputs are dropped and replaced by a single
+        "N lines truncated" message, sent with the next message or when the queue drains. Control and
+        result messages are never dropped, their callers wait when the depth reaches `max_backlog`.
+    """
+
+    def __init__(self, host, port, hwm=1000, framed=True, compressor=None, max_backlog=DEFAULT_MAX_BACKLOG):
         self.context = zmq.Context()
         self.host = host
         self.port = port
         self.addr = '{}:{}'.format(self.host, self.port)
+        ## send large payloads in separate frames, see `Message.toFrames` #
+        self.framed = framed
+        ## compress large payloads, only used with `framed` #
+        self.compressor = compressor
+        self.hwm = hwm
         self.push: zmq.Socket = self.context.socket(zmq.PUSH)
+        self.push.setsockopt(zmq.SNDHWM, hwm)
         self.push.connect(self.addr)
 
+        self.queue = queue.Queue(maxsize=max(max_backlog, hwm + 1))
+        self.lock = threading.Lock()
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.blocked_count = 0
+        self.dropped_lines = 0
+        ## the last dropped message, used as the template of the truncated message #
+        self.truncated_message = None
+        self.sender_thread = threading.Thread(
+            target=self._send_queued_messages, daemon=True)
+        self.sender_thread.start()
+
     def get_socket(self):
         return self.push
 
     def close(self):
+        ## let the sender thread send what is left in the queue #
+        try:
+            self.queue.put(None, timeout=CLOSE_TIMEOUT)
+        except queue.Full:
+            pass
+        self.sender_thread.join(timeout=CLOSE_TIMEOUT)
         self.push.disconnect(self.addr)
         # self.context.term()
 
@@ -62,6 +105,81 @@ class MessageQueuePush:
         res = self.push.send_string(message)
         return res
 
+    def send_frames(self, frames):
+        return self.push.send_multipart(frames)
+
+    @staticmethod
+    def _is_droppable(message) -> bool:
+        return not message.error and isinstance(message.content, str) and isinstance(message.metadata, dict) and \
+            message.metadata.get('msg_type') == IPythonConstants.MessageType.STREAM
+
+    def _create_truncated_message(self):
+        message = copy.copy(self.truncated_message)
+        message.content = '\n... {} lines truncated ...\n'.format(
+            self.dropped_lines)
+        return message
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            ## node server does not read fast enough, wait instead of growing the backlog without bound #
+            self.blocked_count += 1
+            log.warning('Outbound queue is full (%d messages), waiting for node server' %
+                        self.queue.maxsize)
+            self.queue.put(message)
+
+    def _put_truncated_message(self):
+        log.info('Outbound queue is full, %d lines truncated' %
+                 self.dropped_lines)
+        self._put(self._create_truncated_message())
+        self.truncated_message = None
+        self.dropped_lines = 0
+
+    def send_message(self, message) -> bool:
+        """ Queue the message to be sent. Return False if the message is dropped """
+        with self.lock:
+            if self._is_droppable(message) and self.queue.qsize() >= self.hwm:
+                self.dropped_count += 1
+                self.dropped_lines += max(message.content.count('\n'), 1)
+                self.truncated_message = message
+                return False
+
+            if self.truncated_message is not None:
+                self._put_truncated_message()
+            self._put(message)
+            return True
+
+    def _flush_truncated_message(self):
+        ## the output may end with dropped messages, their marker is sent once the queue drains. The lock is only
+        # taken when the queue is empty so a caller waiting for room in the queue never blocks the sender #
+        if self.truncated_message is None or not self.queue.empty():
+            return
+        with self.lock:
+            if self.truncated_message is not None:
+                self._put_truncated_message()
+
+    def _send_queued_messages(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            try:
+                if self.framed:
+                    self.send_frames(message.toFrames(
+                        compressor=self.compressor))
+                else:
+                    self.send(message.toJSON())
+                self.sent_count += 1
+            except:
+                log.error("Failed to send message %s" %
+                          traceback.format_exc())
+            self._flush_truncated_message()
+
+    def get_stats(self) -> dict:
+        return {'depth': self.queue.qsize(), 'hwm': self.hwm, 'sent': self.sent_count, 'dropped': self.dropped_count,
+                'blocked': self.blocked_count}
+
 
 class MessageQueuePull:
     def __init__(self, host, port):
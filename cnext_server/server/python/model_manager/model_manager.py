@@ -12,7 +12,7 @@ from libs.message_handler import BaseMessageHandler
 from libs import logs
 from libs.message import Message, WebappEndpoint, ModelManagerCommand
 from model_manager.interfaces import ModelInfo, NetronStatus
-from user_space.ipython.constants import IPythonConstants
+from user_space.ipython.constants import IPythonConstants, ExecutionMode
 log = logs.get_logger(__name__)
 
 
@@ -82,7 +82,7 @@ class MessageHandler(BaseMessageHandler):
             if os.path.exists(MODEL_PATH):
                 os.remove(MODEL_PATH)
             code = '{}.save("{}")'.format(modelInfo.name, MODEL_PATH)
-            self.user_space.execute(code, None, self._message_handler_callback)
+            self.user_space.execute(code, ExecutionMode.EXEC, self._message_handler_callback)
         elif modelInfo.base_class == "torch.nn.modules.module.Module":
             MODEL_PATH = os.path.join(
                 self.netron_tmp_dir, '{}.onnx'.format(modelInfo.name))
@@ -90,7 +90,7 @@ class MessageHandler(BaseMessageHandler):
                 os.remove(MODEL_PATH)
             code = 'torch.onnx.export({}, {}.createInput(), f="{}", training=False)'.format(
                 modelInfo.name, modelInfo.name, MODEL_PATH)
-            self.user_space.execute(code, None, self._message_handler_callback)
+            self.user_space.execute(code, ExecutionMode.EXEC, self._message_handler_callback)
         return MODEL_PATH
 
     def _start_netron_server(self, model_path) -> NetronStatus:
@@ -22,11 +22,16 @@ from logs_manager import logs_manager as lm
 from environment_manager import environment_manager as envm
 from jupyter_server_manager import jupyter_server_manager as jsm
 from libs.zmq_message import MessageQueuePush, MessageQueuePull
+from libs.dispatcher import EndpointDispatcher, DEFAULT_MAX_QUEUE_SIZE
+from libs.async_core import AsyncServerCore
+from libs.output_coalescer import DEFAULT_COALESCING_WINDOW
+from libs.compression import PayloadCompressor
 from libs.message import Message, WebappEndpoint, ExecutorManagerCommand, ExecutorType
 from libs.message_handler import BaseMessageHandler
 from libs.constants import TrackingModelType, TrackingDataframeType
 from project_manager.interfaces import SERVER_CONFIG_PATH, WORKSPACE_METADATA_PATH, WorkspaceMetadata
 from user_space.user_space import IPythonUserSpace, BaseKernelUserSpace
+from user_space.ipython.kernel_pool import KernelPool
 
 
 log = logs.get_logger(__name__)
@@ -35,12 +40,13 @@ log = logs.get_logger(__name__)
 class ShutdownSignalHandler:
     running = True
 
-    def __init__(self, message_handler, user_space, p2n_queue):
+    def __init__(self, message_handler, user_space, p2n_queue, dispatcher=None):
         signal.signal(signal.SIGINT, self.exit_gracefully)
         signal.signal(signal.SIGTERM, self.exit_gracefully)
         self.user_space = user_space
         self.message_handler = message_handler
         self.p2n_queue = p2n_queue
+        self.dispatcher = dispatcher
 
     def get_running_status(self):
         return self.running
@@ -48,6 +54,9 @@ class ShutdownSignalHandler:
     def exit_gracefully(self, *args):
         log.info('ShutdownSignalHandler {}'.format(args))
 
+        if self.dispatcher != None:
+            self.dispatcher.shutdown()
+
         if self.message_handler != None:
             for key, value in self.message_handler.items():
                 log.info('Shutdown {}'.format(key))
@@ -89,8 +98,18 @@ def main(argv):
             message_handler = None
             try:
                 p2n_queue = MessageQueuePush(
-                    server_config.p2n_comm['host'], server_config.p2n_comm['port'])
+                    server_config.p2n_comm['host'], server_config.p2n_comm['port'],
+                    hwm=server_config.p2n_comm.get('hwm', 1000),
+                    framed=server_config.p2n_comm.get('framed', True),
+                    compressor=PayloadCompressor.from_config(server_config.p2n_comm.get('compression')))
                 jupyter_server_config = server_config.jupyter_server
+                code_editor_config = server_config.code_editor if hasattr(
+                    server_config, 'code_editor') else {}
+                async_core_config = server_config.async_core if hasattr(
+                    server_config, 'async_core') else {}
+                use_async_core = async_core_config.get('enabled', False)
+                execution_stats_config = server_config.execution_stats if hasattr(
+                    server_config, 'execution_stats') else {}
 
                 if executor_type == ExecutorType.CODE:
                     # user_space = IPythonUserSpace(
@@ -99,6 +118,15 @@ def main(argv):
                         (TrackingDataframeType.PANDAS,
                          TrackingDataframeType.CNEXT, TrackingDataframeType.DASK, TrackingDataframeType.SPARK),
                         (TrackingModelType.PYTORCH_NN, TrackingModelType.TENSORFLOW_KERAS))
+                    user_space.set_kernel_pool(KernelPool.from_config(
+                        server_config.kernel_pool if hasattr(server_config, 'kernel_pool') else None))
+                    user_space.set_introspection_config(
+                        server_config.introspection if hasattr(server_config, 'introspection') else None)
+                    user_space.set_forked_analysis_config(
+                        server_config.forked_analysis if hasattr(server_config, 'forked_analysis') else None)
+                    user_space.set_execution_stats_config(execution_stats_config)
+                    user_space.set_memoization_config(
+                        server_config.memoization if hasattr(server_config, 'memoization') else None)
 
                     ## start an ipython kernel with a default spec or spec from the config #
                     if hasattr(server_config, 'default_ipython_kernel_spec'):
@@ -117,7 +145,9 @@ def main(argv):
                     #     p2n_queue, user_space)
 
                     message_handler = {
-                        WebappEndpoint.CodeEditor: ce.MessageHandler(p2n_queue, user_space),
+                        WebappEndpoint.CodeEditor: ce.MessageHandler(p2n_queue, user_space, code_editor_config.get(
+                            'output_coalescing_window', DEFAULT_COALESCING_WINDOW), execution_stats_config.get(
+                            'history_size', ce.DEFAULT_STATS_HISTORY_SIZE)),
                         ## DataViewer and DataFrameManager use the same handler#
                         WebappEndpoint.DataFrameManager: dm.MessageHandler(p2n_queue, user_space),
                         WebappEndpoint.DataViewer: dm.MessageHandler(p2n_queue, user_space),
@@ -127,7 +157,7 @@ def main(argv):
                             p2n_queue, user_space),
                         WebappEndpoint.EnvironmentManager: envm.MessageHandler(p2n_queue, user_space),
                         WebappEndpoint.ExecutorManager: execm.MessageHandler(
-                            p2n_queue, user_space)
+                            p2n_queue, user_space, control_thread=not use_async_core)
                     }
 
                     set_executor_working_dir(user_space, workspace_metadata)
@@ -147,9 +177,37 @@ def main(argv):
                 log.error("%s - %s" % (error, traceback.format_exc()))
                 exit(0)
 
+            dispatcher_config = server_config.dispatcher if hasattr(
+                server_config, 'dispatcher') else {}
+            max_queue_size = dispatcher_config.get(
+                'max_queue_size', DEFAULT_MAX_QUEUE_SIZE)
+            if use_async_core:
+                ## the event loop owns stdin and the kernel control socket #
+                control_handler = message_handler.get(
+                    WebappEndpoint.ExecutorManager)
+                control_addr = '{}:{}'.format(server_config.n2p_comm['host'], server_config.n2p_comm[
+                    'kernel_control_port']) if control_handler is not None else None
+                dispatcher = AsyncServerCore(
+                    message_handler, p2n_queue, max_queue_size, control_addr, control_handler)
+            else:
+                dispatcher = EndpointDispatcher(
+                    message_handler, p2n_queue, max_queue_size)
+            if WebappEndpoint.ExecutorManager in message_handler:
+                message_handler[WebappEndpoint.ExecutorManager].set_dispatcher(
+                    dispatcher)
+
             shutdowHandler = ShutdownSignalHandler(
-                message_handler, user_space, p2n_queue)
+                message_handler, user_space, p2n_queue, dispatcher)
             # this condition here is meaningless for now because the process will be exit inside ShutdownSignalHandler.exit_gracefully already
+            if use_async_core:
+                try:
+                    dispatcher.run()
+                except Exception as error:
+                    log.error("Exception %s - %s" %
+                              (error, traceback.format_exc()))
+                    shutdowHandler.exit_gracefully()
+                return
+
             try:
                 # while shutdowHandler.running:
                 for line in sys.stdin:
@@ -164,20 +222,15 @@ def main(argv):
                                 log_content = message.content
                         log.info('Got message from %s command: "%s", content: \'%s\'' %
                                  (message.webapp_endpoint, message.command_name, log_content))
-                        message_handler[message.webapp_endpoint].handle_message(
-                            message)
-                    except OSError as error:  # TODO check if this has to do with buffer error
-                        # since this error might be related to the pipe, we do not send this error to nodejs
-                        log.error("OSError: %s" % (error))
-
+                        ## the message is handled in the worker thread of its endpoint #
+                        dispatcher.dispatch(message)
                     except:
-                        log.error("Failed to execute the command %s",
+                        log.error("Failed to dispatch the command %s",
                                   traceback.format_exc())
                         message = BaseMessageHandler._create_error_message(
                             message.webapp_endpoint, traceback.format_exc(), message.command_name)
                         # send_to_node(message)
-                        BaseMessageHandler.send_message(
-                            p2n_queue, message.toJSON())
+                        BaseMessageHandler.send_message(p2n_queue, message)
 
                     try:
                         sys.stdout.flush()
@@ -0,0 +1,79 @@
+import unittest
+
+from code_editor.dataflow import CodeGroup, DataflowGraph, ExecutionLog
+from user_space.ipython.constants import IPythonConstants
+
+OK = IPythonConstants.ShellMessageStatus.OK
+
+
+def create_groups(codes):
+    return [CodeGroup(index, code) for index, code in enumerate(codes)]
+
+
+class DataflowGraphTest(unittest.TestCase):
+    def get_downstream(self, codes, root):
+        return DataflowGraph(create_groups(codes)).get_downstream({root})
+
+    def test_method_call_changes_its_object(self):
+        codes = ["import pandas as pd\ndf = pd.DataFrame({'a': [1, None]})",
+                 "df.dropna(inplace=True)",
+                 "total = df['a'].sum()"]
+        self.assertEqual(self.get_downstream(codes, 1), [1, 2])
+
+    def test_method_call_on_an_attribute_or_item(self):
+        codes = ["values = {'a': []}", "values['a'].append(1)", "print(values)"]
+        self.assertEqual(self.get_downstream(codes, 1), [1, 2])
+        codes = ["d = {}", "d.update(a=1)", "n = len(d)"]
+        self.assertEqual(self.get_downstream(codes, 1), [1, 2])
+
+    def test_item_and_attribute_assignments(self):
+        codes = ["df = make()", "df['b'] = 1", "obj.name = 'x'", "print(df, obj)"]
+        self.assertEqual(self.get_downstream(codes, 1), [1, 3])
+        self.assertEqual(self.get_downstream(codes, 2), [2, 3])
+
+    def test_module_calls_do_not_chain_groups(self):
+        codes = ["import numpy as np", "a = np.zeros(3)", "b = np.ones(3)"]
+        self.assertEqual(self.get_downstream(codes, 1), [1])
+
+    def test_assignment_in_a_function_is_local(self):
+        codes = ["x = 1", "def f():\n    x = 2\n    values.append(x)", "print(x)"]
+        self.assertEqual(self.get_downstream(codes, 1), [1])
+
+
+class ExecutionLogTest(unittest.TestCase):
+    def test_edited_mutation_makes_its_readers_stale(self):
+        codes = ["lst = []", "lst.append(1)", "n = len(lst)", "other = 1"]
+        log = ExecutionLog()
+        for group in create_groups(codes):
+            log.record('file.py', group.key, group.code, OK)
+        codes[1] = "lst.append(2)"
+        self.assertEqual(log.get_stale('file.py', create_groups(codes)), [1, 2])
+
+    @staticmethod
+    def create_line_groups(codes, first_line=0):
+        return [CodeGroup((first_line + index, first_line + index + 1), code, {'fromLine': first_line + index,
+                                                                               'toLine': first_line + index + 1})
+                for index, code in enumerate(codes)]
+
+    def test_groups_by_line_range_move_after_an_insert(self):
+        codes = ["x = 1", "y = x + 1", "print(y)"]
+        log = ExecutionLog()
+        for group in self.create_line_groups(codes):
+            log.record('file.py', group.key, group.code, OK)
+        groups = self.create_line_groups(["import os"] + codes)
+        self.assertEqual(log.get_stale('file.py', groups), [])
+        groups = self.create_line_groups(["import os", "x = 2"] + codes[1:])
+        self.assertEqual(log.get_stale('file.py', groups), [1, 2, 3])
+
+    def test_group_executed_again_after_moving(self):
+        codes = ["x = 1", "y = x + 1"]
+        log = ExecutionLog()
+        for group in self.create_line_groups(codes):
+            log.record('file.py', group.key, group.code, OK)
+        groups = self.create_line_groups(codes, first_line=5)
+        log.record('file.py', groups[0].key, groups[0].code, OK)
+        self.assertEqual(log.get_stale('file.py', groups), [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
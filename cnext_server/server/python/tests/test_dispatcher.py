@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from libs.async_core import AsyncEndpointWorker
+from libs.dispatcher import EndpointWorker, get_supersession_key
+from libs.message import DFManagerCommand, Message, WebappEndpoint
+
+
+class MessageQueue:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, message):
+        self.messages.append(message)
+
+
+def create_message(command_name, **metadata):
+    return Message(webapp_endpoint=WebappEndpoint.DataFrameManager, command_name=command_name, metadata=metadata)
+
+
+def create_page_request(df_id, from_index):
+    return create_message(DFManagerCommand.get_table_data, df_id=df_id, from_index=from_index)
+
+
+def get_expired_deadline():
+    return time.time()*1000 - 1000
+
+
+class SupersessionKeyTest(unittest.TestCase):
+    def test_table_pages_are_superseded_by_dataframe(self):
+        self.assertEqual(get_supersession_key(create_page_request('df', 0)),
+                         get_supersession_key(create_page_request('df', 100)))
+        self.assertNotEqual(get_supersession_key(create_page_request('df', 0)),
+                            get_supersession_key(create_page_request('other', 0)))
+
+    def test_client_key_and_commands_which_are_not_superseded(self):
+        self.assertEqual(get_supersession_key(create_message('any', supersede_key='k')),
+                         (WebappEndpoint.DataFrameManager, 'k'))
+        self.assertIsNone(get_supersession_key(create_message(DFManagerCommand.get_df_metadata, df_id='df')))
+
+
+class EndpointWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.release = threading.Event()
+        self.worker = EndpointWorker('Test', self.handle, MessageQueue())
+
+    def tearDown(self):
+        self.release.set()
+        self.worker.stop()
+
+    def handle(self, message):
+        ## the first request blocks the worker so the others are queued behind it #
+        if not self.handled:
+            self.release.wait(5)
+        self.handled.append(message)
+
+    def run_queued(self, messages):
+        for message in messages:
+            self.assertTrue(self.worker.put(message))
+        self.release.set()
+        self.worker.queue.join()
+        return self.handled
+
+    def test_queued_page_is_superseded_by_a_newer_one(self):
+        blocking = create_message('blocking')
+        messages = [blocking, create_page_request('df', 0), create_page_request('other', 0),
+                    create_page_request('df', 100)]
+        self.assertEqual(self.run_queued(messages), [blocking, messages[2], messages[3]])
+        self.assertEqual(self.worker.get_stats(), {'depth': 0, 'superseded': 1, 'expired': 0})
+
+    def test_request_past_its_deadline_is_skipped(self):
+        messages = [create_message('blocking'), create_message('late', deadline=get_expired_deadline()),
+                    create_message('on time', deadline=time.time()*1000 + 60000)]
+        self.assertEqual([message.command_name for message in self.run_queued(messages)],
+                         ['blocking', 'on time'])
+        self.assertEqual(self.worker.get_stats(), {'depth': 0, 'superseded': 0, 'expired': 1})
+
+    def test_full_queue_rejects_the_request(self):
+        worker = EndpointWorker('Full', self.handle, MessageQueue(), max_queue_size=1)
+        try:
+            worker.put(create_message('blocking'))
+            deadline = time.monotonic() + 5
+            while worker.depth() > 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(worker.put(create_message('queued')))
+            self.assertFalse(worker.put(create_message('rejected')))
+        finally:
+            self.release.set()
+            worker.stop()
+
+
+class AsyncEndpointWorkerTest(unittest.TestCase):
+    def run_queued(self, messages):
+        handled = []
+
+        async def run():
+            release = asyncio.Event()
+
+            async def handle(message):
+                if not handled:
+                    await release.wait()
+                handled.append(message)
+
+            worker = AsyncEndpointWorker('Test', handle, MessageQueue())
+            for message in messages:
+                self.assertTrue(worker.put(message))
+            ## let the worker take the first request before it is released #
+            await asyncio.sleep(0)
+            release.set()
+            ## wait until every request is handled or skipped #
+            while len(handled) + worker.request_filter.superseded_count + worker.request_filter.expired_count < \
+                    len(messages):
+                await asyncio.sleep(0.001)
+            worker.stop()
+            return worker.get_stats()
+
+        return handled, asyncio.run(asyncio.wait_for(run(), 5))
+
+    def test_queued_page_is_superseded_by_a_newer_one(self):
+        blocking = create_message('blocking')
+        messages = [blocking, create_page_request('df', 0), create_page_request('df', 100)]
+        handled, stats = self.run_queued(messages)
+        self.assertEqual(handled, [blocking, messages[2]])
+        self.assertEqual(stats, {'depth': 0, 'superseded': 1, 'expired': 0})
+
+    def test_request_past_its_deadline_is_skipped(self):
+        messages = [create_message('blocking'), create_message('late', deadline=get_expired_deadline()),
+                    create_message('next')]
+        handled, stats = self.run_queued(messages)
+        self.assertEqual([message.command_name for message in handled], ['blocking', 'next'])
+        self.assertEqual(stats, {'depth': 0, 'superseded': 0, 'expired': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import decimal
+import unittest
+
+import numpy as np
+import simplejson as json
+
+from libs.json_serializable import JSON_MIME_TYPE, JSON_PLAIN_TEXT, JsonSerializable, to_json_data
+
+
+class Status:
+    def __init__(self, name, values):
+        self.name = name
+        self.values = values
+
+
+def encode(obj):
+    """ The encoding `to_json_data` replaces """
+    return json.loads(json.dumps(obj, default=lambda o: o.__dict__, ignore_nan=True))
+
+
+class ToJsonDataTest(unittest.TestCase):
+    def assertEncodedAsJson(self, obj):
+        self.assertEqual(json.loads(json.dumps(to_json_data(obj))), encode(obj))
+
+    def test_same_as_json_encoding(self):
+        self.assertEncodedAsJson({'rows': [('a', 1), ('b', None)], 'count': 2, 'valid': True})
+        self.assertEncodedAsJson([float('nan'), float('inf'), -0.5, 'x'])
+        self.assertEncodedAsJson({'df': Status('df', [1.5, float('nan')]), 'nested': [{'s': Status('s', ())}]})
+
+    def test_dict_keys_are_converted_like_json(self):
+        self.assertEncodedAsJson({1: 'int', 1.5: 'float', None: 'none', False: 'bool', 1e20: 'exponent'})
+
+    def test_numpy_scalars_are_converted(self):
+        data = to_json_data({'int': np.int64(3), 'float': np.float32(0.5), 'nan': np.float64('nan'),
+                             'bool': np.bool_(True), 'values': [np.int8(1), 'a']})
+        self.assertEqual(data, {'int': 3, 'float': 0.5, 'nan': None, 'bool': True, 'values': [1, 'a']})
+        self.assertIs(type(data['int']), int)
+
+    def test_list_of_primitives_is_not_copied(self):
+        row = ['a', 1, None, True]
+        self.assertIs(to_json_data(row), row)
+
+    def test_object_which_can_not_be_converted(self):
+        with self.assertRaises(TypeError):
+            to_json_data({'set': {1, 2}})
+
+
+class JsonSerializableTest(unittest.TestCase):
+    def test_mimebundle_has_the_json_data(self):
+        bundle = JsonSerializable({'a': float('nan')})._repr_mimebundle_()
+        self.assertEqual(bundle, {JSON_MIME_TYPE: {'a': None}, 'text/plain': JSON_PLAIN_TEXT})
+
+    def test_mimebundle_falls_back_to_text(self):
+        ## simplejson encodes the decimals, `to_json_data` does not convert them #
+        self.assertEqual(JsonSerializable({'a': decimal.Decimal('1.5')})._repr_mimebundle_(),
+                         {'text/plain': '{"a": 1.5}'})
+        self.assertEqual(JsonSerializable(None)._repr_mimebundle_(), {'text/plain': 'null'})
+
+
+if __name__ == '__main__':
+    unittest.main()
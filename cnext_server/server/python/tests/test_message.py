@@ -0,0 +1,78 @@
+import base64
+import unittest
+import zlib
+
+import simplejson as json
+
+from libs.compression import PayloadCompressor, CompressionCodec
+from libs.message import FRAMED_PROTOCOL, Message
+
+
+def decode_frames(frames):
+    """ Same as `decodeExecutorMessage` of server.js """
+    if len(frames) == 1:
+        return json.loads(frames[0])
+    header = json.loads(frames[0])
+    assert header['protocol'] == FRAMED_PROTOCOL
+    message = header['message']
+    for buffer, data in zip(header['buffers'], frames[1:]):
+        if buffer.get('compression') == CompressionCodec.ZLIB:
+            data = zlib.decompress(data)
+        if buffer['encoding'] == 'base64':
+            value = base64.b64encode(data).decode('ascii')
+        elif buffer['encoding'] == 'json':
+            value = json.loads(data.decode('utf-8'))
+        else:
+            value = data.decode('utf-8')
+        parent = message
+        for key in buffer['path'][:-1]:
+            parent = parent[key]
+        parent[buffer['path'][-1]] = value
+    return message
+
+
+def create_message(content):
+    return Message(webapp_endpoint='CodeEditor', command_name='exec_line', seq_number=1, type='dict',
+                   sub_type='none', content=content, error=False, metadata={'line_range': {'fromLine': 0}})
+
+
+class ToFramesTest(unittest.TestCase):
+    def test_small_message_is_one_json_frame(self):
+        message = create_message({'text/plain': 'x = 1'})
+        frames = message.toFrames()
+        self.assertEqual(frames, [message.toJSON().encode('utf-8')])
+        self.assertEqual(decode_frames(frames), message.toDict())
+
+    def test_bytes_and_large_strings_round_trip(self):
+        image = bytes(range(256)) * 4
+        text = 'a' * 100
+        message = create_message({'image/png': image, 'outputs': [text, {'text/html': text}]})
+        frames = message.toFrames(min_string_size=64)
+        self.assertEqual(len(frames), 4)
+        decoded = decode_frames(frames)
+        self.assertEqual(decoded['content'], {'image/png': base64.b64encode(image).decode('ascii'),
+                                              'outputs': [text, {'text/html': text}]})
+        self.assertEqual(decoded['metadata'], message.metadata)
+        ## the content of the message is not changed #
+        self.assertIs(message.content['image/png'], image)
+
+    def test_compressed_content_round_trip(self):
+        image = b'\x00' * 2048
+        message = create_message({'text/plain': 'b' * 4096, 'image/png': image})
+        compressor = PayloadCompressor(CompressionCodec.ZLIB, threshold=1024)
+        frames = message.toFrames(min_string_size=64*1024, compressor=compressor)
+        header = json.loads(frames[0])
+        ## the content is put back before the bytes inside it, which are never compressed #
+        self.assertEqual(header['buffers'], [{'path': ['content'], 'encoding': 'json', 'compression': 'zlib'},
+                                             {'path': ['content', 'image/png'], 'encoding': 'base64'}])
+        self.assertEqual(decode_frames(frames)['content'], {'text/plain': 'b' * 4096,
+                                                            'image/png': base64.b64encode(image).decode('ascii')})
+
+    def test_content_below_the_threshold_is_not_compressed(self):
+        message = create_message({'text/plain': 'c' * 100})
+        compressor = PayloadCompressor(CompressionCodec.ZLIB, threshold=1024)
+        self.assertEqual(message.toFrames(compressor=compressor), [message.toJSON().encode('utf-8')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import unittest
+
+from libs.message import Message
+from libs.output_coalescer import OutputCoalescer
+
+STDOUT = OutputCoalescer.stream_key('msg_1', 'stdout')
+STDERR = OutputCoalescer.stream_key('msg_1', 'stderr')
+
+
+def create_message(content):
+    return Message(webapp_endpoint='CodeEditor', command_name='exec_line', content=content)
+
+
+class OutputCoalescerTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        ## a long window so the outputs are only sent by the explicit flushes of the tests #
+        self.coalescer = OutputCoalescer(self.sent.append, window=60)
+
+    def get_sent(self):
+        return [message.content for message in self.sent]
+
+    def test_consecutive_stream_chunks_are_merged(self):
+        for chunk in ['a\n', 'b\n', 'c\n']:
+            self.coalescer.put(create_message(chunk), STDOUT)
+        self.assertEqual(self.sent, [])
+        self.coalescer.flush()
+        self.assertEqual(self.get_sent(), ['a\nb\nc\n'])
+        self.assertEqual(self.coalescer.get_stats(), {'received': 3, 'merged': 2})
+
+    def test_interleaved_streams_keep_their_order(self):
+        self.coalescer.put(create_message('out 1\n'), STDOUT)
+        self.coalescer.put(create_message('err 1\n'), STDERR)
+        self.coalescer.put(create_message('out 2\n'), STDOUT)
+        self.coalescer.flush()
+        self.assertEqual(self.get_sent(), ['out 1\n', 'err 1\n', 'out 2\n'])
+
+    def test_display_updates_collapse_to_the_latest(self):
+        key = OutputCoalescer.display_key('display_1')
+        self.coalescer.put(create_message('progress 1'), key)
+        self.coalescer.put(create_message('line\n'), STDOUT)
+        self.coalescer.put(create_message('progress 2'), key)
+        self.coalescer.flush()
+        self.assertEqual(self.get_sent(), ['progress 2', 'line\n'])
+
+    def test_message_without_key_flushes_the_pending_outputs_first(self):
+        self.coalescer.put(create_message('a\n'), STDOUT)
+        self.coalescer.put(create_message('idle'))
+        self.assertEqual(self.get_sent(), ['a\n', 'idle'])
+
+    def test_pending_outputs_are_sent_when_the_window_expires(self):
+        coalescer = OutputCoalescer(self.sent.append, window=0.01)
+        coalescer.put(create_message('a\n'), STDOUT)
+        coalescer.put(create_message('b\n'), STDOUT)
+        deadline = time.monotonic() + 5
+        while not self.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.get_sent(), ['a\nb\n'])
+
+    def test_zero_window_disables_coalescing(self):
+        coalescer = OutputCoalescer(self.sent.append, window=0)
+        coalescer.put(create_message('a\n'), STDOUT)
+        coalescer.put(create_message('b\n'), STDOUT)
+        self.assertEqual(self.get_sent(), ['a\n', 'b\n'])
+
+
+if __name__ == '__main__':
+    unittest.main()
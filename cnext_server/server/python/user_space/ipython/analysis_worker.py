@@ -0,0 +1,121 @@
+import itertools
+import os
+import select
+import signal
+import sys
+import threading
+import time
+import traceback
+import simplejson as json
+
+from libs.json_serializable import ipython_internal_output
+from user_space.ipython.constants import IPythonConstants
+
+DEFAULT_TIMEOUT = 60  # unit: second
+DEFAULT_MEMORY_LIMIT = 2048  # unit: MB
+READ_SIZE = 1024*1024
+
+
+def is_supported() -> bool:
+    return sys.platform.startswith('linux') and hasattr(os, 'fork')
+
+
+def _get_address_space_size() -> int:
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class ForkedAnalysisWorker:
+    """
+        Run a heavy computation on the user dataframes e.g. the column statistics in a forked child of the
+        kernel. The child shares the dataframes copy-on-write and sends its result back over a pipe, so the
+        kernel is free as soon as the fork returns. Linux only.
+
+        The child is killed after `timeout` seconds and can not allocate more than `memory_limit` MB on top of
+        the address space of the kernel. It must not use the sockets of the kernel, its outputs are discarded.
+        The result of a job is taken with `get_result`.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.job_ids = itertools.count(1)
+        self.results = {}
+        self.lock = threading.Lock()
+
+    @ipython_internal_output
+    def start(self, func, *args):
+        """ Fork a child which runs `func(*args)`, return the id of the job """
+        if not is_supported():
+            raise RuntimeError('Forked analysis is only supported on Linux')
+        job_id = next(self.job_ids)
+        read_fd, write_fd = os.pipe()
+        ## the limit is computed before the fork so the child does not allocate anything before it is set #
+        memory_limit = _get_address_space_size() + self.memory_limit * 1024 * 1024
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            self._run_child(write_fd, memory_limit, func, args)
+        os.close(write_fd)
+        with self.lock:
+            self.results[job_id] = None
+        threading.Thread(target=self._wait_child, args=(
+            job_id, pid, read_fd), daemon=True).start()
+        return job_id
+
+    @staticmethod
+    def _run_child(write_fd, memory_limit, func, args):
+        try:
+            import resource
+            ## the outputs of the kernel are sent by threads which do not exist in the child #
+            sys.stdout = sys.stderr = open(os.devnull, 'w')
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+            result = {'status': IPythonConstants.ShellMessageStatus.OK, 'content': func(*args)}
+            payload = json.dumps(
+                result, default=lambda o: o.__dict__, ignore_nan=True)
+        except BaseException:
+            payload = json.dumps({'status': IPythonConstants.ShellMessageStatus.ERROR,
+                                  'content': traceback.format_exc()})
+        try:
+            data = payload.encode()
+            while data:
+                data = data[os.write(write_fd, data):]
+        finally:
+            os._exit(0)
+
+    def _wait_child(self, job_id, pid, read_fd):
+        chunks = []
+        deadline = time.time() + self.timeout
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not select.select([read_fd], [], [], remaining)[0]:
+                    os.kill(pid, signal.SIGKILL)
+                    result = {'status': IPythonConstants.ShellMessageStatus.ERROR,
+                              'content': 'Analysis timed out after %d seconds' % self.timeout}
+                    break
+                chunk = os.read(read_fd, READ_SIZE)
+                if not chunk:
+                    result = json.loads(b''.join(chunks)) if chunks else \
+                        {'status': IPythonConstants.ShellMessageStatus.ERROR,
+                         'content': 'Analysis exited without a result'}
+                    break
+                chunks.append(chunk)
+        except:
+            result = {'status': IPythonConstants.ShellMessageStatus.ERROR,
+                      'content': traceback.format_exc()}
+        finally:
+            os.close(read_fd)
+            os.waitpid(pid, 0)
+        with self.lock:
+            self.results[job_id] = result
+
+    def get_result(self, job_id):
+        """ Return the result of the job once and None while it is running """
+        with self.lock:
+            if job_id not in self.results:
+                raise ValueError('Unknown analysis job %s' % job_id)
+            result = self.results[job_id]
+            if result is not None:
+                del self.results[job_id]
+            return result
@@ -0,0 +1,54 @@
+import contextlib
+import threading
+import time
+
+from libs.json_serializable import ipython_internal_output
+
+
+class StartupTimer:
+    """ Record the duration of each step of the kernel bootstrap and of the lazy loads """
+
+    def __init__(self):
+        self.start = time.time()
+        self.steps = []
+
+    @contextlib.contextmanager
+    def step(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.steps.append(
+                {'name': name, 'start': start - self.start, 'duration': time.time() - start})
+
+    @ipython_internal_output
+    def get_report(self):
+        return {'steps': self.steps, 'total': sum(step['duration'] for step in self.steps)}
+
+
+class LazyObject:
+    """
+        Create the object with `factory` on the first access to one of its attributes, so the heavy
+        imports of e.g. the dataframe manager are only paid when it is used.
+    """
+
+    def __init__(self, factory, name, startup_timer: StartupTimer = None):
+        self._factory = factory
+        self._name = name
+        self._startup_timer = startup_timer
+        self._object = None
+        self._lock = threading.Lock()
+
+    def _get_object(self):
+        if self._object is None:
+            with self._lock:
+                if self._object is None:
+                    if self._startup_timer is not None:
+                        with self._startup_timer.step('load %s' % self._name):
+                            self._object = self._factory()
+                    else:
+                        self._object = self._factory()
+        return self._object
+
+    def __getattr__(self, name):
+        return getattr(self._get_object(), name)
@@ -3,6 +3,15 @@ from enum import Enum
 from libs.json_serializable import JsonSerializable
 
 
+class ExecutionMode(Enum):
+    """ 
+        EVAL and EXEC are the internal executions of the server, an expression and statements.
+        The code of the user is executed without a mode.
+    """
+    EVAL = 0
+    EXEC = 1
+
+
 class IpythonResultMessage(JsonSerializable):
     def __init__(self, **entries):
         self.header = None
@@ -50,6 +59,7 @@ class IPythonConstants:
         OK = 'ok'
         ERROR = 'error'
         IDLE = 'idle'
+        ABORTED = 'aborted'
 
     class IOBufMessageStatus(str, Enum):
         OK = 'ok'
@@ -67,3 +77,18 @@ class IPythonInteral(Enum):
     CASSIST = '_cassist'
     USER_SPACE = '_user_space'
     UDF_MODULE = '_udf'
+    STARTUP_TIMER = '_startup_timer'
+    INTROSPECTION = '_introspection'
+    ANALYSIS_WORKER = '_analysis_worker'
+    PROFILER = '_profiler'
+    EXECUTION_STATS = '_execution_stats'
+    MEMOIZER = '_memoizer'
+
+
+class PostExecSnapshotSection(str, Enum):
+    DFS_STATUS = 'dfs_status'
+    UDFS = 'udfs'
+    MODELS = 'models'
+    PROFILE = 'profile'
+    EXECUTION_STATS = 'execution_stats'
+    MEMOIZATION = 'memoization'
@@ -0,0 +1,95 @@
+import sys
+import time
+import tracemalloc
+import psutil
+
+DEFAULT_TRACEMALLOC_TOP = 0
+
+
+def _reset_peak_rss() -> bool:
+    """ Reset the peak RSS of the process, Linux >= 4.0 """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _get_peak_rss() -> int:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    ## ru_maxrss is in bytes on macOS and in KB on Linux #
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class ExecutionStatsRecorder:
+    """
+        Measure each cell of the user between the `pre_run_cell` and `post_run_cell` events: the wall time,
+        the CPU time of the kernel process, the RSS delta and the peak RSS reached during the cell above the
+        RSS at its start. The peak is reset before the cell on Linux, elsewhere it is the peak of the process
+        so a cell which stays under a previous peak only reports its RSS delta.
+
+        With `tracemalloc_top` > 0 the python allocations of the cell are traced and the lines which allocated
+        most of the memory still held at the end of the cell are reported. Tracing slows the cell down a lot.
+        The stats of the cells are taken with `get_stats`, the internal executions are silent and are not
+        measured.
+    """
+
+    def __init__(self, shell, tracemalloc_top=DEFAULT_TRACEMALLOC_TOP):
+        self.tracemalloc_top = tracemalloc_top
+        self.process = psutil.Process()
+        self.start = None
+        self.stats = []
+        shell.events.register('pre_run_cell', self._pre_run_cell)
+        shell.events.register('post_run_cell', self._post_run_cell)
+
+    def _pre_run_cell(self, info):
+        tracing = self.tracemalloc_top > 0 and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        self.start = {'time': time.time(), 'wall': time.perf_counter(), 'cpu': time.process_time(),
+                      'rss': self.process.memory_info().rss, 'peak_reset': _reset_peak_rss(),
+                      'peak_rss': _get_peak_rss(), 'tracing': tracing}
+
+    def _post_run_cell(self, result):
+        if self.start is None:
+            return
+        start = self.start
+        self.start = None
+        rss = self.process.memory_info().rss
+        peak_rss = max(_get_peak_rss(), rss)
+        if not start['peak_reset'] and peak_rss <= start['peak_rss']:
+            peak_rss = max(rss, start['rss'])
+        stats = {'start_time': start['time'],
+                 'wall_time': time.perf_counter() - start['wall'],
+                 'cpu_time': time.process_time() - start['cpu'],
+                 'rss': rss,
+                 'rss_delta': rss - start['rss'],
+                 'peak_rss_delta': peak_rss - start['rss'],
+                 'error': not result.success}
+        if start['tracing']:
+            stats['allocations'] = self._get_top_allocations()
+            tracemalloc.stop()
+        self.stats.append(stats)
+
+    def _get_top_allocations(self):
+        statistics = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)).statistics('lineno')
+        return [{'file': stat.traceback[0].filename, 'line': stat.traceback[0].lineno,
+                 'size': stat.size, 'count': stat.count} for stat in statistics[:self.tracemalloc_top]]
+
+    def get_stats(self):
+        """ Return the stats of the cells since the last call, None if no cell was executed """
+        if not self.stats:
+            return None
+        stats = self.stats
+        self.stats = []
+        return stats
@@ -0,0 +1,172 @@
+from enum import Enum
+import threading
+import traceback
+import simplejson as json
+import zmq
+
+from libs.json_serializable import ipython_internal_output
+from user_space.ipython.constants import IPythonConstants
+from libs import logs
+log = logs.get_logger(__name__)
+
+DEFAULT_MAX_ROWS = 1000
+DEFAULT_MAX_CELLS = 200000
+DEFAULT_TIMEOUT = 5  # unit: second
+## number of times a copy is retried when the dataframe is changed by the user code during the copy #
+MAX_COPY_ATTEMPTS = 3
+
+
+class IntrospectionQuery(str, Enum):
+    LIST_DFS = 'list_dfs'
+    SHAPE = 'shape'
+    DTYPES = 'dtypes'
+    MEMORY_USAGE = 'memory_usage'
+    TABLE_PAGE = 'table_page'
+    JOB_RESULT = 'job_result'
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return str(self.value)
+
+
+class IntrospectionServer:
+    """
+        Answer read-only queries about the dataframes of the user namespace from a thread of the kernel,
+        so they are served while a cell is running. The shell channel of the kernel is blocked during an
+        execution, which is why this is a socket of its own and not a comm target.
+
+        Safety limits:
+            - a dataframe is looked up by its name in the namespace, no code is evaluated
+            - only pandas dataframes are served, dask and spark dataframes would start a computation
+            - a table page is a copy of at most `max_rows` rows and `max_cells` cells, the rest is truncated
+            - the memory usage is not `deep` so the python objects of the columns are not visited
+            - a copy which fails because the user code changes the dataframe is retried, then reported as an error
+        Everything else e.g. filters and column statistics goes through the normal execution.
+    """
+
+    def __init__(self, user_space, df_manager, max_rows=DEFAULT_MAX_ROWS, max_cells=DEFAULT_MAX_CELLS,
+                 analysis_worker=None):
+        self.user_space = user_space
+        self.df_manager = df_manager
+        ## the results of the jobs of `ForkedAnalysisWorker` are collected through this server #
+        self.analysis_worker = analysis_worker
+        self.max_rows = max_rows
+        self.max_cells = max_cells
+        self.address = None
+        self.thread = None
+
+    def start(self):
+        socket = zmq.Context.instance().socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        port = socket.bind_to_random_port('tcp://127.0.0.1')
+        self.address = 'tcp://127.0.0.1:%d' % port
+        self.thread = threading.Thread(
+            target=self._serve, args=(socket,), daemon=True)
+        self.thread.start()
+
+    @ipython_internal_output
+    def get_address(self):
+        return self.address
+
+    def _serve(self, socket):
+        while True:
+            request = socket.recv_string()
+            try:
+                request = json.loads(request)
+                response = {'status': IPythonConstants.ShellMessageStatus.OK,
+                            'content': self.handle_query(request['query'], request.get('params', {}))}
+            except:
+                response = {'status': IPythonConstants.ShellMessageStatus.ERROR,
+                            'content': traceback.format_exc()}
+            socket.send_string(json.dumps(
+                response, default=lambda o: o.__dict__, ignore_nan=True))
+
+    def _get_dataframe(self, df_id):
+        import pandas
+        if not isinstance(df_id, str) or not df_id.isidentifier():
+            raise ValueError('Invalid dataframe name %s' % df_id)
+        df = self.user_space.globals().get(df_id)
+        if not isinstance(df, pandas.DataFrame):
+            raise ValueError('%s is not a pandas dataframe' % df_id)
+        return df
+
+    @staticmethod
+    def _copy(copy_func):
+        for attempt in range(MAX_COPY_ATTEMPTS):
+            try:
+                return copy_func()
+            except:
+                if attempt == MAX_COPY_ATTEMPTS - 1:
+                    raise
+
+    def _get_table_page(self, df_id, from_index=None, to_index=None):
+        df = self._get_dataframe(df_id)
+        start, stop, _ = slice(from_index, to_index).indices(len(df))
+        max_rows = min(self.max_rows, max(
+            1, self.max_cells // max(1, len(df.columns))))
+        truncated = stop - start > max_rows
+        stop = min(stop, start + max_rows)
+        page = self._copy(lambda: df.iloc[start:stop].copy())
+        table_data = self.df_manager._create_table_data(df_id, page)
+        table_data['truncated'] = truncated
+        return table_data
+
+    def handle_query(self, query, params):
+        if query == IntrospectionQuery.LIST_DFS:
+            import pandas
+            return [{'name': name, 'type': type_name, 'shape': obj.shape}
+                    for name, obj, type_name in self.user_space.df_tracker.scan(self.user_space.globals())
+                    if isinstance(obj, pandas.DataFrame)]
+        elif query == IntrospectionQuery.SHAPE:
+            return self._get_dataframe(params['df_id']).shape
+        elif query == IntrospectionQuery.DTYPES:
+            df = self._get_dataframe(params['df_id'])
+            return {str(name): str(dtype) for name, dtype in self._copy(lambda: list(df.dtypes.items()))}
+        elif query == IntrospectionQuery.MEMORY_USAGE:
+            df = self._get_dataframe(params['df_id'])
+            return int(self._copy(lambda: df.memory_usage(index=True, deep=False).sum()))
+        elif query == IntrospectionQuery.TABLE_PAGE:
+            return self._get_table_page(params['df_id'], params.get('from_index'), params.get('to_index'))
+        elif query == IntrospectionQuery.JOB_RESULT and self.analysis_worker is not None:
+            return self.analysis_worker.get_result(params['job_id'])
+        raise ValueError('Unknown query %s' % query)
+
+
+class IntrospectionClient:
+    """ Send the queries of `IntrospectionServer` from the server, a query can be sent from any thread """
+
+    def __init__(self, address, timeout=DEFAULT_TIMEOUT):
+        self.address = address
+        self.timeout = timeout
+        self.socket = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        self.socket = zmq.Context.instance().socket(zmq.REQ)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(self.address)
+
+    def query(self, query: IntrospectionQuery, **params):
+        """ Return the result as {'status', 'content'} like the internal executions, None on timeout """
+        with self.lock:
+            try:
+                if self.socket is None:
+                    self._connect()
+                self.socket.send_string(json.dumps(
+                    {'query': query.value, 'params': params}))
+                if self.socket.poll(self.timeout * 1000):
+                    return json.loads(self.socket.recv_string())
+                log.info('Introspection query %s timed out' % query)
+            except:
+                trace = traceback.format_exc()
+                log.info("Exception %s" % (trace))
+            ## a REQ socket without its reply can not send again #
+            self.close()
+            return None
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
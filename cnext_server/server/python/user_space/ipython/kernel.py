@@ -1,38 +1,123 @@
+import itertools
 import threading
 import time
 import traceback
 import jupyter_client
-import queue
-from user_space.ipython.constants import IPythonConstants
+import zmq
+from user_space.ipython.constants import IPythonConstants, ExecutionMode
 from libs import logs
 log = logs.get_logger(__name__)
 
-MESSSAGE_TIMEOUT = 1
+PUMP_STOP_TIMEOUT = 5  # unit: second
+## name of the user expression which holds the value of an internal evaluation #
+EXPRESSION_RESULT = 'result'
+
+_pump_ids = itertools.count()
+
+
+class ExecutionRequest:
+    """
+        An execute request sent to the kernel. The messages whose parent is this request are routed to its
+        `message_handler_callback`, `wait` returns once its execute_reply and idle status are both handled
+        or once it is aborted by a restart of the kernel.
+    """
+
+    def __init__(self, code, message_handler_callback=None, client_message=None, evaluated=False):
+        self.code = code
+        ## the value of the code is in the user expressions of the execute_reply #
+        self.evaluated = evaluated
+        self.msg_id = None
+        self.message_handler_callback = message_handler_callback
+        self.client_message = client_message
+        self.shell_cond = False
+        self.iobuf_cond = False
+        self.aborted = False
+        ## status of the execute_reply: ok, error or aborted #
+        self.status = None
+        self.done = threading.Event()
+
+    def set_execution_complete_condition_from_message(self, stream_type, message):
+        if stream_type == IPythonConstants.StreamType.SHELL and \
+                message['header']['msg_type'] == IPythonConstants.MessageType.EXECUTE_REPLY:
+            self.shell_cond = 'status' in message['content']
+            self.status = message['content'].get('status')
+            ## an aborted request has no busy/idle status on iopub #
+            if message['content'].get('status') == IPythonConstants.ShellMessageStatus.ABORTED:
+                self.iobuf_cond = True
+        if stream_type == IPythonConstants.StreamType.IOBUF and \
+                message['header']['msg_type'] == IPythonConstants.MessageType.STATUS:
+            self.iobuf_cond = message['content']['execution_state'] == 'idle'
+
+    def is_execution_complete(self) -> bool:
+        return self.shell_cond and self.iobuf_cond
+
+    def wait(self, timeout=None) -> bool:
+        return self.done.wait(timeout)
 
 
 class IPythonKernel():
     def __init__(self):
         self.km = None
         self.kc = None
-        self.message_handler_callback = None
         self.msg_threads = []
-        self.stream_types = [IPythonConstants.StreamType.SHELL,
-                             IPythonConstants.StreamType.IOBUF, IPythonConstants.StreamType.STDIN]
-        self.execute_lock = threading.Lock()
-        self._set_execution_complete_condition(False)
+        self.channel_sockets = {}
+        self.wakeup_send = None
+        self.wakeup_recv = None
+        ## the requests sent to the kernel which are not complete yet, by msg_id #
+        self.requests = {}
+        self.requests_lock = threading.Lock()
+        self.startup_timings = {}
 
     def start_msg_thead(self):
-        for type in self.stream_types:
-            self.msg_threads.append(threading.Thread(
-                target=self.handle_ipython_stream, args=(type,), daemon=True))
-            self.msg_threads[-1].start()
+        """
+            Start a single thread which polls the shell, iopub and stdin channels of the kernel and
+            handles the messages as soon as they arrive.
+        """
+        ## sync shadows of the channel sockets so they can be polled and read from the pump thread #
+        self.channel_sockets = {
+            zmq.Socket.shadow(self.kc.shell_channel.socket.underlying): IPythonConstants.StreamType.SHELL,
+            zmq.Socket.shadow(self.kc.iopub_channel.socket.underlying): IPythonConstants.StreamType.IOBUF,
+            zmq.Socket.shadow(self.kc.stdin_channel.socket.underlying): IPythonConstants.StreamType.STDIN,
+        }
+        ## `stop_msg_thread` sends a message to the wakeup socket to stop the pump without waiting for a timeout #
+        addr = 'inproc://ipython-kernel-pump-%d' % next(_pump_ids)
+        self.wakeup_recv = zmq.Context.instance().socket(zmq.PAIR)
+        self.wakeup_recv.bind(addr)
+        self.wakeup_send = zmq.Context.instance().socket(zmq.PAIR)
+        self.wakeup_send.connect(addr)
+        self.msg_threads = [threading.Thread(
+            target=self.pump_ipython_channels, daemon=True)]
+        self.msg_threads[-1].start()
 
     def stop_msg_thread(self):
-        self.stop_msg_thread_signal = True
-        # wait to make sure the stream threads will stop before proceeding
-        while self.is_msg_thead_alive():
-            time.sleep(1)
-        self.stop_msg_thread_signal = False
+        if self.is_msg_thead_alive():
+            self.wakeup_send.send(b'')
+            for msg_thread in self.msg_threads:
+                msg_thread.join(timeout=PUMP_STOP_TIMEOUT)
+        if self.wakeup_send is not None:
+            self.wakeup_send.close(linger=0)
+            self.wakeup_recv.close(linger=0)
+            self.wakeup_send = None
+            self.wakeup_recv = None
+        self.msg_threads = []
+
+    def get_startup_timings(self) -> dict:
+        """ Duration of the launch of the kernel and of waiting for it to be ready (second) """
+        return self.startup_timings
+
+    def get_pending_requests(self) -> int:
+        return len(self.requests)
+
+    def _abort_requests(self):
+        """ Complete the requests which will not get a reply e.g. because the kernel is restarted """
+        with self.requests_lock:
+            requests = list(self.requests.values())
+            self.requests = {}
+        for request in requests:
+            request.aborted = True
+            request.done.set()
+        if requests:
+            log.info('Aborted %d pending requests' % len(requests))
 
     def is_msg_thead_alive(self):
         for msg_thread in self.msg_threads:
@@ -45,20 +130,18 @@ class IPythonKernel():
             if self.km is not None:
                 self.shutdown_kernel()
             self.stop_msg_thread()
+            self._abort_requests()
             log.info('Kernel starting')
+            start = time.time()
             self.km = jupyter_client.KernelManager(kernel_name=kernel_name)
             self.km.start_kernel()
+            launched = time.time()
             self.kc = self.km.blocking_client()
             self.wait_for_ready()
             self.start_msg_thead()
+            self.startup_timings = {'launch': launched - start, 'ready': time.time() - launched}
 
             log.info('Kernel started')
-
-            # release execution lock which might be locked during an execution
-            if self.execute_lock.locked():
-                self.execute_lock.release()
-                log.info('Kernel execution lock released')
-                self._set_execution_complete_condition(True)
             if self.km.is_alive():
                 return True
             else:
@@ -72,6 +155,9 @@ class IPythonKernel():
         try:
             if self.km.is_alive():
                 log.info('Kernel shutting down')
+                ## stop polling the channels before their sockets are closed #
+                self.stop_msg_thread()
+                self._abort_requests()
                 self.kc.stop_channels()
                 self.km.shutdown_kernel(now=True)
                 log.info('Kernel shutdown')
@@ -88,20 +174,18 @@ class IPythonKernel():
         try:
             # if self.km.is_alive():
             log.info('Kernel restarting')
+            ## the requests sent to the old kernel are not answered, their callers must not wait #
+            self._abort_requests()
+            start = time.time()
             self.km.restart_kernel()
+            launched = time.time()
             self.stop_msg_thread()
             self.kc = self.km.blocking_client()
             result = self.wait_for_ready()
             log.info("wait_for_ready return: %s", result)
             self.start_msg_thead()
+            self.startup_timings = {'launch': launched - start, 'ready': time.time() - launched}
             log.info('Kernel restarted')
-
-            # release execution lock which might be locked during an execution
-            if self.execute_lock.locked():
-                self.execute_lock.release()
-                log.info('Kernel execution lock released')
-                self._set_execution_complete_condition(True)
-
             if self.km.is_alive():
                 return True
             else:
@@ -111,6 +195,37 @@ class IPythonKernel():
             log.info("Exception %s" % (trace))
         return False
 
+    def swap_kernel(self, km, kc):
+        """ Replace the running kernel with a kernel which is already started e.g. from `KernelPool` """
+        try:
+            log.info('Kernel swapping')
+            start = time.time()
+            self.stop_msg_thread()
+            self._abort_requests()
+            old_km, old_kc = self.km, self.kc
+            self.km, self.kc = km, kc
+            self.start_msg_thead()
+            self.startup_timings = {'swap': time.time() - start}
+            ## the old kernel is shut down in the background so the swap does not wait for it #
+            if old_km is not None:
+                threading.Thread(target=self._shutdown_kernel, args=(
+                    old_km, old_kc), daemon=True).start()
+            log.info('Kernel swapped')
+            return self.km.is_alive()
+        except:
+            trace = traceback.format_exc()
+            log.info("Exception %s" % (trace))
+        return False
+
+    @staticmethod
+    def _shutdown_kernel(km, kc):
+        try:
+            kc.stop_channels()
+            km.shutdown_kernel(now=True)
+        except:
+            trace = traceback.format_exc()
+            log.info("Exception %s" % (trace))
+
     def interrupt_kernel(self):
         try:
             if self.km.is_alive():
@@ -136,84 +251,148 @@ class IPythonKernel():
     def _is_status_message(self, message):
         return message['header']['msg_type'] == 'status'
 
-    def _set_execution_complete_condition(self, condition: bool):
-        self.shell_cond = condition
-        self.iobuf_cond = condition
+    def handle_ipython_message(self, stream_type: IPythonConstants.StreamType, ipython_message):
+        request = None
+        try:
+            if ipython_message['header']['msg_type'] not in [
+                    IPythonConstants.MessageType.STREAM,
+                    IPythonConstants.MessageType.EXECUTE_RESULT,
+                    IPythonConstants.MessageType.ERROR]:
+                log.info('%s msg: msg_type = %s, content = %s' % (
+                    stream_type, ipython_message['header']['msg_type'], ipython_message['content']))
+            else:
+                log.info('%s msg: msg_type = %s' % (
+                    stream_type, ipython_message['header']['msg_type']))
+
+            ## route the message to the request it answers, the lock waits for the request to be registered #
+            with self.requests_lock:
+                request = self.requests.get(
+                    ipython_message['parent_header'].get('msg_id'))
+            if request is None:
+                ## e.g. a late message of an aborted request or the status of another client #
+                return
 
-    def _set_execution_complete_condition_from_message(self, stream_type, message):
-        if stream_type == IPythonConstants.StreamType.SHELL:
-            self.shell_cond = message['header']['msg_type'] == 'execute_reply' and 'status' in message['content']
-        if stream_type == IPythonConstants.StreamType.IOBUF:
-            self.iobuf_cond = message['header']['msg_type'] == 'status' and message['content']['execution_state'] == 'idle'
+            if request.message_handler_callback is not None:
+                if request.evaluated and stream_type == IPythonConstants.StreamType.SHELL:
+                    result_message = self._get_expression_result_message(
+                        ipython_message)
+                    if result_message is not None:
+                        request.message_handler_callback(
+                            result_message, IPythonConstants.StreamType.IOBUF, request.client_message)
+                request.message_handler_callback(
+                    ipython_message, stream_type, request.client_message)
 
-    def _is_execution_complete(self, stream_type, message) -> bool:
-        ## Look at the shell stream and check the status #
-        return self.shell_cond and self.iobuf_cond
+            ## complete the request only after upstream has processed the data if messge is status #
+            request.set_execution_complete_condition_from_message(
+                stream_type, ipython_message)
+            if request.is_execution_complete():
+                self._complete_request(request)
+        except:
+            trace = traceback.format_exc()
+            log.info("Exception %s" % (trace))
+            if request is not None:
+                self._complete_request(request)
 
-    def handle_ipython_stream(self, stream_type: IPythonConstants.StreamType):
+    @staticmethod
+    def _get_expression_result_message(reply):
+        """
+            Convert the user expression of the execute_reply of an internal evaluation to the execute_result or
+            error message the execution of the expression would have published
+        """
+        if reply['header']['msg_type'] != IPythonConstants.MessageType.EXECUTE_REPLY:
+            return None
+        expression = reply['content'].get(
+            'user_expressions', {}).get(EXPRESSION_RESULT)
+        if expression is None:
+            return None
+        if expression['status'] == IPythonConstants.ShellMessageStatus.ERROR:
+            msg_type = IPythonConstants.MessageType.ERROR
+            content = {'ename': expression['ename'], 'evalue': expression['evalue'],
+                       'traceback': expression['traceback']}
+        elif expression['data'] == {'text/plain': 'None'}:
+            ## the displayhook does not publish None #
+            return None
+        else:
+            msg_type = IPythonConstants.MessageType.EXECUTE_RESULT
+            content = {'data': expression['data'], 'metadata': expression['metadata'],
+                       'execution_count': None}
+        header = dict(reply['header'], msg_type=msg_type.value)
+        return {'header': header, 'msg_id': header['msg_id'], 'msg_type': msg_type.value,
+                'parent_header': reply['parent_header'], 'metadata': {}, 'content': content, 'buffers': []}
+
+    def _complete_request(self, request: ExecutionRequest):
+        with self.requests_lock:
+            self.requests.pop(request.msg_id, None)
+        request.done.set()
+
+    def _recv_ipython_message(self, socket):
+        msg = socket.recv_multipart(zmq.NOBLOCK)
+        ident, smsg = self.kc.session.feed_identities(msg)
+        return self.kc.session.deserialize(smsg)
+
+    def pump_ipython_channels(self):
         try:
-            log.info('Start stream %s' % stream_type)
-            while not self.stop_msg_thread_signal:
-                try:
-                    ipython_message = None
-                    if stream_type == IPythonConstants.StreamType.SHELL:
-                        ipython_message = self.kc.get_shell_msg(
-                            timeout=MESSSAGE_TIMEOUT)
-                    elif stream_type == IPythonConstants.StreamType.IOBUF:
-                        ipython_message = self.kc.get_iopub_msg(
-                            timeout=MESSSAGE_TIMEOUT)
-                    elif stream_type == IPythonConstants.StreamType.STDIN:
-                        ipython_message = self.kc.get_stdin_msg(
-                            timeout=MESSSAGE_TIMEOUT)
-
-                    if ipython_message['header']['msg_type'] not in [
-                            IPythonConstants.MessageType.STREAM,
-                            IPythonConstants.MessageType.EXECUTE_RESULT,
-                            IPythonConstants.MessageType.ERROR]:
-                        log.info('%s msg: msg_type = %s, content = %s' % (
-                            stream_type, ipython_message['header']['msg_type'], ipython_message['content']))
-                    else:
-                        log.info('%s msg: msg_type = %s' % (
-                            stream_type, ipython_message['header']['msg_type']))
-
-                    if ipython_message is not None and self.message_handler_callback is not None:
-                        self.message_handler_callback(
-                            ipython_message, stream_type, self.client_message)
-
-                    ## unlock execute lock only after upstream has processed the data if messge is status #
-                    # if self._is_status_message(ipython_message) and ipython_message['content']['execution_state'] != 'busy' and self.execute_lock.locked():
-                    #     self.execute_lock.release()
-                    self._set_execution_complete_condition_from_message(
-                        stream_type, ipython_message)
-                    if self.execute_lock.locked() and self._is_execution_complete(stream_type, ipython_message):
-                        self.execute_lock.release()
-                        log.info('Kernel execution lock released')
-                except queue.Empty:
-                    pass
-                except:
-                    trace = traceback.format_exc()
-                    log.info("Exception %s" % (trace))
-                    if self.execute_lock.locked():
-                        self.execute_lock.release()
-                        log.info('Kernel execution lock released')
-            log.info('Stop stream %s' % stream_type)
+            log.info('Start kernel channel pump')
+            poller = zmq.Poller()
+            poller.register(self.wakeup_recv, zmq.POLLIN)
+            for socket in self.channel_sockets:
+                poller.register(socket, zmq.POLLIN)
+            while True:
+                events = dict(poller.poll())
+                if self.wakeup_recv in events:
+                    break
+                for socket, stream_type in self.channel_sockets.items():
+                    if socket in events:
+                        try:
+                            ipython_message = self._recv_ipython_message(
+                                socket)
+                        except zmq.Again:
+                            continue
+                        except:
+                            trace = traceback.format_exc()
+                            log.info("Exception %s" % (trace))
+                            continue
+                        self.handle_ipython_message(
+                            stream_type, ipython_message)
+            log.info('Stop kernel channel pump')
         except:
             trace = traceback.format_exc()
             log.info("Exception %s" % (trace))
 
-    def execute(self, code, exec_mode=None, message_handler_callback=None, client_message=None):
+    def _send_execute_request(self, code, exec_mode):
+        ## an error must not abort the requests queued behind it, they come from other callers #
+        if exec_mode == ExecutionMode.EVAL:
+            return self.kc.execute('', silent=True, store_history=False, user_expressions={EXPRESSION_RESULT: code},
+                                   stop_on_error=False)
+        elif exec_mode == ExecutionMode.EXEC:
+            return self.kc.execute(code, silent=True, store_history=False, stop_on_error=False)
+        return self.kc.execute(code, stop_on_error=False)
+
+    def execute(self, code, exec_mode=None, message_handler_callback=None, client_message=None) -> ExecutionRequest:
+        """
+            Queue the code on the kernel and return without waiting for it, several requests can be in flight.
+            Return None if the request could not be sent.
+
+            The internal executions (`exec_mode` EVAL or EXEC) are silent: they are not in the history, do not
+            increment the execution count and their values are not kept in the output caches (`Out`, `_`).
+            An EVAL expression is evaluated as a user expression and its value is delivered to
+            `message_handler_callback` as an execute_result, or an error, before the execute_reply.
+        """
         try:
             if self.kc:
-                self.execute_lock.acquire()
-                log.info(
-                    'Kernel execution lock acquired for executing \n"""\n%s ...\n"""', code[:50])
-                self._set_execution_complete_condition(False)
-                self.message_handler_callback = message_handler_callback
-                self.client_message = client_message
-                self.kc.execute(code)
+                request = ExecutionRequest(
+                    code, message_handler_callback, client_message, exec_mode == ExecutionMode.EVAL)
+                with self.requests_lock:
+                    request.msg_id = self._send_execute_request(
+                        code, exec_mode)
+                    self.requests[request.msg_id] = request
+                log.info('Kernel request %s queued for executing \n"""\n%s ...\n"""',
+                         request.msg_id, code[:50])
+                return request
         except:
             trace = traceback.format_exc()
             log.info("Exception %s" % (trace))
+        return None
 
     def send_stdin(self, input_text):
         try:
@@ -0,0 +1,151 @@
+import threading
+import traceback
+import jupyter_client
+import psutil
+
+from libs import logs
+from user_space.ipython.constants import IPythonConstants
+log = logs.get_logger(__name__)
+
+DEFAULT_POOL_SIZE = 0
+DEFAULT_MEMORY_BUDGET = 2048  # unit: MB
+BOOTSTRAP_TIMEOUT = 100  # unit: second
+
+
+class StandbyKernel:
+    def __init__(self, km, kc, spec):
+        self.km = km
+        self.kc = kc
+        self.spec = spec
+
+    def get_rss(self) -> int:
+        try:
+            return psutil.Process(self.km.provisioner.pid).memory_info().rss
+        except:
+            return 0
+
+    def shutdown(self):
+        try:
+            self.kc.stop_channels()
+            self.km.shutdown_kernel(now=True)
+        except:
+            trace = traceback.format_exc()
+            log.info("Exception %s" % (trace))
+
+
+class KernelPool:
+    """
+        Keep `size` kernels started and bootstrapped in the background so that a kernel restart
+        only has to swap to one of them. The standby kernels are started with the active kernel spec,
+        bootstrap code and working dir, and are discarded when one of them changes.
+        No kernel is added if the standby kernels would use more than `memory_budget` MB.
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.size = size
+        self.memory_budget = memory_budget
+        self.kernels = []
+        self.spec = None
+        self.cond = threading.Condition()
+        self.running = True
+        if self.size > 0:
+            replenish_thread = threading.Thread(
+                target=self._replenish, daemon=True)
+            replenish_thread.start()
+
+    @staticmethod
+    def from_config(config):
+        """ Create the pool from the `kernel_pool` section of server.yaml, None if it is not enabled """
+        if not config or config.get('size', DEFAULT_POOL_SIZE) <= 0:
+            return None
+        return KernelPool(config.get('size', DEFAULT_POOL_SIZE), config.get('memory_budget_mb', DEFAULT_MEMORY_BUDGET))
+
+    def configure(self, kernel_name, bootstrap_code, working_dir=None):
+        """ Set the spec of the standby kernels, the kernels started with another spec are discarded """
+        spec = (kernel_name, bootstrap_code, working_dir)
+        with self.cond:
+            if spec == self.spec:
+                return
+            self.spec = spec
+            discarded = [kernel for kernel in self.kernels if kernel.spec != spec]
+            self.kernels = [kernel for kernel in self.kernels if kernel.spec == spec]
+            self.cond.notify()
+        for kernel in discarded:
+            kernel.shutdown()
+
+    def acquire(self):
+        """ Take a standby kernel with the current spec, return None if there is none """
+        with self.cond:
+            if not self.kernels:
+                return None
+            kernel = self.kernels.pop(0)
+            self.cond.notify()
+            log.info('Acquired a standby kernel, %d left' % len(self.kernels))
+            return kernel
+
+    def _has_memory_budget(self) -> bool:
+        rss = [kernel.get_rss() for kernel in self.kernels]
+        ## assume the next kernel uses as much memory as the others #
+        next_rss = max(rss) if rss else 0
+        return (sum(rss) + next_rss) / (1024*1024) <= self.memory_budget
+
+    def _wait_for_bootstrap(self, kc, msg_id):
+        while kc.get_shell_msg(timeout=BOOTSTRAP_TIMEOUT)['parent_header'].get('msg_id') != msg_id:
+            pass
+        ## drain the outputs of the bootstrap so they are not received by the kernel user #
+        while True:
+            message = kc.get_iopub_msg(timeout=BOOTSTRAP_TIMEOUT)
+            if message['parent_header'].get('msg_id') == msg_id and \
+                    message['header']['msg_type'] == IPythonConstants.MessageType.STATUS and \
+                    message['content']['execution_state'] == 'idle':
+                return
+
+    def _start_kernel(self, spec) -> StandbyKernel:
+        kernel_name, bootstrap_code, working_dir = spec
+        km = jupyter_client.KernelManager(kernel_name=kernel_name)
+        km.start_kernel()
+        kc = km.blocking_client()
+        kc.start_channels()
+        kc.wait_for_ready(timeout=BOOTSTRAP_TIMEOUT)
+        code = bootstrap_code
+        if working_dir:
+            code = "import os; os.chdir('{}')\n".format(working_dir) + code
+        self._wait_for_bootstrap(kc, kc.execute(
+            code, silent=True, store_history=False))
+        return StandbyKernel(km, kc, spec)
+
+    def _replenish(self):
+        while True:
+            with self.cond:
+                while self.running and (self.spec is None or len(self.kernels) >= self.size or
+                                        not self._has_memory_budget()):
+                    self.cond.wait()
+                if not self.running:
+                    return
+                spec = self.spec
+            try:
+                log.info('Start a standby kernel: %s' % spec[0])
+                kernel = self._start_kernel(spec)
+            except:
+                trace = traceback.format_exc()
+                log.error("Failed to start a standby kernel %s" % (trace))
+                with self.cond:
+                    ## wait for a new spec before trying again #
+                    self.spec = None
+                continue
+            with self.cond:
+                if self.running and kernel.spec == self.spec:
+                    self.kernels.append(kernel)
+                    log.info('Standby kernel ready, %d in the pool' % len(self.kernels))
+                    kernel = None
+            if kernel is not None:
+                kernel.shutdown()
+
+    def shutdown(self):
+        with self.cond:
+            self.running = False
+            kernels = self.kernels
+            self.kernels = []
+            self.cond.notify()
+        for kernel in kernels:
+            kernel.shutdown()
@@ -0,0 +1,359 @@
+import ast
+import atexit
+import collections
+import hashlib
+import importlib
+import marshal
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+from libs.code_analysis import analyze_code, UnsupportedCode
+from user_space.object_tracker import get_dataframe_fingerprint
+
+DEFAULT_MIN_DURATION = 1.0  # unit: second
+DEFAULT_MEMORY_BUDGET = 1024  # unit: MB
+DEFAULT_DISK_BUDGET = 4096  # unit: MB
+## the fingerprint of a value of these types is a digest of its pickle #
+VALUE_TYPES = (int, float, complex, str, bytes, bool, type(None), tuple, frozenset)
+## the functions and classes of the modules are fingerprinted by their name #
+FUNCTION_TYPES = (types.BuiltinFunctionType, types.FunctionType, type)
+UNBOUND = ('unbound',)
+
+
+class MemoizationStatus:
+    HIT = 'hit'
+    MISS = 'miss'
+    SKIP = 'skip'
+
+
+class UncacheableCell(Exception):
+    pass
+
+
+def analyze_cell(code: str):
+    """
+        Return the inputs and the bindings of a cell, raise `UncacheableCell` when it can not be replayed.
+        The inputs changed in place by a method are found by their fingerprint after the cell.
+    """
+    try:
+        analysis = analyze_code(code, strict=True)
+    except UnsupportedCode as error:
+        raise UncacheableCell(str(error))
+    if 'get_ipython' in analysis.inputs:
+        raise UncacheableCell('uses magics')
+    return analysis.inputs, analysis.writes
+
+
+class _OutputTee:
+    """ Write to the stream of the kernel and record the text as an output of the cell """
+
+    def __init__(self, stream, name, outputs):
+        self._stream = stream
+        self._name = name
+        self._outputs = outputs
+
+    def write(self, text):
+        if self._outputs and self._outputs[-1][0] == self._name:
+            self._outputs[-1] = (self._name, self._outputs[-1][1] + text)
+        else:
+            self._outputs.append((self._name, text))
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _CacheEntry:
+    __slots__ = ['payload', 'path', 'size', 'outputs']
+
+    def __init__(self, payload, outputs):
+        self.payload = payload
+        self.path = None
+        self.size = len(payload)
+        self.outputs = outputs
+
+
+class _ReplayTransformer(ast.NodeTransformer):
+    """ Replace the code of a cell found in the cache by the call which replays it """
+
+    def __init__(self, memoizer, memoizer_name):
+        self.memoizer = memoizer
+        self.memoizer_name = memoizer_name
+
+    def visit_Module(self, node):
+        if self.memoizer.pending_hit is None:
+            return node
+        replay = ast.parse('%s.replay()' % self.memoizer_name).body
+        return ast.fix_missing_locations(ast.Module(body=replay, type_ignores=[]))
+
+
+class CellMemoizer:
+    """
+        Skip the cells of the user which were already executed with the same code and the same inputs. The
+        cells which take more than `min_duration` seconds are stored with the objects they bind, pickled, their
+        outputs and their result. A cell found in the cache is replaced by `replay` which restores them.
+
+        The key of a cell is its code and the fingerprints of its inputs, a cell can only be stored when all
+        its inputs have one:
+            - a value of `VALUE_TYPES`: a digest of its pickle
+            - a module, a function or a class of a module: its name
+            - a function of the user: its code, its defaults and the fingerprints of the globals it reads. The
+              classes of the user and the functions with a closure have no fingerprint
+            - a dataframe: its identity, its tracked version and its blocks. A dataframe bound by a stored cell is
+              fingerprinted with the key of that cell, so the cells which read it are found again after a replay.
+        The objects changed by a method e.g. `df.drop(..., inplace=True)` are only seen when the blocks of the
+        dataframe change. The cells which delete names, declare globals or use magics are never stored.
+
+        The entries are evicted from the memory to a directory of the kernel in `cache_dir` (the temporary directory
+        if None) past `memory_budget` MB and deleted past `disk_budget` MB, least recently used first. The directory
+        is deleted when the kernel exits. The statuses of the cells are taken with `get_status`.
+    """
+
+    def __init__(self, shell, user_space, memoizer_name, min_duration=DEFAULT_MIN_DURATION,
+                 memory_budget=DEFAULT_MEMORY_BUDGET, disk_budget=DEFAULT_DISK_BUDGET, cache_dir=None):
+        self.shell = shell
+        self.user_space = user_space
+        self.min_duration = min_duration
+        self.memory_budget = memory_budget * 1024 * 1024
+        self.disk_budget = disk_budget * 1024 * 1024
+        ## each kernel has its own directory, the standby kernels of the pool may share `cache_dir` #
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = tempfile.mkdtemp(prefix='cnext_memo_', dir=cache_dir)
+        atexit.register(self.close)
+        self.entries = collections.OrderedDict()
+        self.memory_size = 0
+        self.disk_size = 0
+        ## name -> (key of the cell which bound it, id and blocks of the dataframe at that time) #
+        self.provenance = {}
+        self.pending_hit = None
+        self.recording = None
+        ## the status of the current cell and of the cells since the last `get_status` #
+        self.status = None
+        self.statuses = []
+        shell.events.register('pre_run_cell', self._pre_run_cell)
+        shell.events.register('post_run_cell', self._post_run_cell)
+        shell.ast_transformers.append(_ReplayTransformer(self, memoizer_name))
+
+    def _get_fingerprint(self, name, namespace, functions=None):
+        if name not in namespace:
+            return UNBOUND
+        obj = namespace[name]
+        if isinstance(obj, VALUE_TYPES):
+            ## never `hash`, two values with the same hash would replay the wrong cell #
+            try:
+                return ('value', type(obj).__name__,
+                        hashlib.sha1(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest())
+            except Exception:
+                raise UncacheableCell('%s has no fingerprint' % name)
+        if isinstance(obj, type(sys)):
+            return ('module', obj.__name__)
+        if isinstance(obj, types.FunctionType) and obj.__globals__ is namespace:
+            return self._get_function_fingerprint(name, obj, namespace, functions or set())
+        if isinstance(obj, FUNCTION_TYPES):
+            ## a bound method e.g. `append = values.append` changes with its object #
+            owner = getattr(obj, '__self__', None)
+            if getattr(obj, '__module__', None) == '__main__' or \
+                    (owner is not None and not isinstance(owner, type(sys))):
+                raise UncacheableCell('%s is defined by the user' % name)
+            return ('function', getattr(obj, '__module__', None), obj.__qualname__)
+        type_name = self.user_space.df_tracker.matcher.match(type(obj))
+        if type_name is not None:
+            blocks = get_dataframe_fingerprint(obj)
+            provenance = self.provenance.get(name)
+            if provenance is not None and provenance[1] == (id(obj), blocks):
+                return ('memo', provenance[0])
+            tracked = self.user_space.df_tracker.objects.get(name)
+            return ('dataframe', id(obj), tracked.version if tracked else 0, blocks)
+        raise UncacheableCell('%s has no fingerprint' % name)
+
+    def _get_function_fingerprint(self, name, function, namespace, functions):
+        """
+            A function of the user is fingerprinted by its code, its defaults and the globals its code reads,
+            recursively, so a cell calling it is not replayed once one of them changed
+        """
+        if function.__closure__:
+            raise UncacheableCell('%s has a closure' % name)
+        if name in functions:
+            return ('function', name)
+        functions = functions | {name}
+        global_names = set()
+        codes = [function.__code__]
+        while codes:
+            code = codes.pop()
+            global_names.update(code.co_names)
+            codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+        try:
+            defaults = hashlib.sha1(pickle.dumps(
+                (function.__defaults__, function.__kwdefaults__))).hexdigest()
+        except Exception:
+            raise UncacheableCell('%s has no fingerprint' % name)
+        return ('function', hashlib.sha1(marshal.dumps(function.__code__)).hexdigest(), defaults,
+                tuple(sorted((global_name, self._get_fingerprint(global_name, namespace, functions))
+                             for global_name in global_names)))
+
+    def _pre_run_cell(self, info):
+        self.pending_hit = None
+        self.recording = None
+        namespace = self.shell.user_ns
+        try:
+            code = self.shell.transform_cell(info.raw_cell)
+            inputs, writes = analyze_cell(code)
+        except (UncacheableCell, SyntaxError) as error:
+            ## any name might be changed by the cell #
+            self.provenance.clear()
+            self.status = {'status': MemoizationStatus.SKIP, 'reason': str(error)}
+            return
+        try:
+            fingerprints = {name: self._get_fingerprint(name, namespace) for name in inputs}
+        except UncacheableCell as error:
+            for name in writes:
+                self.provenance.pop(name, None)
+            self.status = {'status': MemoizationStatus.SKIP, 'reason': str(error)}
+            return
+        key = hashlib.sha1(repr((code, sorted(fingerprints.items()))).encode()).hexdigest()
+        if key in self.entries:
+            self.pending_hit = key
+            return
+        outputs = []
+        self.recording = {'key': key, 'writes': writes, 'fingerprints': fingerprints, 'outputs': outputs,
+                          'streams': (sys.stdout, sys.stderr), 'start': time.perf_counter()}
+        sys.stdout = _OutputTee(sys.stdout, 'stdout', outputs)
+        sys.stderr = _OutputTee(sys.stderr, 'stderr', outputs)
+        self.shell.display_pub.register_hook(self._record_display)
+
+    def _record_display(self, msg):
+        if self.recording is not None and msg['msg_type'] == 'display_data':
+            self.recording['outputs'].append(
+                ('display', (msg['content']['data'], msg['content']['metadata'])))
+        return msg
+
+    def _post_run_cell(self, result):
+        self._finish_cell(result)
+        if self.status is not None:
+            self.statuses.append(self.status)
+            self.status = None
+
+    def _finish_cell(self, result):
+        if self.pending_hit is not None:
+            self.pending_hit = None
+            return
+        recording = self.recording
+        if recording is None:
+            return
+        self.recording = None
+        sys.stdout, sys.stderr = recording['streams']
+        self.shell.display_pub.unregister_hook(self._record_display)
+        duration = time.perf_counter() - recording['start']
+        namespace = self.shell.user_ns
+        writes = list(recording['writes'])
+        ## an input changed in place is stored as a binding of the cell #
+        for name, fingerprint in recording['fingerprints'].items():
+            try:
+                changed = self._get_fingerprint(name, namespace) != fingerprint
+            except UncacheableCell:
+                changed = True
+            if changed and name not in writes:
+                writes.append(name)
+        for name in writes:
+            self.provenance.pop(name, None)
+        if not result.success:
+            self.status = {'status': MemoizationStatus.MISS, 'key': recording['key'], 'stored': False,
+                           'reason': 'failed'}
+        elif duration < self.min_duration:
+            self.status = {'status': MemoizationStatus.MISS, 'key': recording['key'], 'stored': False,
+                           'reason': 'faster than %gs' % self.min_duration}
+        else:
+            self._store(recording['key'], writes, recording['outputs'], result.result, namespace)
+
+    def _store(self, key, writes, outputs, result, namespace):
+        bindings = {name: namespace[name] for name in writes if name in namespace}
+        ## the modules can not be pickled, they are imported again #
+        modules = {name: obj.__name__ for name, obj in bindings.items() if isinstance(obj, type(sys))}
+        try:
+            payload = pickle.dumps({'bindings': {name: obj for name, obj in bindings.items() if name not in modules},
+                                    'modules': modules, 'result': result}, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as error:
+            self.status = {'status': MemoizationStatus.MISS, 'key': key, 'stored': False,
+                           'reason': 'can not be pickled: %s' % error}
+            return
+        if len(payload) > max(self.memory_budget, self.disk_budget):
+            self.status = {'status': MemoizationStatus.MISS, 'key': key, 'stored': False,
+                           'reason': 'larger than the cache'}
+            return
+        self.entries[key] = _CacheEntry(payload, outputs)
+        self.memory_size += len(payload)
+        self._set_provenance(key, bindings)
+        self._evict()
+        self.status = {'status': MemoizationStatus.MISS, 'key': key, 'stored': key in self.entries}
+
+    def _set_provenance(self, key, bindings):
+        for name, obj in bindings.items():
+            if self.user_space.df_tracker.matcher.match(type(obj)) is not None:
+                self.provenance[name] = (key, (id(obj), get_dataframe_fingerprint(obj)))
+
+    def _evict(self):
+        for key, entry in list(self.entries.items()):
+            if self.memory_size <= self.memory_budget:
+                break
+            if entry.payload is not None:
+                self.memory_size -= entry.size
+                if entry.size <= self.disk_budget:
+                    entry.path = os.path.join(self.cache_dir, key)
+                    with open(entry.path, 'wb') as file:
+                        file.write(entry.payload)
+                    self.disk_size += entry.size
+                    entry.payload = None
+                else:
+                    del self.entries[key]
+        for key, entry in list(self.entries.items()):
+            if self.disk_size <= self.disk_budget:
+                break
+            if entry.path is not None:
+                os.remove(entry.path)
+                self.disk_size -= entry.size
+                del self.entries[key]
+
+    def replay(self):
+        """ Restore the bindings and the outputs of the cell found in the cache, return its result """
+        key = self.pending_hit
+        entry = self.entries[key]
+        self.entries.move_to_end(key)
+        if entry.payload is not None:
+            payload = entry.payload
+        else:
+            with open(entry.path, 'rb') as file:
+                payload = file.read()
+        stored = pickle.loads(payload)
+        self.shell.user_ns.update(stored['bindings'])
+        self.shell.user_ns.update({name: importlib.import_module(module)
+                                   for name, module in stored['modules'].items()})
+        self._set_provenance(key, stored['bindings'])
+        for kind, output in entry.outputs:
+            if kind == 'display':
+                self.shell.display_pub.publish(data=output[0], metadata=output[1])
+            else:
+                getattr(sys, kind).write(output)
+        self.status = {'status': MemoizationStatus.HIT, 'key': key}
+        return stored['result']
+
+    def get_status(self):
+        """ Return the statuses of the cells of the user since the last call, with the size of the cache """
+        if not self.statuses:
+            return None
+        statuses = self.statuses
+        self.statuses = []
+        return {'cells': statuses,
+                'cache': {'entries': len(self.entries), 'memory': self.memory_size, 'disk': self.disk_size}}
+
+    def close(self):
+        """ Delete the cache, called when the kernel exits """
+        self.entries.clear()
+        self.provenance.clear()
+        self.memory_size = self.disk_size = 0
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,157 @@
+import ast
+import collections
+import os
+import sys
+import threading
+import time
+
+DEFAULT_INTERVAL = 0.005  # unit: second
+DEFAULT_MAX_STACKS = 200
+CELL_MAGIC = 'cnext_profile'
+## mime type of the report sent with the outputs of the profiled execution #
+PROFILE_MIME_TYPE = 'application/cnext+profile'
+## number of lines and stacks in the text summary #
+SUMMARY_SIZE = 5
+
+
+class CellProfiler:
+    """
+        Profile a cell of the user by sampling the stack of the main thread of the kernel every `interval`
+        seconds. The samples give the lines of the cell which take the time and the folded stacks of a flame
+        graph ("frame;frame;frame" -> number of samples), the `max_stacks` largest stacks are kept.
+
+        The next cell is profiled after `arm`, or a cell starting with `%%cnext_profile`. Only the cells of the
+        user run the `pre_run_cell` and `post_run_cell` events, the silent internal executions are never profiled.
+        The magic executes its cell in the namespace of the user without `run_cell`, so the events and the other
+        hooks of the cell e.g. the execution stats only see the cell of the magic once.
+        The code running outside of the interpreter e.g. in numpy is sampled in the line which called it,
+        the time waiting for the GIL is not seen.
+    """
+
+    def __init__(self, shell, interval=DEFAULT_INTERVAL, max_stacks=DEFAULT_MAX_STACKS):
+        self.shell = shell
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.armed = False
+        ## the cell started by the events, the cell of the magic is profiled by the magic #
+        self.profiling_cell = False
+        self.samples = None
+        self.start_time = None
+        self.stop_event = None
+        self.thread = None
+        self.report = None
+        ## the frames above the code of the cell belong to ipython or to the magic #
+        self.cell_callers = (type(shell).run_code.__code__,
+                             CellProfiler._profile_magic.__code__)
+        shell.events.register('pre_run_cell', self._pre_run_cell)
+        shell.events.register('post_run_cell', self._post_run_cell)
+        shell.register_magic_function(self._profile_magic, 'cell', CELL_MAGIC)
+
+    def arm(self):
+        """ Profile the next cell of the user """
+        self.armed = True
+
+    def _pre_run_cell(self, info):
+        if self.armed:
+            self.armed = False
+            self.profiling_cell = True
+            self.start()
+
+    def _post_run_cell(self, result):
+        if self.profiling_cell:
+            self.profiling_cell = False
+            self.stop()
+
+    def _profile_magic(self, line, cell):
+        code = self.shell.transform_cell(cell)
+        module = ast.parse(code)
+        ## the value of the last expression is returned so it is displayed as the result of the cell #
+        last_expression = module.body.pop() if module.body and isinstance(
+            module.body[-1], ast.Expr) else None
+        filename = self.shell.compile.cache(code)
+        namespace = self.shell.user_ns
+        ## the cell may already be profiled because it was armed, then the report covers the whole cell #
+        started = self.start()
+        try:
+            exec(compile(module, filename, 'exec'), namespace)
+            if last_expression is not None:
+                return eval(compile(ast.Expression(last_expression.value), filename, 'eval'), namespace)
+        finally:
+            if started:
+                self.stop()
+
+    def start(self) -> bool:
+        """ Start sampling the current thread, return False if a sampler is already running """
+        if self.thread is not None:
+            return False
+        self.samples = collections.Counter()
+        self.start_time = time.time()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self._sample, args=(threading.get_ident(), self.stop_event), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        duration = time.time() - self.start_time
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        self.report = self._create_report(duration)
+
+    def _sample(self, thread_id, stop_event):
+        while not stop_event.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None and frame.f_code not in self.cell_callers:
+                stack.append((frame.f_code.co_filename,
+                             frame.f_code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            ## the samples taken before or after the code of the cell are dropped #
+            if frame is not None and stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    @staticmethod
+    def _get_frame_name(frame, cell_filename):
+        filename, name, lineno = frame
+        if filename == cell_filename:
+            return 'cell:%d' % lineno
+        return '%s (%s:%d)' % (name, os.path.basename(filename), lineno)
+
+    def _create_report(self, duration):
+        total = sum(self.samples.values())
+        lines = collections.Counter()
+        stacks = collections.Counter()
+        for stack, count in self.samples.items():
+            cell_filename = stack[0][0]
+            lines[stack[0][2]] += count
+            stacks[';'.join(self._get_frame_name(frame, cell_filename).replace(';', ':')
+                            for frame in stack)] += count
+        top_stacks = stacks.most_common(self.max_stacks)
+        return {'duration': duration, 'interval': self.interval, 'samples': total,
+                'lines': [{'line': line, 'samples': count} for line, count in lines.most_common()],
+                'stacks': [{'stack': stack, 'samples': count} for stack, count in top_stacks],
+                'truncated_samples': total - sum(count for _, count in top_stacks)}
+
+    def get_report(self):
+        """ Return the report of the last profiled cell once """
+        report = self.report
+        self.report = None
+        return report
+
+
+def format_profile_summary(report) -> str:
+    """ A text version of the report for the outputs which can not show a flame graph """
+    total = max(1, report['samples'])
+    text = ['Profile: %.3fs, %d samples every %gms' %
+            (report['duration'], report['samples'], report['interval'] * 1000)]
+    for line in report['lines'][:SUMMARY_SIZE]:
+        text.append('  line %d: %.1f%%' %
+                    (line['line'], 100 * line['samples'] / total))
+    if report['stacks']:
+        text.append('Top stacks:')
+        for stack in report['stacks'][:SUMMARY_SIZE]:
+            text.append('  %.1f%% %s' % (100 * stack['samples'] / total,
+                        stack['stack'].split(';')[-1]))
+    return '\n'.join(text)
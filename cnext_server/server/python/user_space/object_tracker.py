@@ -0,0 +1,122 @@
+import sys
+
+
+def get_type_fullname(obj_type) -> str:
+    return obj_type.__module__ + '.' + obj_type.__name__
+
+
+def get_dataframe_fingerprint(obj):
+    """
+        The shape and the blocks of a pandas dataframe. Most in place changes replace a block so this is
+        enough to detect them without looking at the data. None for the other dataframes.
+    """
+    mgr = getattr(obj, '_mgr', None)
+    if mgr is None or not hasattr(mgr, 'blocks'):
+        return None
+    return (obj.shape, tuple(id(block) for block in mgr.blocks))
+
+
+class TypeMatcher:
+    """ Match the exact types of `type_names` e.g. the tracked dataframe types """
+
+    def __init__(self, type_names):
+        self.type_names = set(type_names)
+        ## result of each type seen in the namespace so the full name is computed once per type #
+        self.cache = {}
+
+    def match(self, obj_type):
+        if obj_type not in self.cache:
+            fullname = get_type_fullname(obj_type)
+            self.cache[obj_type] = fullname if fullname in self.type_names else None
+        return self.cache[obj_type]
+
+
+class SubclassMatcher(TypeMatcher):
+    """
+        Match the subclasses of `type_names` e.g. the tracked model types. A base class is only resolved once
+        its module is imported by the user, so a library which is not used is never imported here.
+    """
+
+    def __init__(self, type_names):
+        super().__init__(type_names)
+        self.base_classes = {}
+
+    def _resolve_base_classes(self):
+        for name in self.type_names:
+            if name not in self.base_classes:
+                components = name.split('.')
+                if components[0] not in sys.modules:
+                    continue
+                base_class = sys.modules[components[0]]
+                try:
+                    for component in components[1:]:
+                        base_class = getattr(base_class, component)
+                except AttributeError:
+                    continue
+                self.base_classes[name] = base_class
+                ## a type seen before might be a subclass of this base class #
+                self.cache.clear()
+
+    def match(self, obj_type):
+        if len(self.base_classes) < len(self.type_names):
+            self._resolve_base_classes()
+        if obj_type not in self.cache:
+            self.cache[obj_type] = None
+            for name, base_class in self.base_classes.items():
+                if isinstance(base_class, type) and issubclass(obj_type, base_class):
+                    self.cache[obj_type] = name
+                    break
+        return self.cache[obj_type]
+
+
+class TrackedObject:
+    __slots__ = ['obj_id', 'type_name', 'fingerprint', 'version']
+
+    def __init__(self, obj_id, type_name, fingerprint):
+        self.obj_id = obj_id
+        self.type_name = type_name
+        self.fingerprint = fingerprint
+        self.version = 1
+
+
+class ObjectTracker:
+    """
+        Track the objects of a namespace which are matched by `matcher`, by name. Each object has a version
+        which is incremented when the name is bound to another object, when its fingerprint changes or when
+        it is reported as updated e.g. by `DataFrameStatusHook`.
+    """
+
+    def __init__(self, matcher: TypeMatcher, fingerprint=None):
+        self.matcher = matcher
+        self.fingerprint = fingerprint
+        self.objects = {}
+
+    def scan(self, namespace) -> list:
+        """ Return the (name, object, type name) of the tracked objects in the namespace """
+        match = self.matcher.match
+        return [(name, obj, type_name) for name, obj in list(namespace.items())
+                for type_name in (match(type(obj)),) if type_name is not None]
+
+    def update(self, scanned: list, updated_names=()):
+        """ Update the versions with the result of `scan`, return the added, changed and removed names """
+        added = []
+        changed = []
+        current_names = set()
+        for name, obj, type_name in scanned:
+            current_names.add(name)
+            fingerprint = self.fingerprint(obj) if self.fingerprint else None
+            tracked = self.objects.get(name)
+            if tracked is None:
+                self.objects[name] = TrackedObject(
+                    id(obj), type_name, fingerprint)
+                added.append(name)
+            elif tracked.obj_id != id(obj) or tracked.fingerprint != fingerprint or name in updated_names:
+                tracked.obj_id = id(obj)
+                tracked.type_name = type_name
+                tracked.fingerprint = fingerprint
+                tracked.version += 1
+                changed.append(name)
+        removed = [name for name in self.objects if name not in current_names]
+        for name in removed:
+            del self.objects[name]
+        return added, changed, removed
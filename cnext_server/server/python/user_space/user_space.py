@@ -1,5 +1,3 @@
-from enum import Enum
-import threading
 import traceback
 import simplejson as json
 from user_space.ipython.constants import IpythonResultMessage
@@ -8,17 +6,21 @@ import cnextlib.user_space as _cus
 import cnextlib.dataframe as _cd
 import cnextlib.udf_manager as _udf_manager
 from user_space.ipython.kernel import IPythonKernel
-from user_space.ipython.constants import IPythonInteral, IPythonConstants
+from user_space.ipython.introspection import IntrospectionClient, DEFAULT_MAX_ROWS, DEFAULT_MAX_CELLS, \
+    DEFAULT_TIMEOUT
+from user_space.ipython.analysis_worker import is_supported as is_forked_analysis_supported, \
+    DEFAULT_TIMEOUT as DEFAULT_ANALYSIS_TIMEOUT, DEFAULT_MEMORY_LIMIT as DEFAULT_ANALYSIS_MEMORY_LIMIT
+from user_space.ipython.execution_stats import DEFAULT_TRACEMALLOC_TOP
+from user_space.ipython.memoizer import DEFAULT_MIN_DURATION, DEFAULT_MEMORY_BUDGET, DEFAULT_DISK_BUDGET
+from user_space.ipython.constants import IPythonInteral, IPythonConstants, PostExecSnapshotSection, ExecutionMode
+from libs.json_serializable import JsonSections
+from user_space.object_tracker import ObjectTracker, TypeMatcher, SubclassMatcher, get_dataframe_fingerprint, \
+    get_type_fullname
 
 from libs import logs
 log = logs.get_logger(__name__)
 
 
-class ExecutionMode(Enum):
-    EVAL = 0
-    EXEC = 1
-
-
 class BaseKernel:
     def __init__(self) -> None:
         pass
@@ -43,6 +45,37 @@ class BaseKernel:
             return exec(code, userspace_globals)
 
 
+class ExecutionResult:
+    """ Collect the result of an internal execution: the JSON of its execute_result or its error """
+
+    def __init__(self):
+        self.result = None
+
+    def message_handler_callback(self, ipython_message, stream_type, client_message):
+        try:
+            ipython_message = IpythonResultMessage(**ipython_message)
+            log.info('%s msg: %s %s' % (
+                stream_type, ipython_message.header['msg_type'], ipython_message.content))
+
+            if BaseMessageHandler._is_error_message(ipython_message.header):
+                content = BaseMessageHandler._get_error_message_content(
+                    ipython_message)
+                ## borrow the status constant from ipython :) #
+                self.result = {
+                    "status": IPythonConstants.ShellMessageStatus.ERROR, "content": content}
+            else:
+                if ipython_message.header['msg_type'] == IPythonConstants.MessageType.EXECUTE_RESULT:
+                    self.result = {"status": IPythonConstants.ShellMessageStatus.OK,
+                                   "content": BaseMessageHandler.get_json_result(ipython_message.content['data'])}
+        except:
+            # this is internal exception, we won't send it to the client
+            trace = traceback.format_exc()
+            ## borrow the status constant from ipython :) #
+            self.result = {
+                "status": IPythonConstants.ShellMessageStatus.ERROR, "content": trace}
+            log.info("Exception %s" % (trace))
+
+
 class IPythonUserSpace(_cus.UserSpace):
     ''' 
         Define the space where user code will be executed. 
@@ -52,23 +85,86 @@ class IPythonUserSpace(_cus.UserSpace):
 
     def __init__(self, tracking_df_types: tuple = (), tracking_model_types: tuple = ()):
         super().__init__(tracking_df_types, tracking_model_types)
+        ## the kernel endpoints are served by one worker, their requests can still be in flight together e.g. the #
+        ## fire-and-forget executions, their messages are routed to their own callback by the kernel #
         self.executor: IPythonKernel = IPythonKernel()
-        self.execute_lock = threading.Lock()
-        self.result = None
-        self.client_message_handler_callback = None
-        self.shell_cond = False
-        self.iobuf_cond = False
         self.kernel_restarting = False
         self.kernel_interrupting = False
-
-    def init_executor(self):
-        code = """
-import cnextlib.dataframe as _cd
-import cnextlib.udf_manager as {_udf_manager}
-import pandas as _pd
-from dataframe_manager import dataframe_manager as _dm
-from cassist import cassist as _ca
-from user_space.user_space import BaseKernelUserSpace
+        self.kernel_pool = None
+        self.kernel_name = None
+        self.working_dir = None
+        ## duration of the kernel launch and bootstrap steps #
+        self.startup_report = None
+        ## read-only queries served by the kernel while user code is running, see `IntrospectionServer` #
+        self.introspection_config = {}
+        self.introspection = None
+        ## heavy dataframe statistics computed in a fork of the kernel, see `ForkedAnalysisWorker` #
+        self.forked_analysis_config = {}
+        ## resources used by each execution of the user, see `ExecutionStatsRecorder` #
+        self.execution_stats_config = {}
+        ## replay of the cells already executed with the same inputs, see `CellMemoizer` #
+        self.memoization_config = {}
+
+    def set_kernel_pool(self, kernel_pool):
+        self.kernel_pool = kernel_pool
+
+    def set_introspection_config(self, config):
+        """ Set the `introspection` section of server.yaml, must be called before the kernel is started """
+        self.introspection_config = config or {}
+
+    def set_forked_analysis_config(self, config):
+        """ Set the `forked_analysis` section of server.yaml, must be called before the kernel is started """
+        self.forked_analysis_config = config or {}
+
+    def set_execution_stats_config(self, config):
+        """ Set the `execution_stats` section of server.yaml, must be called before the kernel is started """
+        self.execution_stats_config = config or {}
+
+    def set_memoization_config(self, config):
+        """ Set the `memoization` section of server.yaml, must be called before the kernel is started """
+        self.memoization_config = config or {}
+
+    def is_forked_analysis_enabled(self) -> bool:
+        ## the results of the forked jobs are collected through the introspection server #
+        return self.forked_analysis_config.get('enabled', False) and self.introspection_config.get('enabled', False) \
+            and is_forked_analysis_supported()
+
+    def get_analysis_timeout(self):
+        return self.forked_analysis_config.get('timeout', DEFAULT_ANALYSIS_TIMEOUT)
+
+    def _connect_introspection(self):
+        if self.introspection is not None:
+            self.introspection.close()
+            self.introspection = None
+        if not self.introspection_config.get('enabled', False):
+            return
+        result = self.get_introspection_address()
+        if result is not None and result['status'] == IPythonConstants.ShellMessageStatus.OK:
+            self.introspection = IntrospectionClient(
+                result['content'], self.introspection_config.get('timeout', DEFAULT_TIMEOUT))
+            log.info('Introspection server at %s' % result['content'])
+
+    def is_busy(self) -> bool:
+        return self.executor.get_pending_requests() > 0
+
+    def _configure_kernel_pool(self):
+        if self.kernel_pool is not None and self.kernel_name is not None:
+            self.kernel_pool.configure(
+                self.kernel_name, self._get_init_code(), self.working_dir)
+
+    def _get_init_code(self):
+        ## the dataframe manager and cassist import plotly, matplotlib... so they are only created on their first use #
+        return """
+from user_space.ipython.bootstrap import StartupTimer as _StartupTimer, LazyObject as _LazyObject
+{_startup_timer} = _StartupTimer()
+with {_startup_timer}.step('import cnextlib.dataframe'):
+    import cnextlib.dataframe as _cd
+with {_startup_timer}.step('import cnextlib.udf_manager'):
+    import cnextlib.udf_manager as {_udf_manager}
+with {_startup_timer}.step('import pandas'):
+    import pandas as _pd
+with {_startup_timer}.step('import user_space'):
+    from user_space.user_space import BaseKernelUserSpace
 
 ## need to create a new _UserSpace class here so that the global() will be represent this module where all the execution are #
 class _UserSpace(BaseKernelUserSpace):
@@ -76,145 +172,131 @@ class _UserSpace(BaseKernelUserSpace):
         ## this needs to be redefined here #
         return globals()
 
-{_user_space} = _UserSpace(tracking_df_types={_tracking_df_types}, tracking_model_types={_tracking_model_types})  
-{_df_manager} = _dm.MessageHandler(None, {_user_space})
-{_cassist} = _ca.MessageHandler(None, {_user_space})
+def _create_df_manager():
+    from dataframe_manager import dataframe_manager as _dm
+    return _dm.MessageHandler(None, {_user_space})
+
+def _create_cassist():
+    from cassist import cassist as _ca
+    return _ca.MessageHandler(None, {_user_space})
+
+with {_startup_timer}.step('create {_user_space}'):
+    {_user_space} = _UserSpace(tracking_df_types={_tracking_df_types}, tracking_model_types={_tracking_model_types})
+{_df_manager} = _LazyObject(_create_df_manager, '{_df_manager}', {_startup_timer})
+{_cassist} = _LazyObject(_create_cassist, '{_cassist}', {_startup_timer})
+
+with {_startup_timer}.step('create {_profiler}'):
+    from user_space.ipython.profiler import CellProfiler as _CellProfiler
+    {_profiler} = _CellProfiler(get_ipython())
+    {_user_space}.set_profiler({_profiler})
 """.format(_user_space=IPythonInteral.USER_SPACE.value,
            _df_manager=IPythonInteral.DF_MANAGER.value,
            _cassist=IPythonInteral.CASSIST.value,
+           _startup_timer=IPythonInteral.STARTUP_TIMER.value,
+           _profiler=IPythonInteral.PROFILER.value,
            _tracking_df_types=self.tracking_df_types,
            _tracking_model_types=self.tracking_model_types,
-           _udf_manager=IPythonInteral.UDF_MODULE.value)
-        self.executor.execute(code)
+           _udf_manager=IPythonInteral.UDF_MODULE.value) + self._get_introspection_init_code() + \
+            self._get_execution_stats_init_code() + self._get_memoization_init_code()
+
+    def _get_introspection_init_code(self):
+        if not self.introspection_config.get('enabled', False):
+            return ""
+        analysis_worker_code = "None"
+        if self.is_forked_analysis_enabled():
+            analysis_worker_code = "_ForkedAnalysisWorker(timeout={timeout}, memory_limit={memory_limit})".format(
+                timeout=self.forked_analysis_config.get('timeout', DEFAULT_ANALYSIS_TIMEOUT),
+                memory_limit=self.forked_analysis_config.get('memory_limit_mb', DEFAULT_ANALYSIS_MEMORY_LIMIT))
+        return """
+with {_startup_timer}.step('start {_introspection}'):
+    from user_space.ipython.introspection import IntrospectionServer as _IntrospectionServer
+    from user_space.ipython.analysis_worker import ForkedAnalysisWorker as _ForkedAnalysisWorker
+    {_analysis_worker} = {analysis_worker_code}
+    {_introspection} = _IntrospectionServer({_user_space}, {_df_manager}, max_rows={max_rows}, max_cells={max_cells},
+                                            analysis_worker={_analysis_worker})
+    {_introspection}.start()
+""".format(_user_space=IPythonInteral.USER_SPACE.value,
+           _df_manager=IPythonInteral.DF_MANAGER.value,
+           _startup_timer=IPythonInteral.STARTUP_TIMER.value,
+           _introspection=IPythonInteral.INTROSPECTION.value,
+           _analysis_worker=IPythonInteral.ANALYSIS_WORKER.value,
+           analysis_worker_code=analysis_worker_code,
+           max_rows=int(self.introspection_config.get('max_rows', DEFAULT_MAX_ROWS)),
+           max_cells=int(self.introspection_config.get('max_cells', DEFAULT_MAX_CELLS)))
+
+    def _get_execution_stats_init_code(self):
+        if not self.execution_stats_config.get('enabled', False):
+            return ""
+        return """
+with {_startup_timer}.step('create {_execution_stats}'):
+    from user_space.ipython.execution_stats import ExecutionStatsRecorder as _ExecutionStatsRecorder
+    {_execution_stats} = _ExecutionStatsRecorder(get_ipython(), tracemalloc_top={tracemalloc_top})
+    {_user_space}.set_execution_stats({_execution_stats})
+""".format(_user_space=IPythonInteral.USER_SPACE.value,
+           _startup_timer=IPythonInteral.STARTUP_TIMER.value,
+           _execution_stats=IPythonInteral.EXECUTION_STATS.value,
+           tracemalloc_top=int(self.execution_stats_config.get('tracemalloc_top', DEFAULT_TRACEMALLOC_TOP)))
+
+    def _get_memoization_init_code(self):
+        if not self.memoization_config.get('enabled', False):
+            return ""
+        return """
+with {_startup_timer}.step('create {_memoizer}'):
+    from user_space.ipython.memoizer import CellMemoizer as _CellMemoizer
+    {_memoizer} = _CellMemoizer(get_ipython(), {_user_space}, '{_memoizer}', min_duration={min_duration},
+                                memory_budget={memory_budget}, disk_budget={disk_budget}, cache_dir={cache_dir})
+    {_user_space}.set_memoizer({_memoizer})
+""".format(_user_space=IPythonInteral.USER_SPACE.value,
+           _startup_timer=IPythonInteral.STARTUP_TIMER.value,
+           _memoizer=IPythonInteral.MEMOIZER.value,
+           min_duration=float(self.memoization_config.get('min_duration', DEFAULT_MIN_DURATION)),
+           memory_budget=int(self.memoization_config.get('memory_budget_mb', DEFAULT_MEMORY_BUDGET)),
+           disk_budget=int(self.memoization_config.get('disk_budget_mb', DEFAULT_DISK_BUDGET)),
+           cache_dir=repr(self.memoization_config.get('cache_dir')))
+
+    def init_executor(self):
+        self.executor.execute(self._get_init_code(), ExecutionMode.EXEC)
 
     def globals(self):
         return globals()
 
-    def _set_execution_complete_condition(self, condition: bool):
-        self.shell_cond = condition
-        self.iobuf_cond = condition
-
-    def _set_execution_complete_condition_from_message(self, stream_type, message: IpythonResultMessage):
-        if stream_type == IPythonConstants.StreamType.SHELL:
-            self.shell_cond = message.header['msg_type'] == IPythonConstants.MessageType.EXECUTE_REPLY and 'status' in message.content
-        if stream_type == IPythonConstants.StreamType.IOBUF:
-            self.iobuf_cond = message.header['msg_type'] == IPythonConstants.MessageType.STATUS and message.content['execution_state'] == 'idle'
-
-    def _is_execution_complete(self) -> bool:
-        ## Look at the shell stream and check the status #
-        return self.shell_cond and self.iobuf_cond
-
-    def message_handler_callback(self, ipython_message, stream_type, client_message):
-        try:
-            ipython_message = IpythonResultMessage(**ipython_message)
-            log.info('%s msg: %s %s' % (
-                stream_type, ipython_message.header['msg_type'], ipython_message.content))
-
-            if BaseMessageHandler._is_error_message(ipython_message.header):
-                content = BaseMessageHandler._get_error_message_content(
-                    ipython_message)
-                ## borrow the status constant from ipython :) #
-                self.result = {
-                    "status": IPythonConstants.ShellMessageStatus.ERROR, "content": content}
-                # if self.execute_lock.locked():
-                #     self.execute_lock.release()
-                #     log.info(
-                #         'User_space execution lock released due to error in execution')
-            else:
-                if ipython_message.header['msg_type'] == IPythonConstants.MessageType.EXECUTE_RESULT:
-                    self.result = {"status": IPythonConstants.ShellMessageStatus.OK, "content": json.loads(
-                        ipython_message.content['data']['text/plain'])}
-
-            self._set_execution_complete_condition_from_message(
-                stream_type, ipython_message)
-
-            if self.execute_lock.locked() and self._is_execution_complete():
-                self.execute_lock.release()
-                log.info('User_space execution lock released')
-            # else:
-            #     # TODO: log everything else
-            #     log.info('Other messages: %s' % ipython_message)
-        except:
-            # this is internal exception, we won't send it to the client
-            trace = traceback.format_exc()
-            ## borrow the status constant from ipython :) #
-            self.result = {
-                "status": IPythonConstants.ShellMessageStatus.ERROR, "content": trace}
-            if self.execute_lock.locked():
-                self.execute_lock.release()
-                log.info(
-                    'User_space execution lock released due to error in exception')
-            log.info("Exception %s" % (trace))
-
-    def passthrough_message_handler_callback(self, ipython_message, stream_type, client_message):
-        try:
-            if self.client_message_handler_callback:
-                self.client_message_handler_callback(
-                    ipython_message, stream_type, client_message)
-
-            ipython_message = IpythonResultMessage(**ipython_message)
-            self._set_execution_complete_condition_from_message(
-                stream_type, ipython_message)
-            if self.execute_lock.locked() and self._is_execution_complete():
-                self.execute_lock.release()
-                log.info('User_space execution lock released')
-        except:
-            # this is internal exception, we won't send it to the client
-            trace = traceback.format_exc()
-            log.info("Exception %s" % (trace))
-            if self.execute_lock.locked():
-                self.execute_lock.release()
-                log.info('Kernel execution lock released')
-
     def _result_waiting_execution(func):
         '''
-        Wrapper to block the execution until the execution complete
+        Wrapper to execute the code returned by `func` and block until the execution completes.
+        Return the result of the execution, None if it is aborted
         '''
         def _result_waiting_execution_wrapper(*args, **kwargs):
             ## args[0] is self #
-            args[0].result = None
-            log.info('User_space execution lock acquiring')
-            args[0].execute_lock.acquire()
-            log.info('User_space execution lock acquired before exec func')
-            if args[0].kernel_restarting or args[0].kernel_interrupting:
-                args[0].execute_lock.release()
-                log.info('Kernel is being restarted or interupted . Abort!')
-                return None            
-            args[0]._set_execution_complete_condition(False)
-            func(*args, **kwargs)
-            ## wait for the lock being released in the message_handler_callback #
-            args[0].execute_lock.acquire()
-            log.info('User_space execution lock acquired after exec func')
             if args[0].kernel_restarting or args[0].kernel_interrupting:
                 log.info('Kernel is being restarted or interupted . Abort!')
-            args[0].execute_lock.release()
-            log.info('User_space execution lock released')
-            log.info("Results: %s" % args[0].result)
-            return args[0].result
+                return None
+            execution_result = ExecutionResult()
+            request = args[0].executor.execute(
+                func(*args, **kwargs), ExecutionMode.EVAL, execution_result.message_handler_callback)
+            if request is None:
+                return None
+            request.wait()
+            if request.aborted:
+                log.info('Kernel request %s aborted' % request.msg_id)
+            log.info("Results: %s" % execution_result.result)
+            return execution_result.result
         return _result_waiting_execution_wrapper
 
     def _locked_execution(func):
         '''
-        Wrapper to block the execution until the execution complete
+        Wrapper to block the execution until the execution complete, return the completed request
         '''
         def _locked_execution_wrapper(*args, **kwargs):
             ## args[0] is self #
-            log.info('User_space execution lock acquiring')
-            args[0].execute_lock.acquire()
-            log.info('User_space execution lock acquired before exec func')
             if args[0].kernel_restarting or args[0].kernel_interrupting:
-                args[0].execute_lock.release()
                 log.info('Kernel is being restarted or interupted . Abort!')
                 return None
-            args[0]._set_execution_complete_condition(False)
-            func(*args, **kwargs)
-            ## wait for the lock being released in the message_handler_callback #
-            args[0].execute_lock.acquire()
-            log.info('User_space execution lock acquired after exec func')
-            if args[0].kernel_restarting or args[0].kernel_interrupting:
-                log.info('Kernel is being restarted or interupted . Abort!')
-            args[0].execute_lock.release()
-            log.info('User_space execution lock released')
+            request = func(*args, **kwargs)
+            if request is not None:
+                request.wait()
+                if request.aborted:
+                    log.info('Kernel request %s aborted' % request.msg_id)
+            return request
         return _locked_execution_wrapper
 
     @_result_waiting_execution
@@ -230,7 +312,7 @@ class _UserSpace(BaseKernelUserSpace):
         code = "{_user_space}.get_active_dfs_status()".format(
             _user_space=IPythonInteral.USER_SPACE.value)
         log.info('Code to execute %s' % code)
-        self.executor.execute(code, None, self.message_handler_callback)
+        return code
 
     @_result_waiting_execution
     def get_active_models_info(self):
@@ -238,7 +320,7 @@ class _UserSpace(BaseKernelUserSpace):
         code = "{_user_space}.get_active_models_info()".format(
             _user_space=IPythonInteral.USER_SPACE.value)
         log.info('Code to execute %s' % code)
-        self.executor.execute(code, None, self.message_handler_callback)
+        return code
 
     @_result_waiting_execution
     def get_registered_udfs(self):
@@ -246,18 +328,90 @@ class _UserSpace(BaseKernelUserSpace):
         code = "{_user_space}.get_registered_udfs()".format(
             _user_space=IPythonInteral.USER_SPACE.value)
         log.info('Code to execute %s' % code)
-        self.executor.execute(code, None, self.message_handler_callback)
+        return code
+
+    @_result_waiting_execution
+    def get_startup_report(self):
+        """ Return the duration of each step of the bootstrap and of the lazy loads inside the kernel """
+        code = "{_startup_timer}.get_report()".format(
+            _startup_timer=IPythonInteral.STARTUP_TIMER.value)
+        return code
+
+    @_result_waiting_execution
+    def get_introspection_address(self):
+        code = "{_introspection}.get_address()".format(
+            _introspection=IPythonInteral.INTROSPECTION.value)
+        return code
+
+    @_result_waiting_execution
+    def start_metadata_job(self, df_id, df_type):
+        """ Start the computation of the metadata of a dataframe in a fork of the kernel, return the job id """
+        code = "{_analysis_worker}.start({_df_manager}._get_metadata, '{df_id}', '{df_type}')".format(
+            _analysis_worker=IPythonInteral.ANALYSIS_WORKER.value, _df_manager=IPythonInteral.DF_MANAGER.value,
+            df_id=df_id, df_type=df_type)
+        log.info('Code to execute %s' % code)
+        return code
+
+    def _log_startup_report(self):
+        result = self.get_startup_report()
+        if result is not None and result['status'] == IPythonConstants.ShellMessageStatus.OK:
+            self.startup_report = {'kernel': self.executor.get_startup_timings(),
+                                   'bootstrap': result['content']}
+            log.info('Kernel startup report: %s' % self.startup_report)
+
+    @_result_waiting_execution
+    def get_post_exec_snapshot(self):
+        """ 
+            This function will be blocked until the execution completes and the result will be returned directly from here.
+            Return the sections of `PostExecSnapshotSection` which changed since the last snapshot
+        """
+        code = "{_user_space}.get_post_exec_snapshot()".format(
+            _user_space=IPythonInteral.USER_SPACE.value)
+        log.info('Code to execute %s' % code)
+        return code
 
     def reset_active_dfs_status(self):
         code = "{_user_space}.reset_active_dfs_status()".format(
             _user_space=IPythonInteral.USER_SPACE.value)
-        self.executor.execute(code)
+        self.executor.execute(code, ExecutionMode.EXEC)
+
+    def arm_profiler(self):
+        """ Profile the next execution of the user, the report is sent with the post execution snapshot """
+        code = "{_profiler}.arm()".format(
+            _profiler=IPythonInteral.PROFILER.value)
+        self.executor.execute(code, ExecutionMode.EXEC)
 
     @_locked_execution
     def execute(self, code, exec_mode: ExecutionMode = None, message_handler_callback=None, client_message=None):
+        ## the dataframe updates are collected for the code of the user, not for the internal executions #
+        if exec_mode is None:
+            self.reset_active_dfs_status()
+        return self.executor.execute(code, exec_mode, message_handler_callback, client_message)
+
+    def execute_batch(self, client_messages: list, message_handler_callback=None) -> list:
+        """
+            Execute the code of each message in order and stop at the first one which does not succeed.
+            A group is only sent once the one before it completed, so the requests queued on the kernel by
+            other callers are never aborted. Return the requests, None for the groups which were not executed,
+            or None if the kernel is being restarted
+        """
+        if self.kernel_restarting or self.kernel_interrupting:
+            log.info('Kernel is being restarted or interupted . Abort!')
+            return None
         self.reset_active_dfs_status()
-        self.client_message_handler_callback = message_handler_callback
-        return self.executor.execute(code, exec_mode, self.passthrough_message_handler_callback, client_message)
+        requests = [None] * len(client_messages)
+        for index, message in enumerate(client_messages):
+            if self.kernel_restarting or self.kernel_interrupting:
+                break
+            request = self.executor.execute(
+                message.content, None, message_handler_callback, message)
+            requests[index] = request
+            if request is None:
+                break
+            request.wait()
+            if request.status != IPythonConstants.ShellMessageStatus.OK:
+                break
+        return requests
 
     def send_stdin(self, input_text):
         return self.executor.send_stdin(input_text)
@@ -266,34 +420,40 @@ class _UserSpace(BaseKernelUserSpace):
         log.info('Starting jupyter kernel: %s' % kernel_name)
         self.executor.start_kernel(kernel_name)
         self.init_executor()
-        if self.execute_lock.locked():
-            self.execute_lock.release()
-            log.info('User_space execution lock released')
+        self.kernel_name = kernel_name
+        self._configure_kernel_pool()
+        self._log_startup_report()
+        self._connect_introspection()
 
     def shutdown_executor(self) -> bool:
         self.kernel_restarting = True
+        if self.kernel_pool is not None:
+            self.kernel_pool.shutdown()
+        if self.introspection is not None:
+            self.introspection.close()
+            self.introspection = None
         result = self.executor.shutdown_kernel()
-        if self.execute_lock.locked():
-            self.execute_lock.release()
-            log.info('User_space execution lock released')
         self.kernel_restarting = False
         return result
 
     def restart_executor(self):
         self.kernel_restarting = True
-        if self.execute_lock.locked():
-            self.execute_lock.release()
-            log.info('User_space execution lock released for restarting')
-        result = self.executor.restart_kernel()
-        self.init_executor()        
+        standby_kernel = self.kernel_pool.acquire() if self.kernel_pool is not None else None
+        if standby_kernel is not None:
+            ## the standby kernel is already bootstrapped #
+            result = self.executor.swap_kernel(
+                standby_kernel.km, standby_kernel.kc)
+        else:
+            result = self.executor.restart_kernel()
+            self.init_executor()
         self.kernel_restarting = False
+        self._log_startup_report()
+        self._connect_introspection()
         return result
 
     def interrupt_executor(self):
+        ## the interrupted execution completes with an error, the requests queued behind it still run #
         self.kernel_interrupting = True
-        if self.execute_lock.locked():
-            self.execute_lock.release()
-            log.info('User_space execution lock released for interrupting')
         result = self.executor.interrupt_kernel()
         self.kernel_interrupting = False
         return result
@@ -303,6 +463,8 @@ class _UserSpace(BaseKernelUserSpace):
 
     def set_executor_working_dir(self, path):
         code = "import os; os.chdir('{}')".format(path)
+        self.working_dir = path
+        self._configure_kernel_pool()
         return self.executor.execute(code)
 
 
@@ -319,11 +481,112 @@ class BaseKernelUserSpace(_cus.UserSpace):
         _cd.DataFrameTracker.set_user_space(self)
         _udf_manager.set_user_space(self)
         super().__init__(tracking_df_types, tracking_model_types)
+        ## the dataframes and models are tracked by name with a version which is incremented on each change #
+        self.df_tracker = ObjectTracker(TypeMatcher(
+            tracking_df_types), get_dataframe_fingerprint)
+        self.model_tracker = ObjectTracker(
+            SubclassMatcher(tracking_model_types))
+        self.last_dfs_scan = []
+        ## the dataframes sent with `is_updated` in the last snapshot #
+        self.last_updated_dfs = set()
+        ## the JSON of each section sent in the last post execution snapshot #
+        self.last_snapshot = {}
+        ## `CellProfiler` of the kernel, its report is sent once with the snapshot after the profiled execution #
+        self.profiler = None
+        ## `ExecutionStatsRecorder` of the kernel, the stats of each execution are sent with the snapshot #
+        self.execution_stats = None
+        ## `CellMemoizer` of the kernel, the cache status of each execution is sent with the snapshot #
+        self.memoizer = None
 
     @classmethod
     def globals(cls):
         return globals()
 
+    def set_profiler(self, profiler):
+        self.profiler = profiler
+
+    def set_execution_stats(self, execution_stats):
+        self.execution_stats = execution_stats
+
+    def set_memoizer(self, memoizer):
+        self.memoizer = memoizer
+
+    def get_active_dfs(self):
+        """ 
+            Same as `UserSpace.get_active_dfs` but the type of each object is only looked up once.
+            This is called by the dataframe hooks on every dataframe operation.
+        """
+        self.last_dfs_scan = self.df_tracker.scan(self.globals())
+        return [(name, id(obj), type_name) for name, obj, type_name in self.last_dfs_scan]
+
+    def get_active_models_info(self, scanned: list = None) -> _cus.ModelInfoDict:
+        """ 
+            Same as `UserSpace.get_active_models_info` without importing the model libraries,
+            a model can only exist once its library is imported
+        """
+        if scanned is None:
+            scanned = self.model_tracker.scan(self.globals())
+        base_classes = self.model_tracker.matcher.base_classes
+        return _cus.ModelInfoDict({name: {'name': name, 'id': id(obj), 'obj_class': get_type_fullname(type(obj)),
+                                          'base_class': get_type_fullname(base_classes[type_name])}
+                                   for name, obj, type_name in scanned})
+
+    def _get_dfs_snapshot(self):
+        dfs_status = self.get_active_dfs_status()
+        updated_names = {name for name, status in dfs_status.items()
+                         if status.is_updated}
+        added, changed, removed = self.df_tracker.update(
+            self.last_dfs_scan, updated_names)
+        ## the webapp clears the review of a dataframe only when its status comes with `is_updated` False, #
+        # so the status of the dataframes updated by the last snapshot is sent again #
+        cleared_names = self.last_updated_dfs - updated_names
+        if not (added or changed or removed or cleared_names):
+            return None
+        self.last_updated_dfs = updated_names
+        ## only the statuses which changed are sent, the webapp deletes the removed dataframes #
+        sent_names = set(added) | set(changed) | updated_names | cleared_names
+        return {'content': {name: status for name, status in dfs_status.items() if name in sent_names},
+                'metadata': {'removed': removed}}
+
+    def _get_models_snapshot(self):
+        scanned = self.model_tracker.scan(self.globals())
+        added, changed, removed = self.model_tracker.update(scanned)
+        if not (added or changed or removed):
+            return None
+        ## the webapp replaces the whole model list so all the models are sent #
+        return {'content': self.get_active_models_info(scanned)}
+
+    def get_post_exec_snapshot(self):
+        """ 
+            Collect the status of the dataframes, the registered udfs and the models after an execution
+            in one call. The sections which have not changed since the last snapshot are omitted.
+            The profile, the resource usage and the cache status of the execution are only there when they
+            were recorded.
+        """
+        sections = {PostExecSnapshotSection.DFS_STATUS.value: self._get_dfs_snapshot(),
+                    PostExecSnapshotSection.MODELS.value: self._get_models_snapshot()}
+        changed_sections = {name: json.dumps(section, default=lambda o: o.__dict__, ignore_nan=True)
+                            for name, section in sections.items() if section is not None}
+        ## the udfs are not in the namespace, their registry is compared with the last one sent #
+        udfs_json = json.dumps(self.get_registered_udfs(),
+                               default=lambda o: o.__dict__, ignore_nan=True)
+        if self.last_snapshot.get(PostExecSnapshotSection.UDFS.value) != udfs_json:
+            self.last_snapshot[PostExecSnapshotSection.UDFS.value] = udfs_json
+            changed_sections[PostExecSnapshotSection.UDFS.value] = '{"content": %s}' % udfs_json
+        profile = self.profiler.get_report() if self.profiler is not None else None
+        if profile is not None:
+            changed_sections[PostExecSnapshotSection.PROFILE.value] = json.dumps(
+                {'content': profile}, ignore_nan=True)
+        stats = self.execution_stats.get_stats() if self.execution_stats is not None else None
+        if stats is not None:
+            changed_sections[PostExecSnapshotSection.EXECUTION_STATS.value] = json.dumps(
+                {'content': stats}, ignore_nan=True)
+        memoization = self.memoizer.get_status() if self.memoizer is not None else None
+        if memoization is not None:
+            changed_sections[PostExecSnapshotSection.MEMOIZATION.value] = json.dumps(
+                {'content': memoization}, ignore_nan=True)
+        return JsonSections(changed_sections)
+
     def execute(self, code, exec_mode: ExecutionMode = None):
         # this function is not called when using ipython
         # self.reset_active_dfs_status()
@@ -5,6 +5,7 @@ const fs = require("fs");
 const YAML = require("yaml");
 const zmq = require("zeromq");
 const path = require("path");
+const zlib = require("zlib");
 const { nanoid } = require("nanoid");
 const { eventLog } = require("./eventLog");
 // const { instrument } = require("@socket.io/admin-ui");
@@ -81,6 +82,51 @@ const create_socket = (host, port) => {
     return newSocket;
 };
 
+/**
+ * Messages from python are either a single json frame or a header frame followed by one frame per payload.
+ * The header has the form {protocol, buffers: [{path, encoding, compression}], message}. The payloads are
+ * decompressed and put back into the message at `path` so the message sent to the browser is the same as
+ * the single frame one.
+ */
+const FRAMED_PROTOCOL = "cnext.framed.v1";
+
+const decodeExecutorMessage = (frames) => {
+    if (frames.length === 1) {
+        return JSON.parse(frames[0].toString());
+    }
+    const header = JSON.parse(frames[0].toString());
+    if (header.protocol !== FRAMED_PROTOCOL) {
+        throw new Error(`Unknown message protocol: ${header.protocol}`);
+    }
+    const message = header.message;
+    header.buffers.forEach((buffer, index) => {
+        let data = frames[index + 1];
+        if (buffer.compression === "zlib") {
+            data = zlib.inflateSync(data);
+        } else if (buffer.compression === "zstd") {
+            // zstd is only available from node 22.15
+            if (typeof zlib.zstdDecompressSync !== "function") {
+                throw new Error(`zstd compression requires node >= 22.15, running ${process.version}`);
+            }
+            data = zlib.zstdDecompressSync(data);
+        }
+        let value;
+        if (buffer.encoding === "base64") {
+            value = data.toString("base64");
+        } else if (buffer.encoding === "json") {
+            value = JSON.parse(data.toString("utf-8"));
+        } else {
+            value = data.toString("utf-8");
+        }
+        let parent = message;
+        for (const key of buffer.path.slice(0, -1)) {
+            parent = parent[key];
+        }
+        parent[buffer.path[buffer.path.length - 1]] = value;
+    });
+    return message;
+};
+
 class PythonProcess {
     static io;
 
@@ -271,8 +317,8 @@ try {
     async function zmq_receiver() {       
         await command_output_zmq.bind(`${p2n_host}:${p2n_port}`);         
         console.log(`Waiting for python executor message on ${p2n_port}`);
-        for await (const [message] of command_output_zmq) {
-            const jsonMessage = JSON.parse(message.toString());
+        for await (const frames of command_output_zmq) {
+            const jsonMessage = decodeExecutorMessage(frames);
             if (jsonMessage.command_name !== "get_status") {
                 console.log(
                     `command_output_zmq: forward output to ${jsonMessage["webapp_endpoint"]}`